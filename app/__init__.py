@@ -17,15 +17,43 @@ def create_app():
     app.config.from_object('config.Config')
     app.config['SECRET_KEY'] = os.environ['SECRET_KEY']
 
-    db_path = os.path.join(app.instance_path, 'site.db')
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    from app.profiling import init_profiling
+    init_profiling(app)
+    from app.log import init_logging
+    init_logging(app)
+    from app.caching import init_caching
+    init_caching(app)
+
+    from app.database import database_uri, engine_options, init_engine
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri(
+        app.config.get('SQLALCHEMY_DATABASE_URI'), app.instance_path)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
 
     db.init_app(app)
+    init_engine(app, db)
+
+    from app.instrumentation import init_instrumentation
+    init_instrumentation(app, db)
+    from app.metrics import init_metrics
+    init_metrics(app)
+    from app.jobs import init_jobs
+    init_jobs(app)
     login_manager.init_app(app)
-    migrate.init_app(app, db)
-    limiter.init_app(app) 
+    from app.search import include_name
+    migrate.init_app(app, db, render_as_batch=True, include_name=include_name)
+    from app.ratelimits import storage_uri
+    app.config['RATELIMIT_STORAGE_URI'] = storage_uri(
+        app.config['RATELIMIT_STORAGE_URI'], app.instance_path)
+    limiter.init_app(app)
 
     from app.routes import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
+    from app.api import api as api_blueprint
+    app.register_blueprint(api_blueprint)
+
+    from app.commands import assets_cli, jobs_cli
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(jobs_cli)
+
     return app
\ No newline at end of file
@@ -0,0 +1,651 @@
+from datetime import datetime
+from flask import Blueprint, jsonify, request, abort, url_for, send_from_directory, current_app
+from flask_login import login_required, current_user
+from werkzeug.exceptions import HTTPException
+from flask_limiter.util import get_remote_address
+from app import db, limiter, metrics
+from app.models import User, Asset, ArchivedAsset, Customer, Manufacturer, AssetChange, Job
+from app.forms import AssetForm
+from app.lookups import get_choices
+from app.pagination import keyset_paginate, get_per_page
+from app.search import search_assets
+from app.ratelimits import configured_limit
+from app.users import is_admin
+from app.summary import get_summary
+from app import bulk
+from app import deletion
+from app import jobs
+from app import transfer
+from app import archive
+import logging
+
+# The following code defines version 1 of the JSON API, which offers list, get, create, update and delete operations on assets, customers and manufacturers for integrations. Every endpoint requires a logged in user and deleting records is reserved for admin users, as in the HTML routes. List endpoints use the same keyset cursors as the asset list page and accept a 'fields' parameter so that a client only receives (and the database only reads) the columns it asks for. Records are read as plain column tuples rather than ORM objects
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.errors = errors
+
+
+@api.errorhandler(ApiError)
+def handle_api_error(error):
+    body = {'error': error.message}
+    if error.errors:
+        body['errors'] = error.errors
+    return jsonify(body), error.status
+
+
+@api.errorhandler(HTTPException)
+def handle_http_exception(error):
+    if error.code == 429:
+        metrics.inc('rate_limited_requests_total', endpoint=request.endpoint)
+    return jsonify({'error': error.description}), error.code
+
+# Every API endpoint shares the API_RATE_LIMIT limit, counted per user for logged in clients so that several integrations behind one address do not use up each other's allowance
+
+
+def _rate_limit_key():
+    if current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    return get_remote_address()
+
+
+limiter.limit(configured_limit('API_RATE_LIMIT'), key_func=_rate_limit_key)(api)
+
+# The field maps below list the fields each resource can return and the column each one is read from. Asset fields holding the customer, manufacturer or author name come from joined tables, and the joins are only added to a query when one of those fields is requested. Archived assets have the same fields as assets, along with the time they were archived
+
+
+ASSET_FIELDS = {
+    'id': Asset.id,
+    'category': Asset.category,
+    'comments': Asset.comments,
+    'customer_id': Asset.customer_id,
+    'manufacturer_id': Asset.manufacturer_id,
+    'user_id': Asset.user_id,
+    'timestamp': Asset.timestamp,
+    'retired': Asset.retired,
+    'customer': Customer.name,
+    'manufacturer': Manufacturer.name,
+    'author': User.username,
+}
+
+ASSET_JOINS = {
+    'customer': (Customer, Asset.customer_id == Customer.id),
+    'manufacturer': (Manufacturer, Asset.manufacturer_id == Manufacturer.id),
+    'author': (User, Asset.user_id == User.id),
+}
+
+ARCHIVED_ASSET_FIELDS = {
+    'id': ArchivedAsset.id,
+    'category': ArchivedAsset.category,
+    'comments': ArchivedAsset.comments,
+    'customer_id': ArchivedAsset.customer_id,
+    'manufacturer_id': ArchivedAsset.manufacturer_id,
+    'user_id': ArchivedAsset.user_id,
+    'timestamp': ArchivedAsset.timestamp,
+    'retired': ArchivedAsset.retired,
+    'archived_at': ArchivedAsset.archived_at,
+    'customer': Customer.name,
+    'manufacturer': Manufacturer.name,
+    'author': User.username,
+}
+
+ARCHIVED_ASSET_JOINS = {
+    'customer': (Customer, ArchivedAsset.customer_id == Customer.id),
+    'manufacturer': (Manufacturer, ArchivedAsset.manufacturer_id == Manufacturer.id),
+    'author': (User, ArchivedAsset.user_id == User.id),
+}
+
+CUSTOMER_FIELDS = {'id': Customer.id, 'name': Customer.name}
+MANUFACTURER_FIELDS = {'id': Manufacturer.id, 'name': Manufacturer.name}
+
+
+def _requested_fields(available):
+    fields = request.args.get('fields')
+    if not fields:
+        return list(available)
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ApiError('Unknown fields: ' + ', '.join(unknown))
+    if 'id' not in names:
+        names.insert(0, 'id')
+    return names
+
+
+def _select(model, available, names, joins=None):
+    query = db.session.query(
+        *[available[name].label(name) for name in names]).select_from(model)
+    for name in names:
+        if joins and name in joins:
+            query = query.outerjoin(*joins[name])
+    return query
+
+
+def _serialize(row):
+    return {key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in row._mapping.items()}
+
+
+def _list(model, available, query_filter=None, joins=None):
+    names = _requested_fields(available)
+    query = _select(model, available, names, joins)
+    if query_filter is not None:
+        query = query_filter(query)
+    page = keyset_paginate(query, model.id, get_per_page(),
+                           after=request.args.get('after'), before=request.args.get('before'))
+    return jsonify({
+        'data': [_serialize(row) for row in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+
+def _get(model, available, id, joins=None):
+    row = _select(model, available, _requested_fields(available), joins).filter(
+        model.id == id).first()
+    if row is None:
+        abort(404, description=f'{model.__name__} {id} not found')
+    return jsonify(_serialize(row))
+
+
+def _json_body():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ApiError('Request body must be a JSON object')
+    return data
+
+
+def _require_admin(model):
+    if not is_admin():
+        logging.warning('User attempted to delete %s through the API without permission: %s',
+                        model.__name__.lower(), current_user.username)
+        raise ApiError(
+            f'You do not have permission to delete this {model.__name__.lower()}.', 403)
+
+
+def _parse_datetime(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ApiError(f"'{name}' must be an ISO 8601 date or datetime")
+
+# The validate_asset function applies the same rules as the asset form to a JSON payload: the category must be one of the form's choices and the customer and manufacturer must be the IDs of existing records, which are checked against the cached lookup lists. With partial set (for PATCH requests), fields that are not present are left unchanged
+
+
+def validate_asset(data, partial=False):
+    errors = {}
+    values = {}
+
+    if 'category' in data or not partial:
+        if data.get('category') not in AssetForm.category_choices:
+            errors['category'] = 'Not a valid choice.'
+        else:
+            values['category'] = data['category']
+
+    for field, lookup in (('customer_id', 'customer'), ('manufacturer_id', 'manufacturer')):
+        if field in data or not partial:
+            value = data.get(field)
+            if isinstance(value, bool) or value not in {id for id, _ in get_choices(lookup)}:
+                errors[field] = 'Not a valid choice.'
+            else:
+                values[field] = data[field]
+
+    if 'comments' in data:
+        if data['comments'] is not None and not isinstance(data['comments'], str):
+            errors['comments'] = 'Must be a string.'
+        else:
+            values['comments'] = data['comments']
+
+    if 'retired' in data:
+        if not isinstance(data['retired'], bool):
+            errors['retired'] = 'Must be true or false.'
+        else:
+            values['retired'] = data['retired']
+
+    if errors:
+        raise ApiError('Validation failed', 422, errors)
+    return values
+
+
+def validate_name(data, partial=False):
+    if 'name' not in data and partial:
+        return {}
+    name = data.get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise ApiError('Validation failed', 422, {'name': 'This field is required.'})
+    if len(name) > 100:
+        raise ApiError('Validation failed', 422, {'name': 'Must be at most 100 characters.'})
+    return {'name': name.strip()}
+
+
+def _asset_filter_for(model):
+    def query_filter(query):
+        for field in ('customer_id', 'manufacturer_id'):
+            value = request.args.get(field)
+            if value is not None:
+                try:
+                    query = query.filter(getattr(model, field) == int(value))
+                except ValueError:
+                    raise ApiError(f"'{field}' must be an integer")
+        if request.args.get('category'):
+            query = query.filter(model.category == request.args['category'])
+        since = _parse_datetime('since')
+        until = _parse_datetime('until')
+        if since:
+            query = query.filter(model.timestamp >= since)
+        if until:
+            query = query.filter(model.timestamp < until)
+        return query
+    return query_filter
+
+
+_asset_filter = _asset_filter_for(Asset)
+
+
+def _name_filter(model):
+    def query_filter(query):
+        if request.args.get('name'):
+            query = query.filter(model.name == request.args['name'])
+        return query
+    return query_filter
+
+# The asset endpoints support filtering the list by customer_id, manufacturer_id, category and a timestamp range given by 'since' (inclusive) and 'until' (exclusive)
+
+
+@api.route('/assets')
+@login_required
+def list_assets():
+    return _list(Asset, ASSET_FIELDS, _asset_filter, ASSET_JOINS)
+
+
+# The archived asset endpoints list and get the assets moved to the archive by archive.py, with the same fields and filters as the asset endpoints plus the time each was archived, and the restore endpoint lets an admin user move the archived assets given in 'ids' back into the asset register
+
+
+@api.route('/assets/archived')
+@login_required
+def list_archived_assets():
+    return _list(ArchivedAsset, ARCHIVED_ASSET_FIELDS, _asset_filter_for(ArchivedAsset), ARCHIVED_ASSET_JOINS)
+
+
+@api.route('/assets/archived/<int:asset_id>')
+@login_required
+def get_archived_asset(asset_id):
+    return _get(ArchivedAsset, ARCHIVED_ASSET_FIELDS, asset_id, ARCHIVED_ASSET_JOINS)
+
+
+@api.route('/assets/archived/restore', methods=['POST'])
+@login_required
+def restore_archived_assets():
+    data = _json_body()
+    if not is_admin():
+        raise ApiError('You do not have permission to restore archived assets.', 403)
+    result = _run_bulk(lambda: archive.restore_assets(data.get('ids')))
+    logging.info('%s archived assets restored through the API by user: %s', result.count, current_user.username)
+    return jsonify(result._asdict())
+
+
+# The asset search endpoint returns the assets matching every word of the 'q' parameter, best matches first, using numbered pages since results are ordered by relevance rather than by ID. With 'archived=1' it searches the archived assets instead
+
+
+@api.route('/assets/search')
+@login_required
+def search_assets_endpoint():
+    query = request.args.get('q', '').strip()
+    if not query:
+        raise ApiError("'q' is required")
+    page = max(request.args.get('page', 1, type=int), 1)
+    results = search_assets(query, page, get_per_page('SEARCH_PER_PAGE'),
+                            archived=request.args.get('archived') == '1')
+    return jsonify({
+        'data': [_serialize(row) for row in results.items],
+        'page': results.page,
+        'has_next': results.has_next,
+    })
+
+
+# The asset changes endpoint reads the asset change log kept by audit.py, so that another system can keep its copy of the asset register up to date without fetching it all again. It returns the changes after the sequence number given by 'since' (0 returns the log from the start), oldest first and at most 'per_page' at a time, each with the asset ID, the action (create, update, delete, or archive and restore for assets moved to and from the archive), the fields involved, the user and the time. The client passes the 'sequence' of one response as 'since' in the next and keeps going while 'has_more' is true, and each request is a range scan of the log's primary key, so a sync costs time in proportion to the number of changes rather than the number of assets. No change is ever committed with a lower sequence number than one a client has already been given, on SQLite because only one transaction writes at a time and on PostgreSQL because audit.py makes the transactions writing to the log take their sequence numbers and commit one at a time, so following the log this way never skips a change. 'latest' is the newest sequence number in the log, which a client copying the whole register through the asset list can note first and then follow the log from
+
+
+@api.route('/assets/changes')
+@login_required
+def asset_changes():
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        raise ApiError("'since' must be an integer")
+    per_page = get_per_page()
+    rows = db.session.query(
+        AssetChange.id.label('sequence'), AssetChange.asset_id, AssetChange.action, AssetChange.changes,
+        AssetChange.user_id, AssetChange.timestamp,
+    ).filter(AssetChange.id > since).order_by(AssetChange.id).limit(per_page + 1).all()
+    latest = db.session.query(db.func.max(AssetChange.id)).scalar() or 0
+    return jsonify({
+        'data': [_serialize(row) for row in rows[:per_page]],
+        'sequence': rows[:per_page][-1].sequence if rows else since,
+        'has_more': len(rows) > per_page,
+        'latest': latest,
+    })
+
+
+# The dashboard endpoint returns the number of assets for each customer, manufacturer, category and month, along with the total, from the precomputed summary counts
+
+
+@api.route('/dashboard')
+@login_required
+def dashboard():
+    return jsonify(get_summary())
+
+
+@api.route('/assets/<int:asset_id>')
+@login_required
+def get_asset(asset_id):
+    return _get(Asset, ASSET_FIELDS, asset_id, ASSET_JOINS)
+
+
+@api.route('/assets', methods=['POST'])
+@login_required
+def create_asset():
+    values = validate_asset(_json_body())
+    asset = Asset(user_id=current_user.id, **values)
+    db.session.add(asset)
+    db.session.commit()
+    logging.info('New asset created through the API by user: %s', current_user.username)
+    return _get(Asset, ASSET_FIELDS, asset.id, ASSET_JOINS), 201
+
+
+@api.route('/assets/<int:asset_id>', methods=['PUT', 'PATCH'])
+@login_required
+def update_asset(asset_id):
+    asset = db.get_or_404(Asset, asset_id)
+    values = validate_asset(_json_body(), partial=request.method == 'PATCH')
+    for field, value in values.items():
+        setattr(asset, field, value)
+    db.session.commit()
+    logging.info('Asset updated through the API by user: %s', current_user.username)
+    return _get(Asset, ASSET_FIELDS, asset_id, ASSET_JOINS)
+
+
+@api.route('/assets/<int:asset_id>', methods=['DELETE'])
+@login_required
+def delete_asset(asset_id):
+    asset = db.get_or_404(Asset, asset_id)
+    _require_admin(Asset)
+    db.session.delete(asset)
+    db.session.commit()
+    logging.info('Asset deleted through the API by user: %s', current_user.username)
+    return '', 204
+
+# The bulk endpoints edit or delete many assets in one transaction. The body chooses the assets with 'ids' (a list of asset IDs) and/or 'filter' (an object with any of customer_id, manufacturer_id, category, since and until, as for the asset list), and the update endpoint takes the new values in 'set'. With 'dry_run' set to true, the chosen assets are counted but not changed. The response gives the number of assets affected and how they were spread across customers, manufacturers, categories and months beforehand
+
+BULK_FILTERS = ('customer_id', 'manufacturer_id', 'category', 'since', 'until')
+
+
+def _bulk_selection(data):
+    filters = data.get('filter') or {}
+    if not isinstance(filters, dict):
+        raise ApiError("'filter' must be an object")
+    unknown = [name for name in filters if name not in BULK_FILTERS]
+    if unknown:
+        raise ApiError('Unknown filters: ' + ', '.join(unknown))
+    return bulk.select_assets(data.get('ids'), **filters)
+
+
+def _run_bulk(operation):
+    try:
+        return operation()
+    except bulk.BulkConflictError as error:
+        raise ApiError(str(error), 409)
+    except bulk.BulkError as error:
+        raise ApiError(str(error), 422)
+
+
+@api.route('/assets/bulk-update', methods=['POST'])
+@login_required
+def bulk_update_assets():
+    data = _json_body()
+    values = data.get('set')
+    if not isinstance(values, dict):
+        raise ApiError("'set' must be an object")
+    dry_run = bool(data.get('dry_run'))
+    result = _run_bulk(lambda: bulk.update_assets(_bulk_selection(data), values, dry_run))
+    if not dry_run:
+        logging.info('%s assets updated through the API by user: %s', result.count, current_user.username)
+    return jsonify(result._asdict())
+
+
+@api.route('/assets/bulk-delete', methods=['POST'])
+@login_required
+def bulk_delete_assets():
+    data = _json_body()
+    _require_admin(Asset)
+    dry_run = bool(data.get('dry_run'))
+    result = _run_bulk(lambda: bulk.delete_assets(_bulk_selection(data), dry_run))
+    if not dry_run:
+        logging.info('%s assets deleted through the API by user: %s', result.count, current_user.username)
+    return jsonify(result._asdict())
+
+# The customer and manufacturer endpoints can filter their lists by exact name. Deleting one takes the delete policy for its assets in the 'policy' parameter ('nullify', 'reassign' with the new customer or manufacturer in 'target_id', 'cascade' or 'block'), defaulting to DELETE_POLICY, and the delete-preview endpoints count the assets a delete would affect. A customer or manufacturer with more than JOB_DELETE_THRESHOLD assets is deleted by a background job instead, and the response is 202 Accepted with the job, which can be followed through the job endpoints
+
+
+def _delete_record(record):
+    target_id = request.args.get('target_id')
+    if target_id is not None:
+        try:
+            target_id = int(target_id)
+        except ValueError:
+            raise ApiError("'target_id' must be an integer")
+    name = record.__table__.name
+    try:
+        job = jobs.queue_delete_record(record, request.args.get('policy'), target_id, current_user.id)
+        if job is not None:
+            logging.info('%s delete job %s started through the API by user: %s',
+                         name.capitalize(), job.id, current_user.username)
+            return _job_response(job, 202)
+        deletion.delete_record(record, request.args.get('policy'), target_id)
+    except (bulk.BulkConflictError, deletion.DeletionBlockedError) as error:
+        raise ApiError(str(error), 409)
+    except bulk.BulkError as error:
+        raise ApiError(str(error), 422)
+    logging.info('%s deleted through the API by user: %s', name.capitalize(), current_user.username)
+    return '', 204
+
+
+@api.route('/customers')
+@login_required
+def list_customers():
+    return _list(Customer, CUSTOMER_FIELDS, _name_filter(Customer))
+
+
+@api.route('/customers/<int:customer_id>')
+@login_required
+def get_customer(customer_id):
+    return _get(Customer, CUSTOMER_FIELDS, customer_id)
+
+
+@api.route('/customers', methods=['POST'])
+@login_required
+def create_customer():
+    customer = Customer(**validate_name(_json_body()))
+    db.session.add(customer)
+    db.session.commit()
+    logging.info('New customer created through the API by user: %s', current_user.username)
+    return _get(Customer, CUSTOMER_FIELDS, customer.id), 201
+
+
+@api.route('/customers/<int:customer_id>', methods=['PUT', 'PATCH'])
+@login_required
+def update_customer(customer_id):
+    customer = db.get_or_404(Customer, customer_id)
+    for field, value in validate_name(_json_body(), partial=request.method == 'PATCH').items():
+        setattr(customer, field, value)
+    db.session.commit()
+    logging.info('Customer updated through the API by user: %s', current_user.username)
+    return _get(Customer, CUSTOMER_FIELDS, customer_id)
+
+
+@api.route('/customers/<int:customer_id>', methods=['DELETE'])
+@login_required
+def delete_customer(customer_id):
+    customer = db.get_or_404(Customer, customer_id)
+    _require_admin(Customer)
+    return _delete_record(customer)
+
+
+@api.route('/customers/<int:customer_id>/delete-preview')
+@login_required
+def preview_delete_customer(customer_id):
+    return jsonify(deletion.preview_delete(db.get_or_404(Customer, customer_id))._asdict())
+
+
+@api.route('/manufacturers')
+@login_required
+def list_manufacturers():
+    return _list(Manufacturer, MANUFACTURER_FIELDS, _name_filter(Manufacturer))
+
+
+@api.route('/manufacturers/<int:manufacturer_id>')
+@login_required
+def get_manufacturer(manufacturer_id):
+    return _get(Manufacturer, MANUFACTURER_FIELDS, manufacturer_id)
+
+
+@api.route('/manufacturers', methods=['POST'])
+@login_required
+def create_manufacturer():
+    manufacturer = Manufacturer(**validate_name(_json_body()))
+    db.session.add(manufacturer)
+    db.session.commit()
+    logging.info('New manufacturer created through the API by user: %s', current_user.username)
+    return _get(Manufacturer, MANUFACTURER_FIELDS, manufacturer.id), 201
+
+
+@api.route('/manufacturers/<int:manufacturer_id>', methods=['PUT', 'PATCH'])
+@login_required
+def update_manufacturer(manufacturer_id):
+    manufacturer = db.get_or_404(Manufacturer, manufacturer_id)
+    for field, value in validate_name(_json_body(), partial=request.method == 'PATCH').items():
+        setattr(manufacturer, field, value)
+    db.session.commit()
+    logging.info('Manufacturer updated through the API by user: %s', current_user.username)
+    return _get(Manufacturer, MANUFACTURER_FIELDS, manufacturer_id)
+
+
+@api.route('/manufacturers/<int:manufacturer_id>', methods=['DELETE'])
+@login_required
+def delete_manufacturer(manufacturer_id):
+    manufacturer = db.get_or_404(Manufacturer, manufacturer_id)
+    _require_admin(Manufacturer)
+    return _delete_record(manufacturer)
+
+
+@api.route('/manufacturers/<int:manufacturer_id>/delete-preview')
+@login_required
+def preview_delete_manufacturer(manufacturer_id):
+    return jsonify(deletion.preview_delete(db.get_or_404(Manufacturer, manufacturer_id))._asdict())
+
+
+# The job endpoints follow the background jobs run by jobs.py. The list returns the jobs of the user logged in (or of every user, for admin users), newest first with the same keyset cursors as the other lists, and can be filtered by 'status' and 'type'. A job can be fetched, cancelled, and once an export has finished, its file downloaded. Jobs can also be started directly: 'export_assets' (with the file format in 'params', and 'archived' set to true to export the archive) by any user, and 'rebuild_search', 'rebuild_summary' and 'archive_assets' (with 'older_than_days', which defaults to ARCHIVE_AFTER_DAYS and can be null, and 'retired') by admin users. Starting a job returns 202 Accepted with the job and its address in the Location header, and other users' jobs are not found
+
+API_JOB_TYPES = ('export_assets', 'rebuild_search', 'rebuild_summary', 'archive_assets')
+
+
+def _job_response(job, status=200):
+    headers = {'Location': url_for('api.get_job', job_id=job.id)} if status == 202 else {}
+    return jsonify(jobs.serialize_job(job)), status, headers
+
+
+def _get_job(job_id):
+    job = db.get_or_404(Job, job_id)
+    if job.user_id != current_user.id and not is_admin():
+        abort(404, description=f'Job {job_id} not found')
+    return job
+
+
+@api.route('/jobs')
+@login_required
+def list_jobs():
+    query = Job.query
+    if current_user.role != 'admin' or not is_admin():
+        query = query.filter(Job.user_id == current_user.id)
+    for name in ('status', 'type'):
+        if request.args.get(name):
+            query = query.filter(getattr(Job, name) == request.args[name])
+    page = keyset_paginate(query, Job.id, get_per_page(),
+                           after=request.args.get('after'), before=request.args.get('before'))
+    return jsonify({
+        'data': [jobs.serialize_job(job) for job in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+
+@api.route('/jobs', methods=['POST'])
+@login_required
+def start_job():
+    data = _json_body()
+    job_type = data.get('type')
+    params = data.get('params') or {}
+    if job_type not in API_JOB_TYPES:
+        raise ApiError(f"'type' must be one of: {', '.join(API_JOB_TYPES)}")
+    if not isinstance(params, dict):
+        raise ApiError("'params' must be an object")
+    if jobs.JOB_TYPES[job_type].admin_only and not is_admin():
+        raise ApiError('You do not have permission to start this job.', 403)
+    if job_type == 'export_assets':
+        params = {'format': params.get('format', 'csv'), 'archived': bool(params.get('archived'))}
+        if params['format'] not in transfer.EXPORT_FORMATS:
+            raise ApiError(f"'format' must be one of: {', '.join(transfer.EXPORT_FORMATS)}")
+    elif job_type == 'archive_assets':
+        params = {'older_than_days': params.get('older_than_days', current_app.config['ARCHIVE_AFTER_DAYS']),
+                  'retired': params.get('retired', True)}
+        if params['older_than_days'] is not None and (
+                isinstance(params['older_than_days'], bool) or not isinstance(params['older_than_days'], int)):
+            raise ApiError("'older_than_days' must be an integer or null")
+        if not isinstance(params['retired'], bool):
+            raise ApiError("'retired' must be true or false")
+        try:
+            archive.select_archivable(params['older_than_days'], params['retired'])
+        except archive.ArchiveError as error:
+            raise ApiError(str(error), 422)
+    else:
+        params = {}
+    job = jobs.enqueue(job_type, params, current_user.id)
+    logging.info('%s job %s started through the API by user: %s', job_type, job.id, current_user.username)
+    return _job_response(job, 202)
+
+
+@api.route('/jobs/<int:job_id>')
+@login_required
+def get_job(job_id):
+    return _job_response(_get_job(job_id))
+
+
+@api.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    job = _get_job(job_id)
+    if not jobs.cancel_job(job.id):
+        raise ApiError(f'Job {job_id} has already finished', 409)
+    logging.info('Job %s cancelled through the API by user: %s', job.id, current_user.username)
+    db.session.refresh(job)
+    return _job_response(job)
+
+
+@api.route('/jobs/<int:job_id>/download')
+@login_required
+def download_job(job_id):
+    job = _get_job(job_id)
+    if job.status != 'succeeded' or not (job.result or {}).get('file'):
+        raise ApiError(f'Job {job_id} has no file to download', 404)
+    return send_from_directory(jobs.job_files_directory(current_app), job.result['file'], as_attachment=True,
+                               download_name=f"assets.{job.result['format']}",
+                               mimetype=transfer.EXPORT_MIMETYPES[job.result['format']])
@@ -0,0 +1,125 @@
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, or_, select, insert, delete, literal, func, true
+from app import db
+from app.models import Asset, ArchivedAsset
+from app.bulk import BulkError, BulkConflictError, parse_ids
+from app.metrics import count_model_changes
+from app.summary import DIMENSIONS, apply_deltas, count_selection
+from app.versions import bump_table_versions
+from app.audit import lock_change_log, record_selection
+
+# The following code moves assets out of the asset table into the archive (the ArchivedAsset table) and back again. Assets are archived when they were created more than ARCHIVE_AFTER_DAYS days ago, when they have been marked as retired, or both, so that the asset table, its indexes and every page and API call reading them only cover the assets still in use, however many old ones build up. The assets are moved ARCHIVE_BATCH_SIZE at a time, each batch as one transaction that copies the assets into the archive with an INSERT ... SELECT, deletes them from the asset table, takes them off the dashboard's summary counts and records an 'archive' change for each of them in the change log, so an interrupted run leaves every asset either in use or archived and can simply be started again. As in bulk.py, the summary counts are taken just before the change and checked against the number of rows deleted, so a batch changed by someone else at the same time is rolled back rather than leaving the counts wrong. Archived assets keep their IDs, can still be searched (search.py) and exported (transfer.py), and restore_assets moves them back unchanged apart from the retired mark
+
+ARCHIVE_COLUMNS = ('id', 'category', 'comments', 'user_id', 'customer_id', 'manufacturer_id',
+                   'timestamp', 'updated_at', 'retired')
+
+ArchiveResult = namedtuple('ArchiveResult', ['action', 'count', 'batches'])
+
+
+class ArchiveError(BulkError):
+    pass
+
+
+def _matched(counts):
+    return sum(count for (name, _), count in counts.items() if name == 'category')
+
+# The select_archivable function returns the where clauses for the assets due to be archived: those created before older_than_days days ago, those marked as retired, or both. Each clause is archived in a pass of its own, which lets the retired assets be found through the partial index on them and old assets through the index on timestamp, where a single OR of the two would have SQLite read the whole asset table for every batch
+
+
+def select_archivable(older_than_days=None, retired=True):
+    clauses = []
+    if older_than_days is not None:
+        if older_than_days < 1:
+            raise ArchiveError('The age of the assets to archive must be at least one day')
+        clauses.append(Asset.timestamp < datetime.utcnow() - timedelta(days=older_than_days))
+    if retired:
+        clauses.append(Asset.retired == true())
+    if not clauses:
+        raise ArchiveError('Choose assets older than a number of days, retired assets or both')
+    return clauses
+
+
+def count_archivable(clauses):
+    return db.session.execute(select(func.count()).select_from(Asset).where(or_(*clauses))).scalar()
+
+# The archive_selection and restore_selection functions move one batch of assets without committing. Both return the number of assets moved
+
+
+def archive_selection(where):
+    connection = db.session.connection()
+    counts = count_selection(connection, where, DIMENSIONS)
+    count = _matched(counts)
+    if not count:
+        return 0
+
+    record_selection(connection, 'archive', where)
+    columns = Asset.__table__.c
+    connection.execute(insert(ArchivedAsset.__table__).from_select(
+        ARCHIVE_COLUMNS + ('archived_at',),
+        select(*[columns[name] for name in ARCHIVE_COLUMNS],
+               literal(datetime.utcnow(), ArchivedAsset.archived_at.type)).where(where)))
+    if connection.execute(delete(Asset.__table__).where(where)).rowcount != count:
+        db.session.rollback()
+        raise BulkConflictError('The assets being archived were changed by someone else at the same time, please try again')
+
+    apply_deltas(connection, Counter({key: -number for key, number in counts.items()}))
+    count_model_changes(db.session, 'asset', 'archive', count)
+    bump_table_versions(db.session, {'asset'})
+    return count
+
+
+def restore_selection(ids):
+    connection = db.session.connection()
+    lock_change_log(connection)
+    columns = ArchivedAsset.__table__.c
+    count = connection.execute(insert(Asset.__table__).from_select(
+        ARCHIVE_COLUMNS,
+        select(*[literal(False) if name == 'retired' else columns[name] for name in ARCHIVE_COLUMNS])
+        .where(ArchivedAsset.id.in_(ids)))).rowcount
+    if not count:
+        return 0
+
+    restored = Asset.id.in_(ids)
+    if connection.execute(delete(ArchivedAsset.__table__).where(ArchivedAsset.id.in_(ids))).rowcount != count:
+        db.session.rollback()
+        raise BulkConflictError('The assets being restored were changed by someone else at the same time, please try again')
+    record_selection(connection, 'restore', restored)
+    apply_deltas(connection, count_selection(connection, restored, DIMENSIONS))
+    count_model_changes(db.session, 'asset', 'restore', count)
+    bump_table_versions(db.session, {'asset'})
+    return count
+
+# The archive_assets function archives every asset matching the where clauses from select_archivable, a batch at a time, calling progress with the number archived so far and the number there were to begin with after each batch. Each batch is chosen again from the assets still in the asset table, so assets changed while the archive runs (un-retired, for example) are left alone. With dry_run set, the assets are only counted
+
+
+def archive_assets(clauses, batch_size=None, progress=None, dry_run=False):
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    total = count_archivable(clauses)
+    if dry_run or not total:
+        return ArchiveResult('preview' if dry_run else 'archive', total, 0)
+
+    archived = batches = 0
+    for where in clauses:
+        while True:
+            ids = db.session.execute(select(Asset.id).where(where).limit(batch_size)).scalars().all()
+            if not ids:
+                break
+            archived += archive_selection(and_(Asset.id.in_(ids), where))
+            db.session.commit()
+            batches += 1
+            if progress:
+                progress(archived, total)
+    return ArchiveResult('archive', archived, batches)
+
+
+def restore_assets(ids):
+    ids = parse_ids(ids)
+    if not ids:
+        raise ArchiveError('Choose the archived assets to restore by ID')
+    if len(ids) > current_app.config['BULK_MAX_IDS']:
+        raise ArchiveError(f"At most {current_app.config['BULK_MAX_IDS']} assets can be restored at once")
+    count = restore_selection(ids)
+    db.session.commit()
+    return ArchiveResult('restore', count, 1 if count else 0)
@@ -0,0 +1,109 @@
+from datetime import datetime
+from itertools import chain
+from flask import g, has_app_context
+from sqlalchemy import event, insert, select, literal, func, and_, or_
+from sqlalchemy.orm import Session, attributes
+from app.models import Asset, AssetChange
+
+# The following code writes the asset change log (the AssetChange table). Assets created, edited and deleted through the ORM are recorded by mapper events, which run during the flush on the same connection, so each change log row is committed or rolled back together with the change it describes, in the same way as the summary counts in summary.py. Code that writes assets with Core statements records them itself: the bulk import passes the new assets to record_created, and bulk edits and deletes call record_selection, which copies the chosen assets' values into the log with a single INSERT ... SELECT just before the UPDATE or DELETE, so the cost stays one statement however many assets change. Only the fields in AUDITED_FIELDS are recorded, and an edit that changes none of them (such as one that only touches updated_at) adds nothing. The user is the logged in user, or g.audit_user_id for changes made outside a request, such as by the CLI commands
+
+AUDITED_FIELDS = ('category', 'comments', 'customer_id', 'manufacturer_id', 'user_id')
+
+# The changes endpoint in api.py follows the log by sequence number, which is only safe if the rows become visible in the order of their IDs, since a client that has moved past a newer ID would otherwise never see an older one committed after it. SQLite gives this by letting only one transaction write at a time. PostgreSQL hands out the IDs from a sequence without waiting for earlier transactions to commit, so every transaction writing to the log first takes a transaction-level advisory lock, held until it commits or rolls back, and transactions changing assets therefore get their IDs and commit one after another. Taking the lock again within the same transaction returns straight away. The lock is taken before the assets themselves are written, at the start of a flush that changes assets (ahead of the other before_flush listeners) and before the UPDATE or DELETE in record_selection, so a transaction never waits for it while holding locks on rows another transaction with the lock is about to change
+
+CHANGE_LOG_LOCK = 4731001
+
+
+def lock_change_log(connection):
+    if connection.dialect.name == 'postgresql':
+        connection.execute(select(func.pg_advisory_xact_lock(CHANGE_LOG_LOCK)))
+
+
+def current_user_id():
+    if not has_app_context():
+        return None
+    user = g.get('_login_user')
+    if user is not None and user.is_authenticated:
+        return user.id
+    return g.get('audit_user_id')
+
+
+def record_changes(connection, changes):
+    if not changes:
+        return
+    user_id = current_user_id()
+    timestamp = datetime.utcnow()
+    for change in changes:
+        if change.get('user_id') is None:
+            change['user_id'] = user_id
+        change['timestamp'] = timestamp
+    lock_change_log(connection)
+    connection.execute(insert(AssetChange.__table__), changes)
+
+
+def record_created(connection, asset_ids, rows, user_id=None):
+    record_changes(connection, [
+        {'asset_id': asset_id, 'action': 'create', 'user_id': user_id,
+         'changes': {field: row.get(field) for field in AUDITED_FIELDS}}
+        for asset_id, row in zip(asset_ids, rows)])
+
+# The JSON for the assets chosen by a bulk edit or delete is built by the database, with json_object on SQLite and json_build_object on PostgreSQL. Bulk edits only log the assets for which at least one of the new values differs from the current one
+
+
+def _json_functions(connection):
+    if connection.dialect.name == 'sqlite':
+        return func.json_object, func.json_array
+    return func.json_build_object, func.json_build_array
+
+
+def record_selection(connection, action, where, values=None):
+    json_object, json_array = _json_functions(connection)
+    columns = Asset.__table__.c
+    if action == 'update':
+        changes = json_object(*chain.from_iterable(
+            (literal(field), json_array(columns[field], literal(value)))
+            for field, value in values.items() if field in AUDITED_FIELDS))
+        where = and_(where, or_(*[columns[field].is_distinct_from(value)
+                                  for field, value in values.items() if field in AUDITED_FIELDS]))
+    else:
+        changes = json_object(*chain.from_iterable(
+            (literal(field), columns[field]) for field in AUDITED_FIELDS))
+
+    user_id = current_user_id()
+    lock_change_log(connection)
+    connection.execute(insert(AssetChange.__table__).from_select(
+        ['asset_id', 'action', 'changes', 'user_id', 'timestamp'],
+        select(columns.id, literal(action), changes, literal(user_id, AssetChange.user_id.type),
+               literal(datetime.utcnow(), AssetChange.timestamp.type))
+        .where(where).order_by(columns.id)))
+
+
+@event.listens_for(Session, 'before_flush', insert=True)
+def _lock_change_log_for_flush(session, flush_context, instances):
+    if any(isinstance(obj, Asset) for obj in chain(session.new, session.dirty, session.deleted)):
+        lock_change_log(session.connection())
+
+
+@event.listens_for(Asset, 'after_insert')
+def _record_inserted_asset(mapper, connection, target):
+    record_changes(connection, [{
+        'asset_id': target.id, 'action': 'create',
+        'changes': {field: getattr(target, field) for field in AUDITED_FIELDS}}])
+
+
+@event.listens_for(Asset, 'after_update')
+def _record_updated_asset(mapper, connection, target):
+    changes = {}
+    for field in AUDITED_FIELDS:
+        history = attributes.get_history(target, field, passive=attributes.PASSIVE_NO_INITIALIZE)
+        if history.deleted and history.added and history.deleted[0] != history.added[0]:
+            changes[field] = [history.deleted[0], history.added[0]]
+    if changes:
+        record_changes(connection, [{'asset_id': target.id, 'action': 'update', 'changes': changes}])
+
+
+@event.listens_for(Asset, 'after_delete')
+def _record_deleted_asset(mapper, connection, target):
+    record_changes(connection, [{
+        'asset_id': target.id, 'action': 'delete',
+        'changes': {field: getattr(target, field) for field in AUDITED_FIELDS}}])
@@ -0,0 +1,179 @@
+import re
+from collections import Counter, namedtuple
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import and_, update, delete
+from app import db
+from app.models import Asset
+from app.forms import AssetForm
+from app.lookups import get_choices
+from app.metrics import count_model_changes
+from app.summary import DIMENSIONS, summary_keys, apply_deltas, count_selection
+from app.versions import bump_table_versions
+from app.audit import record_selection
+
+# The following code edits and deletes many assets at once. The assets are chosen by a list of IDs, by filters on customer, manufacturer, category and creation date, or by both, and each operation is a single set-based UPDATE or DELETE statement committed in one transaction, however many assets it changes. The dashboard's summary counts are adjusted in the same transaction from GROUP BY counts of the chosen assets taken just before the change, and the number of rows changed is checked against those counts, so if other requests change the chosen assets in between, the whole operation is rolled back rather than leaving the counts wrong. Each operation returns a BulkResult with the number of assets changed and how they were spread across customers, manufacturers, categories and months beforehand. Deleting is reserved for admin users, which the routes, API and commands calling these functions check
+
+BULK_FIELDS = {'category': 'category', 'customer_id': 'customer', 'manufacturer_id': 'manufacturer'}
+
+BulkResult = namedtuple('BulkResult', ['action', 'count', 'values', 'breakdown'])
+
+
+class BulkError(ValueError):
+    pass
+
+
+class BulkConflictError(BulkError):
+    pass
+
+
+def _integer(name, value):
+    if isinstance(value, bool):
+        raise BulkError(f"'{name}' must be an integer")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BulkError(f"'{name}' must be an integer")
+
+
+def _datetime(name, value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        raise BulkError(f"'{name}' must be an ISO 8601 date or datetime")
+
+
+def parse_ids(ids):
+    if ids is None:
+        return []
+    if isinstance(ids, str):
+        ids = [item for item in re.split(r'[\s,]+', ids) if item]
+    elif not isinstance(ids, (list, tuple, set)):
+        raise BulkError("'ids' must be a list of asset IDs")
+    return sorted({_integer('ids', id) for id in ids})
+
+# The select_assets function turns the chosen IDs and filters into a where clause. At least one of them has to be given, so that a missing filter can never turn into an edit or delete of the whole asset register
+
+
+def select_assets(ids=None, customer_id=None, manufacturer_id=None, category=None, since=None, until=None):
+    clauses = []
+    ids = parse_ids(ids)
+    if ids:
+        if len(ids) > current_app.config['BULK_MAX_IDS']:
+            raise BulkError(f"At most {current_app.config['BULK_MAX_IDS']} asset IDs can be given at once, "
+                            'please use a filter for larger selections')
+        clauses.append(Asset.id.in_(ids))
+    if customer_id not in (None, ''):
+        clauses.append(Asset.customer_id == _integer('customer_id', customer_id))
+    if manufacturer_id not in (None, ''):
+        clauses.append(Asset.manufacturer_id == _integer('manufacturer_id', manufacturer_id))
+    if category:
+        clauses.append(Asset.category == category)
+    if since:
+        clauses.append(Asset.timestamp >= _datetime('since', since))
+    if until:
+        clauses.append(Asset.timestamp < _datetime('until', until))
+    if not clauses:
+        raise BulkError('Choose the assets by ID or by at least one filter')
+    return and_(*clauses)
+
+
+def validate_values(values):
+    values = {field: value for field, value in values.items() if value not in (None, '')}
+    unknown = [field for field in values if field not in BULK_FIELDS]
+    if unknown:
+        raise BulkError('Unknown fields: ' + ', '.join(unknown))
+    if not values:
+        raise BulkError('Choose at least one field to change')
+
+    if 'category' in values and values['category'] not in AssetForm.category_choices:
+        raise BulkError(f"Invalid category '{values['category']}'")
+    for field, lookup in (('customer_id', 'customer'), ('manufacturer_id', 'manufacturer')):
+        if field in values:
+            values[field] = _integer(field, values[field])
+            if values[field] not in {id for id, _ in get_choices(lookup)}:
+                raise BulkError(f'Unknown {lookup} {values[field]}')
+    return values
+
+
+def _breakdown(counts):
+    breakdown = {}
+    for (dimension, value), count in sorted(counts.items()):
+        if dimension in ('customer', 'manufacturer'):
+            value = int(value) if value else None
+        breakdown.setdefault(dimension, []).append({'value': value or None, 'count': count})
+    return breakdown
+
+
+def _matched(counts, dimension):
+    return sum(count for (name, _), count in counts.items() if name == dimension)
+
+
+def _execute(statement, expected):
+    if db.session.execute(statement).rowcount != expected:
+        db.session.rollback()
+        raise BulkConflictError('The chosen assets were changed by someone else at the same time, please try again')
+
+
+# The preview_assets function counts the chosen assets without changing them, so that the user can check a selection before editing or deleting it
+
+
+def preview_assets(where):
+    counts = count_selection(db.session.connection(), where, DIMENSIONS)
+    return BulkResult('preview', _matched(counts, 'category'), {}, _breakdown(counts))
+
+# The update_selection and delete_selection functions make the change and adjust the summary counts without committing, so that they can be part of a larger transaction such as deleting a customer in deletion.py. For an update, only the summary counts for the dimensions being changed are read and adjusted: the chosen assets are taken off their old counts and the same number are added to the new value's count. The chosen assets are also copied into the change log in audit.py before they are changed. Both return the number of assets changed and the counts of the chosen assets beforehand
+
+
+def update_selection(where, values):
+    dimensions = [BULK_FIELDS[field] for field in values]
+    connection = db.session.connection()
+    counts = count_selection(connection, where, dimensions)
+
+    count = _matched(counts, dimensions[0])
+    if count:
+        record_selection(connection, 'update', where, values)
+        _execute(update(Asset.__table__).where(where).values(**values), count)
+        deltas = Counter({key: -number for key, number in counts.items()})
+        for dimension, value in summary_keys(values):
+            if dimension in dimensions:
+                deltas[dimension, value] += count
+        apply_deltas(connection, deltas)
+        count_model_changes(db.session, 'asset', 'update', count)
+        bump_table_versions(db.session, {'asset'})
+    return count, counts
+
+
+def delete_selection(where):
+    connection = db.session.connection()
+    counts = count_selection(connection, where, DIMENSIONS)
+
+    count = _matched(counts, 'category')
+    if count:
+        record_selection(connection, 'delete', where)
+        _execute(delete(Asset.__table__).where(where), count)
+        apply_deltas(connection, Counter({key: -number for key, number in counts.items()}))
+        count_model_changes(db.session, 'asset', 'delete', count)
+        bump_table_versions(db.session, {'asset'})
+    return count, counts
+
+# The update_assets function sets the given fields (category, customer_id and manufacturer_id) on every chosen asset and delete_assets deletes them, each committing the change as one transaction. With dry_run set, the assets are counted but nothing is changed
+
+
+def update_assets(where, values, dry_run=False):
+    values = validate_values(values)
+    if dry_run:
+        return preview_assets(where)._replace(action='update', values=values)
+    count, counts = update_selection(where, values)
+    db.session.commit()
+    return BulkResult('update', count, values, _breakdown(counts))
+
+
+def delete_assets(where, dry_run=False):
+    if dry_run:
+        return preview_assets(where)._replace(action='delete')
+    count, counts = delete_selection(where)
+    db.session.commit()
+    return BulkResult('delete', count, {}, _breakdown(counts))
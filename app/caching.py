@@ -0,0 +1,140 @@
+import gzip
+import hashlib
+import os
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+from app import db
+from app.versions import get_table_versions
+
+# The following code adds HTTP caching to the application. The list pages are wrapped with the conditional decorator, which reads the stored version of each table the page shows (one primary key query, with no ORM objects) and turns them into a weak ETag, along with a Last-Modified time from when those tables last changed. When the browser already holds the current page, it gets a 304 Not Modified response straight away, without the page's queries or template being run. The ETag also covers the URL, the logged in user and their session's CSRF token, and changes every half WTF_CSRF_TIME_LIMIT so that a cached form never holds an expired token, and a page is always rendered in full when it has flashed messages waiting to be shown. Pages are marked private and no-cache, so browsers check with the server before reusing them and shared caches do not store them
+
+# The conditional decorator goes below login_required on a view and takes the names of the tables (as tracked in versions.py) whose contents the page shows. Requests other than GET and HEAD are passed straight to the view
+
+
+def conditional(*tables):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if (request.method not in ('GET', 'HEAD') or not current_app.config['HTTP_CACHE_ENABLED']
+                    or '_flashes' in session):
+                return view(*args, **kwargs)
+
+            versions = get_table_versions(db.session, tables)
+            etag = _etag(versions)
+            last_modified = _last_modified(versions)
+            if _not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
+
+def _csrf_period():
+    limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    if not limit:
+        return None
+    half = limit / 2
+    return datetime.fromtimestamp(time.time() // half * half, timezone.utc)
+
+
+def _etag(versions):
+    parts = [current_app.extensions['http_cache_build'], request.full_path,
+             str(current_user.get_id()), getattr(current_user, 'role', ''),
+             session.get('csrf_token', ''), str(_csrf_period())]
+    parts += [f'{name}:{version}' for name, (version, _) in sorted(versions.items())]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def _last_modified(versions):
+    times = [changed_at.replace(tzinfo=timezone.utc, microsecond=0)
+             for _, changed_at in versions.values() if changed_at]
+    period = _csrf_period()
+    if period:
+        times.append(period)
+    return max(times) if times else None
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+# Static files are given fingerprinted URLs: url_for('static', ...) adds a 'v' parameter holding a hash of the file's contents, worked out once when the app starts. A request carrying the current fingerprint is served with a far-future, immutable Cache-Control header, since a changed file gets a new URL, while requests without it keep the usual revalidation. The fingerprints of the templates and static files together also go into every page ETag, so that deploying new templates invalidates pages cached by browsers
+
+
+def _fingerprints(folder):
+    fingerprints = {}
+    for root, _, files in os.walk(folder):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as file:
+                digest = hashlib.sha1(file.read()).hexdigest()[:12]
+            fingerprints[os.path.relpath(path, folder).replace(os.sep, '/')] = digest
+    return fingerprints
+
+
+def _static_url_defaults(endpoint, values):
+    if endpoint == 'static' and 'filename' in values:
+        fingerprint = current_app.extensions['static_fingerprints'].get(values['filename'])
+        if fingerprint:
+            values.setdefault('v', fingerprint)
+
+
+def _cache_static(response):
+    if request.endpoint == 'static' and response.status_code in (200, 304):
+        fingerprint = current_app.extensions['static_fingerprints'].get(request.view_args.get('filename'))
+        if fingerprint and request.args.get('v') == fingerprint:
+            response.cache_control.public = True
+            response.cache_control.max_age = current_app.config['STATIC_MAX_AGE']
+            response.cache_control.immutable = True
+    return response
+
+# Responses of at least COMPRESS_MIN_SIZE bytes with one of COMPRESS_MIMETYPES are gzip compressed when the client accepts it. Streamed responses, such as the asset export, and files sent directly are left as they are
+
+
+def _compress(response):
+    config = current_app.config
+    if (not config['COMPRESS_ENABLED'] or response.mimetype not in config['COMPRESS_MIMETYPES']
+            or response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.accept_encodings:
+        return response
+    data = response.get_data()
+    if len(data) < config['COMPRESS_MIN_SIZE']:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=config['COMPRESS_LEVEL'], mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def init_caching(app):
+    static_fingerprints = _fingerprints(app.static_folder)
+    template_fingerprints = _fingerprints(os.path.join(app.root_path, app.template_folder))
+    build = hashlib.sha1(repr(sorted(static_fingerprints.items()) + sorted(
+        template_fingerprints.items())).encode()).hexdigest()
+    app.extensions['static_fingerprints'] = static_fingerprints
+    app.extensions['http_cache_build'] = build
+
+    app.url_defaults(_static_url_defaults)
+    app.after_request(_compress)
+    app.after_request(_cache_static)
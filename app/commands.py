@@ -0,0 +1,228 @@
+import time
+import click
+from flask import g, current_app
+from flask.cli import AppGroup
+from app import db, transfer, bulk, jobs, archive
+from app.models import User, Job
+from app.search import rebuild_search_index
+from app.summary import rebuild_summary
+from app.lookups import get_choices
+from app.forms import AssetForm
+
+# The following code defines the 'flask assets' command group, which gives administrators command line access to operations on the whole asset register that would be too slow or too large to run through the web pages
+
+assets_cli = AppGroup('assets', help='Bulk operations on the asset register.')
+
+
+def _get_user(username):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.BadParameter(f"No user named '{username}'", param_hint='--username')
+    return user
+
+# The import command streams a CSV or JSON-lines file through the bulk importer, recording the given user as the creator of the imported assets, and prints the number of rows imported and rejected along with the reason for each rejected row
+
+
+@assets_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--username', required=True, help='User recorded as the creator of the assets.')
+@click.option('--format', 'fmt', type=click.Choice(transfer.IMPORT_FORMATS), help='Defaults to the file extension.')
+@click.option('--batch-size', type=int, help='Rows written per transaction.')
+def import_command(path, username, fmt, batch_size):
+    user = _get_user(username)
+    fmt = fmt or transfer.detect_format(path)
+
+    started = time.perf_counter()
+    with open(path, 'rb') as stream:
+        result = transfer.import_assets(stream, fmt, user.id, batch_size)
+    elapsed = time.perf_counter() - started
+
+    for line_number, reason in result.rejected:
+        click.echo(f'Line {line_number}: {reason}', err=True)
+    click.echo(f'{result.inserted} assets imported, {result.rejected_count} rows rejected '
+               f'in {elapsed:.2f}s ({result.inserted / max(elapsed, 1e-9):.0f} rows/s)')
+
+# The export command writes the whole asset register (or with --archived, the archived assets) as CSV or JSON-lines to the given file, or to standard output if no file is given, using the same streaming export as the web page
+
+
+@assets_cli.command('export')
+@click.option('--format', 'fmt', type=click.Choice(transfer.EXPORT_FORMATS), default='csv', show_default=True)
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-', help='Defaults to standard output.')
+@click.option('--archived', is_flag=True, help='Export the archived assets instead.')
+def export_command(fmt, output, archived):
+    for chunk in transfer.generate_export(fmt, transfer.export_statement(archived)):
+        output.write(chunk)
+
+# The rebuild-search command empties the asset search index and fills it again from the asset, customer and manufacturer tables. The index is normally kept up to date by database triggers, so this is only needed after restoring a backup or changing the index definition
+
+
+@assets_cli.command('rebuild-search')
+def rebuild_search_command():
+    with db.engine.begin() as connection:
+        count = rebuild_search_index(connection)
+    click.echo(f'Search index rebuilt with {count} assets')
+
+# The rebuild-summary command recalculates the dashboard's asset counts from the asset table. The counts are normally kept up to date as assets change, so this is only needed after changing assets outside the application or restoring a backup
+
+
+@assets_cli.command('rebuild-summary')
+def rebuild_summary_command():
+    with db.engine.begin() as connection:
+        total = rebuild_summary(connection)
+    click.echo(f'Dashboard summary rebuilt from {total} assets')
+
+# The bulk-update and bulk-delete commands edit or delete every asset chosen by the --id and filter options in one transaction, using the same code as the bulk edit page. Customers and manufacturers can be given by name or ID. With --dry-run, the chosen assets are counted but not changed, and deleting assets requires the --username of an admin user. The --username given is recorded in the change log as the user who made the changes
+
+
+def _lookup_id(name, value):
+    if value is None or value.isdigit():
+        return value and int(value)
+    for id, label in get_choices(name):
+        if label.strip().casefold() == value.strip().casefold():
+            return id
+    raise click.BadParameter(f"No {name} named '{value}'")
+
+
+def selection_options(command):
+    options = [
+        click.option('--id', 'ids', type=int, multiple=True, help='Asset ID, may be given more than once.'),
+        click.option('--customer', help='Only assets of this customer (name or ID).'),
+        click.option('--manufacturer', help='Only assets of this manufacturer (name or ID).'),
+        click.option('--category', type=click.Choice(AssetForm.category_choices), help='Only assets in this category.'),
+        click.option('--since', type=click.DateTime(), help='Only assets created at or after this time.'),
+        click.option('--until', type=click.DateTime(), help='Only assets created before this time.'),
+        click.option('--dry-run', is_flag=True, help='Count the chosen assets without changing them.'),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def _select(ids, customer, manufacturer, category, since, until):
+    return bulk.select_assets(list(ids), _lookup_id('customer', customer),
+                              _lookup_id('manufacturer', manufacturer), category, since, until)
+
+
+def _report(result, dry_run, verb):
+    names = {'customer': dict(get_choices('customer')), 'manufacturer': dict(get_choices('manufacturer'))}
+    for dimension in ('category', 'customer', 'manufacturer'):
+        for entry in result.breakdown.get(dimension, []):
+            label = names[dimension].get(entry['value'], 'None') if dimension in names else entry['value']
+            click.echo(f"  {dimension} {label}: {entry['count']}")
+    click.echo(f'{result.count} assets {"would be " if dry_run else ""}{verb}')
+
+
+@assets_cli.command('bulk-update')
+@selection_options
+@click.option('--set-category', type=click.Choice(AssetForm.category_choices), help='New category.')
+@click.option('--set-customer', help='New customer (name or ID).')
+@click.option('--set-manufacturer', help='New manufacturer (name or ID).')
+@click.option('--username', help='User recorded in the change log as making the changes.')
+def bulk_update_command(ids, customer, manufacturer, category, since, until, dry_run,
+                        set_category, set_customer, set_manufacturer, username):
+    if username:
+        g.audit_user_id = _get_user(username).id
+    try:
+        result = bulk.update_assets(_select(ids, customer, manufacturer, category, since, until), {
+            'category': set_category,
+            'customer_id': _lookup_id('customer', set_customer),
+            'manufacturer_id': _lookup_id('manufacturer', set_manufacturer),
+        }, dry_run)
+    except bulk.BulkError as error:
+        raise click.ClickException(str(error))
+    _report(result, dry_run, 'updated')
+
+
+@assets_cli.command('bulk-delete')
+@selection_options
+@click.option('--username', required=True, help='Admin user carrying out the deletion.')
+def bulk_delete_command(ids, customer, manufacturer, category, since, until, dry_run, username):
+    user = _get_user(username)
+    if user.role != 'admin':
+        raise click.ClickException(f"'{username}' is not an admin user and cannot delete assets")
+    g.audit_user_id = user.id
+    try:
+        result = bulk.delete_assets(_select(ids, customer, manufacturer, category, since, until), dry_run)
+    except bulk.BulkError as error:
+        raise click.ClickException(str(error))
+    _report(result, dry_run, 'deleted')
+
+# The archive command moves assets created more than --older-than-days days ago (ARCHIVE_AFTER_DAYS by default) and assets marked as retired out of the asset table into the archive, in batches of --batch-size, using archive.py. --no-age or --no-retired leave out one of the two, and with --dry-run the assets are counted but not moved. The restore command moves the archived assets with the given IDs back. Both are suited to a scheduled task as well as to running by hand
+
+
+@assets_cli.command('archive')
+@click.option('--older-than-days', type=int, help='Age in days, defaults to ARCHIVE_AFTER_DAYS.')
+@click.option('--age/--no-age', default=True, show_default=True, help='Archive assets older than the age.')
+@click.option('--retired/--no-retired', default=True, show_default=True, help='Archive retired assets.')
+@click.option('--batch-size', type=int, help='Assets moved per transaction, defaults to ARCHIVE_BATCH_SIZE.')
+@click.option('--dry-run', is_flag=True, help='Count the assets without moving them.')
+def archive_command(older_than_days, age, retired, batch_size, dry_run):
+    if age and older_than_days is None:
+        older_than_days = current_app.config['ARCHIVE_AFTER_DAYS']
+    started = time.perf_counter()
+    try:
+        clauses = archive.select_archivable(older_than_days if age else None, retired)
+        result = archive.archive_assets(
+            clauses, batch_size, dry_run=dry_run,
+            progress=lambda done, total: click.echo(f'{done} of {total} assets archived', err=True))
+    except bulk.BulkError as error:
+        raise click.ClickException(str(error))
+    if dry_run:
+        click.echo(f'{result.count} assets would be archived')
+    else:
+        click.echo(f'{result.count} assets archived in {result.batches} batches '
+                   f'in {time.perf_counter() - started:.2f}s')
+
+
+@assets_cli.command('restore')
+@click.option('--id', 'ids', type=int, multiple=True, required=True, help='Archived asset ID, may be given more than once.')
+def restore_command(ids):
+    try:
+        result = archive.restore_assets(ids)
+    except bulk.BulkError as error:
+        raise click.ClickException(str(error))
+    click.echo(f'{result.count} assets restored')
+
+# The following code defines the 'flask jobs' command group for the background job queue in jobs.py. The work command runs a pool of job workers in the foreground until it is stopped with Ctrl+C, for deployments that set JOBS_RUN_IN_PROCESS to false so that jobs are kept out of the web processes, and with --once it runs the jobs that are due one after another and exits, which suits a scheduled task. The list and cancel commands show the most recent jobs and cancel one
+
+jobs_cli = AppGroup('jobs', help='Run and manage background jobs.')
+
+
+@jobs_cli.command('work')
+@click.option('--workers', type=int, help='Worker threads, defaults to JOB_WORKERS.')
+@click.option('--once', is_flag=True, help='Run the jobs that are due, then exit.')
+def work_command(workers, once):
+    app = current_app._get_current_object()
+    if once:
+        click.echo(f'{jobs.run_pending(app)} jobs run')
+        return
+    pool = jobs.JobWorkerPool(app, workers or app.config['JOB_WORKERS'])
+    pool.start()
+    click.echo(f'{pool.size} job workers running, press Ctrl+C to stop')
+    try:
+        while not pool.stopping.wait(1):
+            pass
+    except KeyboardInterrupt:
+        click.echo('Stopping once the running jobs have finished')
+        pool.stop()
+
+
+@jobs_cli.command('list')
+@click.option('--status', type=click.Choice(jobs.JOB_STATUSES), help='Only jobs with this status.')
+@click.option('--limit', type=int, default=20, show_default=True)
+def list_command(status, limit):
+    query = Job.query.order_by(Job.id.desc())
+    if status:
+        query = query.filter(Job.status == status)
+    for job in query.limit(limit):
+        progress = f'{job.progress}/{job.total}' if job.total else str(job.progress)
+        click.echo(f'{job.id:>6}  {job.type:<16} {job.status:<10} {progress:<16} '
+                   f'{job.created_at:%Y-%m-%d %H:%M:%S}  {job.error or job.message or ""}')
+
+
+@jobs_cli.command('cancel')
+@click.argument('job_id', type=int)
+def cancel_command(job_id):
+    if not jobs.cancel_job(job_id):
+        raise click.ClickException(f'Job {job_id} does not exist or has already finished')
+    click.echo(f'Job {job_id} cancelled')
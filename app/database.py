@@ -0,0 +1,73 @@
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# The following code sets up the database engine. The engine_options function sizes the connection pool for each worker process, with a connection for each background job worker (see jobs.py) on top, plus one more for its progress updates in the overflow (and, for server databases such as PostgreSQL, turns on pre-ping and connection recycling) before Flask-SQLAlchemy creates the engine, and init_engine registers a hook that runs the configured PRAGMA statements on every new SQLite connection. WAL journaling lets readers carry on while another worker is writing, synchronous=NORMAL avoids an fsync on every commit (WAL stays consistent after a crash), and the busy timeout makes a writer wait for the lock rather than failing straight away with 'database is locked'. The page cache and memory mapping sizes let each connection keep more of the database in memory, and foreign keys are enforced, which SQLite otherwise leaves switched off, so that the ON DELETE rules on the asset table are applied
+
+JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+# The database_uri function returns the configured database URL, falling back to the SQLite database in the instance folder when none is set. Hosting providers often hand out PostgreSQL URLs starting with 'postgres://', which SQLAlchemy no longer accepts, so these are rewritten to 'postgresql://'
+
+
+def database_uri(configured_uri, instance_path):
+    if not configured_uri:
+        return 'sqlite:///' + os.path.join(instance_path, 'site.db')
+    if configured_uri.startswith('postgres://'):
+        return 'postgresql://' + configured_uri[len('postgres://'):]
+    return configured_uri
+
+
+def engine_options(config):
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+
+    pool_size = config['DB_POOL_SIZE'] + config['JOB_WORKERS']
+    max_overflow = config['DB_MAX_OVERFLOW'] + config['JOB_WORKERS']
+    if url.get_backend_name() == 'sqlite':
+        if url.database not in (None, '', ':memory:'):
+            options.setdefault('pool_size', pool_size)
+            options.setdefault('max_overflow', max_overflow)
+    else:
+        options.setdefault('pool_size', pool_size)
+        options.setdefault('max_overflow', max_overflow)
+        options.setdefault('pool_pre_ping', config['DB_POOL_PRE_PING'])
+        options.setdefault('pool_recycle', config['DB_POOL_RECYCLE'])
+        options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+
+    return options
+
+
+def sqlite_pragmas(config):
+    journal_mode = config['SQLITE_JOURNAL_MODE'].upper()
+    synchronous = config['SQLITE_SYNCHRONOUS'].upper()
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(f'Unsupported SQLITE_JOURNAL_MODE: {journal_mode}')
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f'Unsupported SQLITE_SYNCHRONOUS: {synchronous}')
+
+    return [
+        f'PRAGMA journal_mode={journal_mode}',
+        f'PRAGMA synchronous={synchronous}',
+        f'PRAGMA busy_timeout={int(config["SQLITE_BUSY_TIMEOUT"])}',
+        f'PRAGMA cache_size={int(config["SQLITE_CACHE_SIZE"])}',
+        f'PRAGMA mmap_size={int(config["SQLITE_MMAP_SIZE"])}',
+        'PRAGMA foreign_keys=ON',
+    ]
+
+
+def register_sqlite_pragmas(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def init_engine(app, db):
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        register_sqlite_pragmas(engine, sqlite_pragmas(app.config))
@@ -0,0 +1,88 @@
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import select, update, delete, func
+from app import db
+from app.models import Asset, ArchivedAsset
+from app.lookups import get_choices
+from app import bulk
+
+# The following code deletes customers and manufacturers according to a delete policy, which decides what happens to their assets. 'nullify' keeps the assets with no customer (or manufacturer), 'reassign' moves them to another customer, 'cascade' deletes them as well and 'block' refuses to delete a customer that still has assets. Whatever the number of assets, the policy is carried out with a single UPDATE or DELETE on the asset table (through bulk.py, which also adjusts the dashboard's summary counts) followed by the delete of the customer itself, all in one transaction. The assets are never loaded: the assets relationships use passive_deletes, and the ON DELETE SET NULL rules on the asset table's foreign keys cover anything the policy has not already moved. Archived assets (see archive.py) belong to the customer as much as the assets in use, so the policy is applied to the archived_asset table in the same transaction: they are counted by the preview and by 'block', and moved, emptied or deleted along with the others, so that a restored asset never comes back without its customer
+
+DELETE_POLICIES = ('nullify', 'reassign', 'cascade', 'block')
+
+DeleteResult = namedtuple('DeleteResult', ['policy', 'count', 'target_id'])
+
+DeletePreview = namedtuple('DeletePreview', bulk.BulkResult._fields + ('archived',))
+
+
+class DeletionError(bulk.BulkError):
+    pass
+
+
+class DeletionBlockedError(DeletionError):
+    pass
+
+
+def _selection(record):
+    return getattr(Asset, f'{record.__table__.name}_id') == record.id
+
+
+def _archived_selection(record):
+    return getattr(ArchivedAsset, f'{record.__table__.name}_id') == record.id
+
+
+def _count_archived(record):
+    return db.session.execute(
+        select(func.count()).select_from(ArchivedAsset).where(_archived_selection(record))).scalar()
+
+# The preview_delete function counts the assets that deleting the record would affect, along with how the assets in use are spread across categories and the other lookup, without changing anything. The count includes the archived assets, which are also given on their own
+
+
+def preview_delete(record):
+    preview = bulk.preview_assets(_selection(record))
+    archived = _count_archived(record)
+    return DeletePreview(*preview._replace(count=preview.count + archived), archived)
+
+
+# The validate_policy function checks the delete policy and, for 'reassign', the customer or manufacturer the assets are moved to, and returns the policy to use. It lets a delete that will run as a background job (see jobs.py) be refused straight away rather than when the job runs
+
+
+def validate_policy(record, policy=None, target_id=None):
+    name = record.__table__.name
+    policy = policy or current_app.config['DELETE_POLICY']
+    if policy not in DELETE_POLICIES:
+        raise DeletionError(f"Unknown delete policy '{policy}'")
+    if policy == 'reassign':
+        if target_id is None:
+            raise DeletionError(f'Choose the {name} to move the assets to')
+        if target_id == record.id or target_id not in {id for id, _ in get_choices(name)}:
+            raise DeletionError(f'Unknown {name} {target_id}')
+    return policy
+
+
+def delete_record(record, policy=None, target_id=None):
+    name = record.__table__.name
+    field = f'{name}_id'
+    policy = validate_policy(record, policy, target_id)
+
+    where = _selection(record)
+    archived = _archived_selection(record)
+    if policy == 'reassign':
+        count, _ = bulk.update_selection(where, {field: target_id})
+        count += db.session.execute(
+            update(ArchivedAsset.__table__).where(archived).values(**{field: target_id})).rowcount
+    elif policy == 'nullify':
+        count, _ = bulk.update_selection(where, {field: None})
+        count += db.session.execute(
+            update(ArchivedAsset.__table__).where(archived).values(**{field: None})).rowcount
+    elif policy == 'cascade':
+        count, _ = bulk.delete_selection(where)
+        count += db.session.execute(delete(ArchivedAsset.__table__).where(archived)).rowcount
+    else:
+        count = bulk.preview_assets(where).count + _count_archived(record)
+        if count:
+            raise DeletionBlockedError(f'This {name} still has {count} assets and cannot be deleted')
+
+    db.session.delete(record)
+    db.session.commit()
+    return DeleteResult(policy, count, target_id if policy == 'reassign' else None)
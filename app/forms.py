@@ -1,6 +1,7 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, SelectField, TextAreaField
-from wtforms.validators import DataRequired, Length, EqualTo, ValidationError, Regexp
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import StringField, PasswordField, SubmitField, SelectField, TextAreaField, RadioField, HiddenField, BooleanField
+from wtforms.validators import DataRequired, Length, EqualTo, ValidationError, Regexp, Optional
 from app.models import User
 
 # Lines 9 to 30 utilise the Flask WTForms library to define the class for the registration form that appears on register.html. All three fields of the form (username, password, and confirm password) are validated to ensure that data is present in the username and password fields. It is also checked that the username has a minimum of 3 characters entered and a maximum of 20 characters, and that the confirmed password matches what is entered into the initial password field. It also ensures that passwords contain at least one digit, one lowercase letter, one uppercase letter, and one special character. The validate_username function checks the database to ensure that the username entered is not already present, and if it is, a validation error occurs. The validate_password function checks that the password entered is at least 8 characters long, and if it is not, a validation error occurs
@@ -38,7 +39,7 @@ class LoginForm(FlaskForm):
     password = PasswordField('Password', validators=[DataRequired()])
     submit = SubmitField('Login')
 
-# Lines 44 to 64 utilise the Flask WTForms library to define the class for the asset creation form that appears on assets.html. The category choices are based on the ones defined in the list below, the comments field is a free text field that may or may not require data, whilst the customer and manufacturer fields pull data from the database by finding the ID of the corresponding customer/manufacturer
+# Lines 44 to 64 utilise the Flask WTForms library to define the class for the asset creation form that appears on assets.html. The category choices are based on the ones defined in the list below, the comments field is a free text field that may or may not require data, whilst the customer and manufacturer fields pull data from the database by finding the ID of the corresponding customer/manufacturer. The retired checkbox is only shown when editing an asset, and marks it to be moved to the archive by archive.py
 
 
 class AssetForm(FlaskForm):
@@ -61,8 +62,34 @@ class AssetForm(FlaskForm):
     customer = SelectField('Customer', coerce=int, validators=[DataRequired()])
     manufacturer = SelectField(
         'Manufacturer', coerce=int, validators=[DataRequired()])
+    retired = BooleanField('Retired')
     submit = SubmitField('Create Asset')
 
+# The following code utilises the Flask WTForms library to define the class for the bulk asset import form that appears on import_assets.html. The file field is validated to ensure that a file has been chosen and that it is a CSV or JSON-lines file
+
+
+class AssetImportForm(FlaskForm):
+    file = FileField('File', validators=[
+                     FileRequired(), FileAllowed(['csv', 'jsonl', 'ndjson', 'json'], 'Please upload a .csv or .jsonl file.')])
+    submit = SubmitField('Import Assets')
+
+# The following code utilises the Flask WTForms library to define the class for the bulk edit form that appears on bulk_assets.html. The assets are chosen by a list of IDs and/or by the filter fields, where 'Any' leaves that filter out, and each of the new category, customer and manufacturer fields is only applied when something other than 'Leave unchanged' is chosen. The customer and manufacturer choices are filled in by the route from the cached lookup lists
+
+
+class BulkAssetForm(FlaskForm):
+    ids = StringField('Asset IDs')
+    by_category = SelectField(
+        'Category', choices=[('', 'Any')] + [(choice, choice) for choice in AssetForm.category_choices])
+    by_customer = SelectField('Customer', coerce=int)
+    by_manufacturer = SelectField('Manufacturer', coerce=int)
+    category = SelectField(
+        'New category', choices=[('', 'Leave unchanged')] + [(choice, choice) for choice in AssetForm.category_choices])
+    customer = SelectField('New customer', coerce=int)
+    manufacturer = SelectField('New manufacturer', coerce=int)
+    preview = SubmitField('Count Assets')
+    update = SubmitField('Update Assets')
+    delete = SubmitField('Delete Assets')
+
 # Lines 69 to 71 utilise the Flask WTForms library to define the class for the customer creation form that appears on customers.html. The name field is validated to ensure that data is present before it can be submitted
 
 
@@ -76,3 +103,24 @@ class CustomerForm(FlaskForm):
 class ManufacturerForm(FlaskForm):
     name = StringField('Name', validators=[DataRequired()])
     submit = SubmitField('Add Manufacturer')
+
+# The following code utilises the Flask WTForms library to define the class for the form that appears on delete_record.html when a customer or manufacturer is deleted. The policy field chooses what happens to its assets, and the target field chooses where they are moved to when they are reassigned. Both are optional so that a delete submitted without them uses the configured DELETE_POLICY
+
+
+class DeleteRecordForm(FlaskForm):
+    policy = RadioField('Assets', validators=[Optional()], choices=[
+        ('nullify', 'Keep the assets, with this field left empty'),
+        ('reassign', 'Move the assets to'),
+        ('cascade', 'Delete the assets as well'),
+        ('block', 'Only delete if there are no assets'),
+    ])
+    target = SelectField('Move to', coerce=int, validators=[Optional()])
+    submit = SubmitField('Delete')
+
+# The following code utilises the Flask WTForms library to define the class for the small forms that start and cancel background jobs, on jobs.html, job.html and assets.html. The type field names the job to start (and the format field the file format of an export), and the form is otherwise only there for its CSRF token
+
+
+class JobForm(FlaskForm):
+    type = HiddenField('Type')
+    format = HiddenField('Format')
+    submit = SubmitField('Start')
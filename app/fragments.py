@@ -0,0 +1,137 @@
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+from flask import current_app, has_app_context
+from flask_login import current_user
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models import Asset
+from app import metrics
+
+# The following code caches the rendered HTML of each asset in the asset list (its row and, for admin users, its delete dialog), so that a page of assets which have not changed is put together from stored fragments instead of rendering the asset_row.html macros again for every row. Fragments are kept per application in this process in a least-recently-used cache, keyed by the asset's ID, the part of the page and the user's role, since the delete controls are only shown to admins. Each entry remembers the stamp it was rendered from: the asset's updated_at time, which every edit changes (including the Core statements used by bulk edits), and the names of its customer and manufacturer, so a fragment is rendered again as soon as any of them differ, whichever worker made the change. Edits and deletes committed in this process also drop the asset's fragments straight away. The cache holds at most FRAGMENT_CACHE_MAX_BYTES of HTML, dropping the least recently used fragments beyond that
+
+Fragment = namedtuple('Fragment', ['row', 'modal'])
+
+_Entry = namedtuple('_Entry', ['stamp', 'html', 'size'])
+
+
+class _FragmentCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key, stamp):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry.stamp != stamp:
+                return None
+            self.entries.move_to_end(key)
+            return entry.html
+
+    def put(self, key, stamp, html, max_bytes):
+        size = sys.getsizeof(html)
+        with self.lock:
+            self._remove(key)
+            if size > max_bytes:
+                return
+            self.entries[key] = _Entry(stamp, html, size)
+            self.size += size
+            while self.size > max_bytes:
+                _, entry = self.entries.popitem(last=False)
+                self.size -= entry.size
+
+    def discard(self, asset_ids):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] in asset_ids]:
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+
+def _get_cache(app):
+    return app.extensions.setdefault('fragment_cache', _FragmentCache())
+
+
+def _stamp(asset):
+    return (asset.updated_at,
+            asset.customer.name if asset.customer else None,
+            asset.manufacturer.name if asset.manufacturer else None)
+
+# The asset_fragments function returns a Fragment for each of the given assets, taking the row and delete dialog from the cache where the stored stamp still matches and rendering (and storing) the rest. The number of cache hits and misses is recorded once per page in the fragment_cache_lookups_total metric
+
+
+def asset_fragments(assets):
+    app = current_app._get_current_object()
+    max_bytes = app.config['FRAGMENT_CACHE_MAX_BYTES']
+    role = current_user.role
+    admin = role == 'admin'
+    cache = _get_cache(app)
+    macros = None
+    hits = misses = 0
+
+    fragments = []
+    for asset in assets:
+        stamp = _stamp(asset)
+        parts = []
+        for part in ('row', 'modal'):
+            if part == 'modal' and not admin:
+                parts.append(Markup(''))
+                continue
+            key = (asset.id, part, role)
+            html = cache.get(key, stamp) if max_bytes else None
+            if html is None:
+                if macros is None:
+                    macros = app.jinja_env.get_template('asset_row.html').module
+                html = Markup(macros.row(asset, admin) if part == 'row' else macros.modal(asset))
+                if max_bytes:
+                    cache.put(key, stamp, html, max_bytes)
+                misses += 1
+            else:
+                hits += 1
+            parts.append(html)
+        fragments.append(Fragment(*parts))
+
+    if hits:
+        metrics.inc('fragment_cache_lookups_total', hits, result='hit')
+    if misses:
+        metrics.inc('fragment_cache_lookups_total', misses, result='miss')
+    return fragments
+
+
+def invalidate_assets(app, asset_ids):
+    _get_cache(app).discard(set(asset_ids))
+
+
+def clear_fragments(app):
+    _get_cache(app).clear()
+
+# Edited and deleted assets are collected after each flush and their fragments are dropped once the transaction commits, in the same way as the table versions in versions.py
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_assets(session, flush_context):
+    ids = {obj.id for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, Asset)}
+    if ids:
+        session.info.setdefault('changed_assets', set()).update(ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_assets(session):
+    ids = session.info.pop('changed_assets', None)
+    if ids and has_app_context():
+        invalidate_assets(current_app._get_current_object(), ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_assets(session):
+    session.info.pop('changed_assets', None)
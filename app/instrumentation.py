@@ -0,0 +1,154 @@
+import heapq
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, request
+from sqlalchemy import event
+
+# The following code measures the SQL issued while handling each request. Listeners on the database engine time every statement and pass it to whichever QueryStats collectors are active on the current thread. When SQL_INSTRUMENTATION is enabled, a collector is started for every request, a Server-Timing header reporting the database time, query count and total time is added to the response (browsers show this in their developer tools), and requests that are slower or issue more queries than the configured thresholds are logged together with their slowest statements. The count_queries and assert_max_queries helpers use the same collectors, so tests can fail when a route starts issuing more queries than expected
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class QueryStats:
+    def __init__(self, keep_slowest=5):
+        self.count = 0
+        self.total_time = 0.0
+        self.statements = []
+        self.keep_slowest = keep_slowest
+        self._slowest = []
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.total_time += duration
+        self.statements.append(statement)
+        entry = (duration, self.count, statement)
+        if not self.keep_slowest:
+            return
+        if len(self._slowest) < self.keep_slowest:
+            heapq.heappush(self._slowest, entry)
+        elif entry > self._slowest[0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    @property
+    def slowest(self):
+        return [(duration, statement) for duration, _, statement in sorted(self._slowest, reverse=True)]
+
+
+def _active_collectors():
+    collectors = getattr(_local, 'collectors', None)
+    if collectors is None:
+        collectors = _local.collectors = []
+    return collectors
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active_collectors():
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    collectors = _active_collectors()
+    if not collectors:
+        return
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+    duration = time.perf_counter() - start_times.pop()
+    for collector in collectors:
+        collector.record(statement, duration)
+
+    threshold = getattr(_local, 'slow_query_seconds', None)
+    if threshold is not None and duration > threshold:
+        logger.warning('Slow query (%.1f ms): %s', duration * 1000, statement)
+
+
+def instrument_engine(engine):
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+# The start_collector and stop_collector functions let code that spans several calls, such as a pair of request hooks, collect the queries issued on this thread in between
+
+
+def start_collector(keep_slowest=5):
+    stats = QueryStats(keep_slowest)
+    _active_collectors().append(stats)
+    return stats
+
+
+def stop_collector(stats):
+    collectors = _active_collectors()
+    if stats in collectors:
+        collectors.remove(stats)
+
+
+@contextmanager
+def count_queries(keep_slowest=5):
+    stats = start_collector(keep_slowest)
+    try:
+        yield stats
+    finally:
+        stop_collector(stats)
+
+# The assert_max_queries helper is intended for tests. It counts the queries issued inside the with block and fails with the list of statements if there were more than max_count
+
+
+@contextmanager
+def assert_max_queries(max_count):
+    with count_queries() as stats:
+        yield stats
+    assert stats.count <= max_count, (
+        f'{stats.count} queries issued, expected at most {max_count}:\n' + '\n'.join(stats.statements))
+
+
+def _start_request_stats():
+    if not current_app.config['SQL_INSTRUMENTATION']:
+        return
+    g.request_started = time.perf_counter()
+    g.query_stats = start_collector(current_app.config['SQL_INSTRUMENTATION_SLOWEST'])
+    _local.slow_query_seconds = current_app.config['SLOW_QUERY_MS'] / 1000
+
+
+def _report_request_stats(response):
+    stats = g.pop('query_stats', None)
+    if stats is None:
+        return response
+    _finish_request_stats(stats)
+
+    total_ms = (time.perf_counter() - g.request_started) * 1000
+    db_ms = stats.total_time * 1000
+    response.headers.add(
+        'Server-Timing', f'db;dur={db_ms:.1f};desc="{stats.count} queries"')
+    response.headers.add('Server-Timing', f'total;dur={total_ms:.1f}')
+
+    config = current_app.config
+    if total_ms > config['SLOW_REQUEST_MS'] or stats.count > config['SLOW_REQUEST_QUERIES']:
+        logger.warning(
+            'Slow request %s %s: %.1f ms total, %d queries taking %.1f ms. Slowest: %s',
+            request.method, request.path, total_ms, stats.count, db_ms,
+            '; '.join(f'{duration * 1000:.1f} ms {statement}' for duration, statement in stats.slowest))
+    return response
+
+
+def _finish_request_stats(stats):
+    stop_collector(stats)
+    _local.slow_query_seconds = None
+
+
+def _discard_request_stats(exception=None):
+    stats = g.pop('query_stats', None)
+    if stats is not None:
+        _finish_request_stats(stats)
+
+
+def init_instrumentation(app, db):
+    with app.app_context():
+        instrument_engine(db.engine)
+    app.before_request(_start_request_stats)
+    app.after_request(_report_request_stats)
+    app.teardown_request(_discard_request_stats)
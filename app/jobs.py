@@ -0,0 +1,483 @@
+import logging
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app, g
+from sqlalchemy import select, update, delete, case, and_, func
+from sqlalchemy.exc import SQLAlchemyError
+from app import db, metrics, transfer, bulk, deletion, archive
+from app.models import Asset, ArchivedAsset, Customer, Manufacturer, Job
+from app.search import rebuild_search_index
+from app.summary import rebuild_summary
+
+logger = logging.getLogger(__name__)
+
+# The following code runs long operations, such as large imports and exports, rebuilding the search index and deleting a customer with many assets, as background jobs, so that the request starting one returns straight away with the job's ID instead of holding a gunicorn worker until it times out. Jobs are queued as rows of the job table, so no separate message broker is needed, and are run by a pool of worker threads: either inside each web process (JOBS_RUN_IN_PROCESS, the default) or in a separate 'flask jobs work' process. Each worker claims the oldest job that is due with a single UPDATE ... RETURNING statement, which only one worker can win (on PostgreSQL, FOR UPDATE SKIP LOCKED also stops workers waiting on each other), and runs the handler registered for the job's type with the job's parameters. While it runs, the handler reports its progress, which is also where a request to cancel the job is noticed, and a heartbeat thread keeps the job's heartbeat up to date. A job that fails with an unexpected error is queued again after JOB_RETRY_DELAY seconds, doubled after each attempt, until it has been tried max_attempts times, while a JobError fails it straight away. Running jobs whose heartbeat is older than JOB_STALE_SECONDS have lost their worker (when gunicorn restarts a worker, for example) and are queued again, and finished jobs are removed after JOB_RETENTION_DAYS days along with their files
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+MAINTENANCE_INTERVAL = 60
+
+PROGRESS_INTERVAL = 1.0
+
+JobType = namedtuple('JobType', ['name', 'handler', 'max_attempts', 'admin_only', 'cleanup'])
+
+JOB_TYPES = {}
+
+
+class JobError(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def job_type(name, max_attempts=None, admin_only=False, cleanup=None):
+    def decorator(handler):
+        JOB_TYPES[name] = JobType(name, handler, max_attempts, admin_only, cleanup)
+        return handler
+    return decorator
+
+
+def job_files_directory(app):
+    directory = app.config['JOB_FILES_DIR'] or os.path.join(app.instance_path, 'jobs')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def serialize_job(job):
+    return {
+        'id': job.id, 'type': job.type, 'status': job.status, 'params': job.params,
+        'progress': job.progress, 'total': job.total, 'message': job.message,
+        'result': job.result, 'error': job.error, 'attempts': job.attempts,
+        'max_attempts': job.max_attempts, 'cancel_requested': job.cancel_requested,
+        'user_id': job.user_id,
+        **{name: value.isoformat() if value else None for name, value in (
+            ('created_at', job.created_at), ('started_at', job.started_at),
+            ('finished_at', job.finished_at))},
+    }
+
+# The enqueue function adds a job and commits it, then wakes this process's workers so that the job starts at once rather than at the next poll
+
+
+def enqueue(type, params=None, user_id=None):
+    if type not in JOB_TYPES:
+        raise ValueError(f"Unknown job type '{type}'")
+    max_attempts = JOB_TYPES[type].max_attempts or current_app.config['JOB_MAX_ATTEMPTS']
+    job = Job(type=type, params=params or {}, user_id=user_id, max_attempts=max_attempts)
+    db.session.add(job)
+    db.session.commit()
+    pool = start_workers(current_app._get_current_object())
+    if pool is not None:
+        pool.wake.set()
+    return job
+
+# The queue_delete_record function starts a job to delete a customer or manufacturer that has more than JOB_DELETE_THRESHOLD assets, once the chosen policy has been checked, so that the routes and the API can answer straight away. It returns None for smaller ones, which are deleted within the request
+
+
+def queue_delete_record(record, policy, target_id, user_id):
+    policy = deletion.validate_policy(record, policy, target_id)
+    if policy == 'block' or deletion.preview_delete(record).count <= current_app.config['JOB_DELETE_THRESHOLD']:
+        return None
+    return enqueue('delete_record', {
+        'table': record.__table__.name, 'id': record.id, 'policy': policy, 'target_id': target_id,
+    }, user_id)
+
+# The cancel_job function cancels a queued job straight away and asks a running one to stop, with a single UPDATE so that it cannot race a worker claiming the job. A running job stops the next time its handler reports progress, so work it has already committed (such as the batches of an import) is kept. It returns False if the job had already finished
+
+
+def cancel_job(job_id):
+    now = datetime.utcnow()
+    cancelled = db.session.execute(
+        update(Job.__table__)
+        .where(Job.id == job_id, Job.status.in_(('queued', 'running')))
+        .values(cancel_requested=True,
+                status=case((Job.status == 'queued', 'cancelled'), else_=Job.status),
+                finished_at=case((Job.status == 'queued', now), else_=Job.finished_at))
+    ).rowcount
+    db.session.commit()
+    return bool(cancelled)
+
+# The JobContext is passed to each handler. progress records how far the job has got in a short transaction of its own, so it shows up at once, and is meant to be called between the handler's own transactions. checkpoint instead records the state a retried job should carry on from in the handler's current transaction, so that the state and the work it describes are committed together. Both raise JobCancelled once cancelling the job has been asked for, and progress updates are written at most once every PROGRESS_INTERVAL seconds
+
+
+class JobContext:
+    def __init__(self, job):
+        self.job_id = job.id
+        self.params = job.params
+        self.state = job.state
+        self.attempt = job.attempts
+        self.reported = 0
+
+    def _update(self, connection, values):
+        values['heartbeat_at'] = datetime.utcnow()
+        connection.execute(update(Job.__table__).where(Job.id == self.job_id).values(**values))
+        if connection.execute(select(Job.cancel_requested).where(Job.id == self.job_id)).scalar():
+            raise JobCancelled()
+
+    def _values(self, done, total, message):
+        values = {}
+        if done is not None:
+            values['progress'] = done
+        if total is not None:
+            values['total'] = total
+        if message is not None:
+            values['message'] = message[:200]
+        return values
+
+    def progress(self, done=None, total=None, message=None, force=False):
+        now = time.monotonic()
+        if not force and message is None and now - self.reported < PROGRESS_INTERVAL:
+            return
+        self.reported = now
+        with db.engine.begin() as connection:
+            self._update(connection, self._values(done, total, message))
+
+    def checkpoint(self, state, done=None, total=None, message=None):
+        self.state = state
+        self._update(db.session.connection(), dict(self._values(done, total, message), state=state))
+
+
+def _finish(job_id, worker, values):
+    values.setdefault('worker', None)
+    return db.session.execute(
+        update(Job.__table__)
+        .where(Job.id == job_id, Job.status == 'running', Job.worker == worker)
+        .values(**values)
+    ).rowcount
+
+# The claim_job function takes the next due job for the given worker, or returns None when there is none
+
+
+def claim_job(worker):
+    now = datetime.utcnow()
+    candidate = (
+        select(Job.id)
+        .where(Job.status == 'queued', Job.run_after <= now)
+        .order_by(Job.run_after, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    job_id = db.session.execute(
+        update(Job.__table__)
+        .where(Job.id == candidate, Job.status == 'queued')
+        .values(status='running', worker=worker, attempts=Job.attempts + 1,
+                started_at=now, heartbeat_at=now, error=None)
+        .returning(Job.id)
+    ).scalar()
+    db.session.commit()
+    return job_id
+
+# The run_job function runs a claimed job in an application context of its own. The handler's changes are recorded as made by the user who started the job, in the asset change log (audit.py) as well as in the job itself
+
+
+def run_job(app, job_id, worker):
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        if job is None or job.status != 'running' or job.worker != worker:
+            return
+        name, params, max_attempts = job.type, job.params, job.max_attempts
+        handler = JOB_TYPES.get(name)
+        g.audit_user_id = job.user_id
+        context = JobContext(job)
+        started = time.perf_counter()
+
+        try:
+            if handler is None:
+                raise JobError(f"Unknown job type '{name}'")
+            if job.cancel_requested:
+                raise JobCancelled()
+            result = handler.handler(context, **params)
+        except JobCancelled:
+            db.session.rollback()
+            status = 'cancelled'
+            _finish(job_id, worker, {'status': status, 'finished_at': datetime.utcnow(), 'message': 'Cancelled'})
+        except JobError as error:
+            db.session.rollback()
+            status = 'failed'
+            _finish(job_id, worker, {'status': status, 'finished_at': datetime.utcnow(), 'error': str(error)})
+        except Exception as error:
+            db.session.rollback()
+            logger.exception('Job %s (%s) failed on attempt %s', job_id, name, context.attempt)
+            if context.attempt < max_attempts:
+                status = 'retrying'
+                delay = app.config['JOB_RETRY_DELAY'] * 2 ** (context.attempt - 1)
+                _finish(job_id, worker, {'status': 'queued', 'error': repr(error),
+                                         'run_after': datetime.utcnow() + timedelta(seconds=delay)})
+            else:
+                status = 'failed'
+                _finish(job_id, worker, {'status': status, 'finished_at': datetime.utcnow(), 'error': repr(error)})
+        else:
+            status = 'succeeded'
+            _finish(job_id, worker, {
+                'status': status, 'finished_at': datetime.utcnow(), 'result': result,
+                'progress': case((Job.total.is_not(None), Job.total), else_=Job.progress)})
+        db.session.commit()
+
+        if status in FINISHED_STATUSES and handler and handler.cleanup:
+            handler.cleanup(app, params)
+        duration = time.perf_counter() - started
+        metrics.inc('jobs_total', type=name, status=status)
+        metrics.observe('job_duration_seconds', duration, type=name)
+        logger.info('Job %s (%s) %s after %.1fs', job_id, name, status, duration)
+
+# The run_pending function runs due jobs one after another in the calling thread until none are left (or limit jobs have run), which is what 'flask jobs work --once' and the tests use
+
+
+def run_pending(app, limit=None, worker=None):
+    worker = worker or f'{socket.gethostname()}:{os.getpid()}:once'
+    count = 0
+    while limit is None or count < limit:
+        with app.app_context():
+            requeue_stale_jobs(app)
+            job_id = claim_job(worker)
+        if job_id is None:
+            break
+        run_job(app, job_id, worker)
+        count += 1
+    return count
+
+# The requeue_stale_jobs function queues running jobs whose heartbeat has stopped again, or fails them when they have used up their attempts, and prune_jobs removes finished jobs older than JOB_RETENTION_DAYS along with their files
+
+
+def requeue_stale_jobs(app):
+    now = datetime.utcnow()
+    stale = and_(Job.status == 'running',
+                 Job.heartbeat_at < now - timedelta(seconds=app.config['JOB_STALE_SECONDS']))
+    error = 'The worker running this job stopped'
+    failed = db.session.execute(
+        update(Job.__table__).where(stale, Job.attempts >= Job.max_attempts)
+        .values(status='failed', worker=None, finished_at=now, error=error)).rowcount
+    requeued = db.session.execute(
+        update(Job.__table__).where(stale)
+        .values(status='queued', worker=None, run_after=now, error=error)).rowcount
+    db.session.commit()
+    if failed or requeued:
+        logger.warning('%s stale jobs queued again and %s failed', requeued, failed)
+    return requeued, failed
+
+
+def _job_files(app, job):
+    directory = job_files_directory(app)
+    names = [(job.params or {}).get('upload'), (job.result or {}).get('file')]
+    return [os.path.join(directory, name) for name in names if name]
+
+
+def prune_jobs(app):
+    cutoff = datetime.utcnow() - timedelta(days=app.config['JOB_RETENTION_DAYS'])
+    old = db.session.query(Job).filter(Job.status.in_(FINISHED_STATUSES), Job.finished_at < cutoff).all()
+    for job in old:
+        for path in _job_files(app, job):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    if old:
+        db.session.execute(delete(Job.__table__).where(Job.id.in_([job.id for job in old])))
+    db.session.commit()
+    return len(old)
+
+# The JobWorkerPool class runs JOB_WORKERS worker threads, which each claim and run one job at a time and otherwise sleep for JOB_POLL_INTERVAL seconds or until a job is queued in this process, along with a heartbeat thread for the jobs they are running. One of the workers also looks for stale jobs and removes old ones every MAINTENANCE_INTERVAL seconds
+
+
+class JobWorkerPool:
+    def __init__(self, app, size):
+        self.app = app
+        self.size = size
+        self.pid = os.getpid()
+        self.name = f'{socket.gethostname()}:{self.pid}'
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.running = set()
+        self.threads = []
+        self.maintained = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        for index in range(self.size):
+            self.threads.append(threading.Thread(
+                target=self._work, args=(f'{self.name}:{index}',), name=f'job-worker-{index}', daemon=True))
+        self.threads.append(threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True))
+        for thread in self.threads:
+            thread.start()
+        logger.info('Started %s job workers', self.size)
+
+    def stop(self, timeout=None):
+        self.stopping.set()
+        self.wake.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _maintain(self):
+        with self.lock:
+            if time.monotonic() - self.maintained < MAINTENANCE_INTERVAL:
+                return
+            self.maintained = time.monotonic()
+        requeue_stale_jobs(self.app)
+        prune_jobs(self.app)
+
+    def _work(self, worker):
+        while not self.stopping.is_set():
+            try:
+                with self.app.app_context():
+                    self._maintain()
+                    job_id = claim_job(worker)
+            except SQLAlchemyError:
+                logger.exception('Could not claim a job')
+                job_id = None
+            if job_id is None:
+                self.wake.wait(self.app.config['JOB_POLL_INTERVAL'])
+                self.wake.clear()
+                continue
+            self.running.add(job_id)
+            try:
+                run_job(self.app, job_id, worker)
+            except Exception:
+                logger.exception('Job %s could not be recorded as finished', job_id)
+            finally:
+                self.running.discard(job_id)
+
+    def _heartbeat(self):
+        while not self.stopping.wait(self.app.config['JOB_HEARTBEAT_SECONDS']):
+            running = list(self.running)
+            if not running:
+                continue
+            try:
+                with self.app.app_context():
+                    db.session.execute(
+                        update(Job.__table__).where(Job.id.in_(running), Job.status == 'running')
+                        .values(heartbeat_at=datetime.utcnow()))
+                    db.session.commit()
+            except SQLAlchemyError:
+                logger.exception('Could not record the heartbeat of jobs %s', running)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def start_workers(app):
+    global _pool
+    if not app.config['JOBS_RUN_IN_PROCESS'] or app.config['JOB_WORKERS'] < 1:
+        return None
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = JobWorkerPool(app, app.config['JOB_WORKERS'])
+            _pool.start()
+    return _pool
+
+
+def _start_workers_before_request():
+    if _pool is None or _pool.pid != os.getpid():
+        start_workers(current_app._get_current_object())
+
+
+def init_jobs(app):
+    if app.config['JOBS_RUN_IN_PROCESS']:
+        app.before_request(_start_workers_before_request)
+
+# The following handlers are the job types. Each is called with the job's parameters and returns the job's result, which must be JSON serialisable
+
+
+def _remove_upload(app, params):
+    try:
+        os.remove(os.path.join(job_files_directory(app), params['upload']))
+    except FileNotFoundError:
+        pass
+
+
+@job_type('import_assets', cleanup=_remove_upload)
+def import_assets_job(context, upload, format, filename=None):
+    path = os.path.join(job_files_directory(current_app), upload)
+    if not os.path.exists(path):
+        raise JobError('The uploaded file is no longer available')
+    size = os.path.getsize(path)
+    user_id = db.session.get(Job, context.job_id).user_id
+    context.progress(0, size, f'Importing {filename or upload}')
+
+    with open(path, 'rb') as stream:
+        def checkpoint(state):
+            done = size if stream.closed else min(stream.tell(), size)
+            context.checkpoint(state, done, message=(
+                f"{state['inserted']} assets imported, {state['rejected_count']} rows rejected"))
+
+        try:
+            result = transfer.import_assets(stream, format, user_id, resume=context.state, checkpoint=checkpoint)
+        except transfer.TransferFormatError as error:
+            raise JobError(str(error))
+    return {'inserted': result.inserted, 'rejected_count': result.rejected_count,
+            'rejected': [list(entry) for entry in result.rejected]}
+
+
+@job_type('export_assets')
+def export_assets_job(context, format, archived=False):
+    if format not in transfer.EXPORT_FORMATS:
+        raise JobError(f'Unsupported export format: {format}')
+    model = ArchivedAsset if archived else Asset
+    total = db.session.query(func.count(model.id)).scalar()
+    context.progress(0, total, 'Exporting archived assets' if archived else 'Exporting assets', force=True)
+    name = f"job-{context.job_id}-{'archived-assets' if archived else 'assets'}.{format}"
+    path = os.path.join(job_files_directory(current_app), name)
+    rows = 0
+
+    def progress(written):
+        nonlocal rows
+        rows = written
+        context.progress(written)
+
+    with open(path + '.part', 'w', encoding='utf-8', newline='') as file:
+        for chunk in transfer.generate_export(format, transfer.export_statement(archived), progress=progress):
+            file.write(chunk)
+    os.replace(path + '.part', path)
+    return {'file': name, 'format': format, 'rows': rows}
+
+
+@job_type('delete_record', admin_only=True)
+def delete_record_job(context, table, id, policy=None, target_id=None):
+    model = {'customer': Customer, 'manufacturer': Manufacturer}.get(table)
+    record = db.session.get(model, id) if model else None
+    if record is None:
+        raise JobError(f'{table.capitalize()} {id} no longer exists')
+    context.progress(message=f'Deleting {table} {record.name}')
+    try:
+        result = deletion.delete_record(record, policy, target_id)
+    except bulk.BulkConflictError:
+        raise
+    except bulk.BulkError as error:
+        raise JobError(str(error))
+    return result._asdict()
+
+
+@job_type('rebuild_search', admin_only=True)
+def rebuild_search_job(context):
+    context.progress(message='Rebuilding the search index')
+    with db.engine.begin() as connection:
+        return {'count': rebuild_search_index(connection)}
+
+
+@job_type('rebuild_summary', admin_only=True)
+def rebuild_summary_job(context):
+    context.progress(message='Rebuilding the dashboard counts')
+    with db.engine.begin() as connection:
+        return {'total': rebuild_summary(connection)}
+
+# The archive job moves old and retired assets into the archive with archive.py, reporting its progress after each batch, which is also where cancelling it takes effect. Every batch is committed on its own, so a cancelled or retried job simply leaves the assets archived so far where they are and carries on with the rest
+
+
+@job_type('archive_assets', admin_only=True)
+def archive_assets_job(context, older_than_days=None, retired=True):
+    try:
+        clauses = archive.select_archivable(older_than_days, retired)
+    except archive.ArchiveError as error:
+        raise JobError(str(error))
+    context.progress(0, message='Archiving assets', force=True)
+    result = archive.archive_assets(clauses, progress=lambda done, total: context.progress(
+        done, total, f'{done} of {total} assets archived'))
+    return {'count': result.count, 'batches': result.batches}
@@ -0,0 +1,140 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from flask import g, has_request_context, request
+
+# The following code sets up the application's logging. Every record logged anywhere in the app is put on an in-memory queue by a QueueHandler on the root logger, which only adds the request details to the record and never touches the disk, and a QueueListener thread takes records off the queue and writes them out, so a slow disk never holds up a request. Records are written to the log file as one JSON object per line, including the ID, user and route of the request they were logged during, and an access record with the status code and duration is logged at the end of every request. The log file is rotated by size, or by time if LOG_ROTATE_WHEN is set, and '{pid}' in LOG_FILE is replaced with the process ID so that each gunicorn worker can write and rotate a file of its own
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+access_logger = logging.getLogger('app.access')
+
+_queue_handler = None
+_listener = None
+_config = None
+
+# The RequestContextFilter runs on the thread that logs the record, where the request is still available, and copies the request details onto the record for the listener thread to write. The user is only read if Flask-Login has already loaded them for this request, so logging never issues a query of its own
+
+
+class RequestContextFilter(logging.Filter):
+    def filter(self, record):
+        record.pid = os.getpid()
+        if has_request_context():
+            user = g.get('_login_user')
+            record.request_id = g.get('request_id')
+            record.route = request.endpoint
+            record.method = request.method
+            record.path = request.path
+            record.user = getattr(user, 'username', None)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    fields = ('request_id', 'user', 'route', 'method', 'path', 'status', 'duration_ms', 'pid')
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in self.fields:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        return json.dumps(entry, default=str)
+
+
+def _file_handler(config):
+    filename = config['LOG_FILE'].replace('{pid}', str(os.getpid()))
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if config['LOG_ROTATE_WHEN']:
+        handler = TimedRotatingFileHandler(
+            filename, when=config['LOG_ROTATE_WHEN'], backupCount=config['LOG_BACKUP_COUNT'],
+            encoding='utf-8', delay=True)
+    else:
+        handler = RotatingFileHandler(
+            filename, maxBytes=config['LOG_MAX_BYTES'], backupCount=config['LOG_BACKUP_COUNT'],
+            encoding='utf-8', delay=True)
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def stop_logging():
+    global _queue_handler, _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+
+def start_logging(config):
+    global _queue_handler, _listener, _config
+    stop_logging()
+    _config = config
+
+    handlers = []
+    if config['LOG_FILE']:
+        handlers.append(_file_handler(config))
+    if config['LOG_CONSOLE']:
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+        handlers.append(console)
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = QueueHandler(log_queue)
+    _queue_handler.addFilter(RequestContextFilter())
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(config['LOG_LEVEL'])
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+# A process forked from one that has already started logging (gunicorn's master when the app is preloaded) inherits the queue handler but not the listener thread, so logging is started again in the child, which also gives it a log file named after its own process ID
+
+
+def _restart_in_child():
+    if _config is not None:
+        start_logging(_config)
+
+
+os.register_at_fork(after_in_child=_restart_in_child)
+atexit.register(stop_logging)
+
+
+def _start_request():
+    g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    g.log_started = time.perf_counter()
+
+
+def _log_request(response):
+    started = g.pop('log_started', None)
+    if started is not None:
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+        access_logger.info(
+            '%s %s %s', request.method, request.path, response.status_code,
+            extra={'status': response.status_code,
+                   'duration_ms': round((time.perf_counter() - started) * 1000, 2)})
+    return response
+
+
+def init_logging(app):
+    start_logging({key: app.config[key] for key in (
+        'LOG_LEVEL', 'LOG_FILE', 'LOG_MAX_BYTES', 'LOG_ROTATE_WHEN', 'LOG_BACKUP_COUNT', 'LOG_CONSOLE')})
+    app.before_request(_start_request)
+    if app.config['LOG_ACCESS']:
+        app.after_request(_log_request)
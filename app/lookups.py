@@ -0,0 +1,60 @@
+import threading
+import time
+from collections import namedtuple
+from flask import current_app, has_app_context
+from sqlalchemy import select
+from app import db
+from app.models import Customer, Manufacturer
+from app.versions import tables_changed, get_table_version
+
+# The following code caches the (id, name) pairs used to fill the customer and manufacturer dropdowns on the asset forms. The lists are fetched as plain column tuples rather than full ORM objects and kept per application in this process. A cached list is trusted without touching the database until LOOKUP_CACHE_TTL seconds have passed, after which the stored table version is read and the list is only reloaded if another worker has changed the table. Changes committed in this process clear the cached list immediately through the tables_changed signal
+
+LOOKUP_MODELS = {
+    'customer': Customer,
+    'manufacturer': Manufacturer,
+}
+
+_Entry = namedtuple('_Entry', ['version', 'checked_at', 'choices'])
+
+_lock = threading.Lock()
+
+
+def _get_cache(app):
+    return app.extensions.setdefault('lookup_cache', {})
+
+
+def get_choices(name):
+    app = current_app._get_current_object()
+    cache = _get_cache(app)
+    now = time.monotonic()
+
+    entry = cache.get(name)
+    if entry and now - entry.checked_at < app.config.get('LOOKUP_CACHE_TTL', 5):
+        return entry.choices
+
+    version = get_table_version(db.session, name)
+    if entry and entry.version == version:
+        with _lock:
+            cache[name] = entry._replace(checked_at=now)
+        return entry.choices
+
+    model = LOOKUP_MODELS[name]
+    rows = db.session.execute(
+        select(model.id, model.name).order_by(model.id)).all()
+    choices = [(row.id, row.name) for row in rows]
+    with _lock:
+        cache[name] = _Entry(version, now, choices)
+    return choices
+
+
+def invalidate(app, names):
+    cache = _get_cache(app)
+    with _lock:
+        for name in names:
+            cache.pop(name, None)
+
+
+@tables_changed.connect
+def _invalidate_on_commit(session, names):
+    if has_app_context():
+        invalidate(current_app._get_current_object(), names)
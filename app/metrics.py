@@ -0,0 +1,351 @@
+import glob
+import hmac
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+from flask import Blueprint, Response, current_app, g, request, abort
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import limiter
+from app.instrumentation import start_collector, stop_collector
+
+# The following code records Prometheus metrics and serves them at /metrics: request counts and latency histograms per endpoint, the time spent in database queries, login successes and failures, requests rejected by the rate limiter, and the number of assets, customers and manufacturers created, updated and deleted, and the background jobs run. Every metric sample is a single number stored under a key made of the metric name and its labels. When METRICS_DIR is set, each process keeps its numbers in its own memory-mapped file in that directory, so recording a sample is a dictionary lookup and an in-place write to memory, and a scrape adds up the files of every gunicorn worker, so the totals are correct whichever worker answers it. Without METRICS_DIR the numbers are kept in a dictionary and only cover the process serving the scrape
+
+METRICS = {
+    'http_requests_total': (
+        'counter', 'HTTP requests handled, by endpoint, method and status code.'),
+    'http_request_duration_seconds': (
+        'histogram', 'Time taken to handle HTTP requests, by endpoint.'),
+    'http_request_db_duration_seconds': (
+        'histogram', 'Time spent running database queries per HTTP request, by endpoint.'),
+    'http_request_db_queries_total': (
+        'counter', 'Database queries issued while handling HTTP requests, by endpoint.'),
+    'login_attempts_total': (
+        'counter', 'Login form submissions, by result.'),
+    'rate_limited_requests_total': (
+        'counter', 'Requests rejected by the rate limiter, by endpoint.'),
+    'model_changes_total': (
+        'counter', 'Assets, customers and manufacturers created, updated and deleted.'),
+    'fragment_cache_lookups_total': (
+        'counter', 'Asset list fragments taken from the fragment cache or rendered, by result.'),
+    'jobs_total': (
+        'counter', 'Background jobs run, by type and outcome.'),
+    'job_duration_seconds': (
+        'histogram', 'Time taken to run background jobs, by type.'),
+}
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+TRACKED_MODELS = {'asset', 'customer', 'manufacturer'}
+
+FILE_PREFIX = 'metrics-'
+
+metrics = Blueprint('metrics', __name__)
+
+# The MmapValues class stores one process's samples in a memory-mapped file. The file starts with the number of bytes in use, followed by one entry per key: the length of the key, the key itself padded to a multiple of eight bytes, and the value as an 8-byte float. Only the owning process writes to the file, so other processes can read it at any time, and the file is doubled in size whenever it fills up
+
+
+class MmapValues:
+    initial_size = 64 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            self._file.truncate(self.initial_size)
+            size = self.initial_size
+        self._capacity = size
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._positions = {}
+        self._used = struct.unpack_from('i', self._map, 0)[0]
+        if self._used == 0:
+            self._used = 8
+            struct.pack_into('i', self._map, 0, self._used)
+        for key, _, position in _entries(self._map, self._used):
+            self._positions[key] = position
+
+    def add(self, key, amount):
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None:
+                position = self._append(key)
+            value = struct.unpack_from('d', self._map, position)[0]
+            struct.pack_into('d', self._map, position, value + amount)
+
+    def _append(self, key):
+        encoded = key.encode('utf-8')
+        padding = 8 - (len(encoded) + 4) % 8
+        entry = struct.pack(f'i{len(encoded)}s{padding}xd', len(encoded), encoded, 0.0)
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._map.close()
+            self._file.truncate(self._capacity)
+            self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._map[self._used:self._used + len(entry)] = entry
+        self._used += len(entry)
+        struct.pack_into('i', self._map, 0, self._used)
+        position = self._used - 8
+        self._positions[key] = position
+        return position
+
+    def items(self):
+        with self._lock:
+            return [(key, value) for key, value, _ in _entries(self._map, self._used)]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class MemoryValues:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def add(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+def _entries(data, used):
+    position = 8
+    while position < used:
+        length = struct.unpack_from('i', data, position)[0]
+        key = bytes(data[position + 4:position + 4 + length]).decode('utf-8')
+        position += 4 + length + 8 - (length + 4) % 8
+        yield key, struct.unpack_from('d', data, position)[0], position
+        position += 8
+
+
+def read_values(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(data) < 8:
+        return []
+    used = struct.unpack_from('i', data, 0)[0]
+    return [(key, value) for key, value, _ in _entries(data, min(used, len(data)))]
+
+# The values for the current process are opened lazily and looked up by process ID, so that when gunicorn forks its workers from a master that has already loaded the app, each worker still gets a file of its own
+
+
+_directory = None
+_values = {}
+_values_lock = threading.Lock()
+
+
+def configure(directory):
+    global _directory
+    with _values_lock:
+        _directory = directory or None
+        _values.clear()
+    if _directory:
+        os.makedirs(_directory, exist_ok=True)
+
+
+def _process_values():
+    pid = os.getpid()
+    values = _values.get(pid)
+    if values is None:
+        with _values_lock:
+            values = _values.get(pid)
+            if values is None:
+                _values.clear()
+                if _directory:
+                    values = MmapValues(os.path.join(_directory, f'{FILE_PREFIX}{pid}.db'))
+                else:
+                    values = MemoryValues()
+                _values[pid] = values
+    return values
+
+
+@lru_cache(maxsize=4096)
+def _key(name, labels):
+    return json.dumps([name, labels])
+
+
+def inc(name, amount=1, **labels):
+    _process_values().add(_key(name, tuple(sorted(labels.items()))), amount)
+
+# Histograms only increment the bucket a value falls into, along with the sum and count, and the cumulative bucket counts Prometheus expects are worked out when the metrics are collected
+
+
+def observe(name, value, **labels):
+    labels = tuple(sorted(labels.items()))
+    index = bisect_left(BUCKETS, value)
+    le = str(BUCKETS[index]) if index < len(BUCKETS) else '+Inf'
+    values = _process_values()
+    values.add(_key(name + '_bucket', labels + (('le', le),)), 1)
+    values.add(_key(name + '_sum', labels), value)
+    values.add(_key(name + '_count', labels), 1)
+
+
+def collect():
+    totals = defaultdict(float)
+    if _directory:
+        for path in glob.glob(os.path.join(_directory, f'{FILE_PREFIX}*.db')):
+            try:
+                samples = read_values(path)
+            except FileNotFoundError:
+                continue
+            for key, value in samples:
+                totals[key] += value
+    else:
+        for key, value in _process_values().items():
+            totals[key] += value
+    samples = {}
+    for key, value in totals.items():
+        name, labels = json.loads(key)
+        samples[name, tuple(map(tuple, labels))] = value
+    return samples
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += '{' + ','.join(f'{key}="{_escape(label)}"' for key, label in labels) + '}'
+    return f'{name} {value!r}'
+
+
+def render_metrics(samples):
+    by_name = defaultdict(list)
+    for (name, labels), value in samples.items():
+        by_name[name].append((labels, value))
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for labels, value in sorted(by_name[name]):
+                lines.append(_sample(name, labels, value))
+            continue
+
+        buckets = defaultdict(dict)
+        for labels, value in by_name[name + '_bucket']:
+            buckets[tuple(label for label in labels if label[0] != 'le')][dict(labels)['le']] = value
+        sums = dict(by_name[name + '_sum'])
+        for labels, count in sorted(by_name[name + '_count']):
+            cumulative = 0.0
+            for le in [str(bound) for bound in BUCKETS] + ['+Inf']:
+                cumulative += buckets[labels].get(le, 0.0)
+                lines.append(_sample(name + '_bucket', labels + (('le', le),), cumulative))
+            lines.append(_sample(name + '_sum', labels, sums.get(labels, 0.0)))
+            lines.append(_sample(name + '_count', labels, count))
+    return '\n'.join(lines) + '\n'
+
+# The reset_directory and merge_process functions are called by the gunicorn hooks in gunicorn.conf.py. The directory is emptied when the server starts, and when a worker exits its numbers are added to a single file of retired workers' totals, so the counters keep their values without the directory growing with every worker that gunicorn restarts
+
+
+def reset_directory(directory):
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, f'{FILE_PREFIX}*.db')):
+        os.remove(path)
+
+
+def merge_process(directory, pid):
+    path = os.path.join(directory, f'{FILE_PREFIX}{pid}.db')
+    if not os.path.exists(path):
+        return
+    retired = MmapValues(os.path.join(directory, f'{FILE_PREFIX}retired.db'))
+    try:
+        for key, value in read_values(path):
+            retired.add(key, value)
+    finally:
+        retired.close()
+    os.remove(path)
+
+# The following code records the model_changes_total counter. Objects added, edited and deleted through the session are counted after each flush, and the counts are only recorded once the transaction commits, so changes that are rolled back are not counted. Code that writes rows with Core statements instead, such as the bulk import, reports them through count_model_changes
+
+
+def count_model_changes(session, model, action, count=1):
+    changes = session.info.setdefault('model_changes', defaultdict(int))
+    changes[model, action] += count
+
+
+@event.listens_for(Session, 'after_flush')
+def _count_flushed_changes(session, flush_context):
+    for action, objects in (('create', session.new), ('delete', session.deleted),
+                            ('update', session.dirty)):
+        for obj in objects:
+            name = obj.__table__.name
+            if name not in TRACKED_MODELS:
+                continue
+            if action == 'update' and not session.is_modified(obj, include_collections=False):
+                continue
+            count_model_changes(session, name, action)
+
+
+@event.listens_for(Session, 'after_commit')
+def _record_model_changes(session):
+    changes = session.info.pop('model_changes', None)
+    for (model, action), count in (changes or {}).items():
+        inc('model_changes_total', count, model=model, action=action)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_model_changes(session):
+    session.info.pop('model_changes', None)
+
+# The request hooks time each request and count the queries it issues. The request is recorded in after_request, where the status code is known, or in teardown_request if an unhandled exception meant there was no response
+
+
+def _start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    g.metrics_queries = start_collector(keep_slowest=0)
+
+
+def _record_request(status):
+    started = g.pop('metrics_started', None)
+    queries = g.pop('metrics_queries', None)
+    if started is None:
+        return
+    stop_collector(queries)
+    endpoint = request.endpoint or 'unmatched'
+    inc('http_requests_total', endpoint=endpoint, method=request.method, status=str(status))
+    observe('http_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+    observe('http_request_db_duration_seconds', queries.total_time, endpoint=endpoint)
+    inc('http_request_db_queries_total', queries.count, endpoint=endpoint)
+
+
+def _finish_request_metrics(response):
+    _record_request(response.status_code)
+    return response
+
+
+def _abandon_request_metrics(exception=None):
+    _record_request(500)
+
+
+@metrics.route('/metrics')
+@limiter.exempt
+def scrape():
+    token = current_app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(
+            request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    return Response(render_metrics(collect()), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    if not app.config['METRICS_ENABLED']:
+        return
+    configure(app.config['METRICS_DIR'])
+    app.before_request(_start_request_metrics)
+    app.after_request(_finish_request_metrics)
+    app.teardown_request(_abandon_request_metrics)
+    app.register_blueprint(metrics)
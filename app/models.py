@@ -8,7 +8,7 @@ from flask_login import UserMixin
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(20), unique=True, nullable=False)
-    password = db.Column(db.String(20), nullable=False)
+    password = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(10), nullable=False, default='regular')
     assets = db.relationship('Asset', backref='author', lazy=True)
 
@@ -16,25 +16,60 @@ class User(db.Model, UserMixin):
         return f"User('{self.username}', '{self.role}')"
 
 
+# The Asset class indexes every column that assets are looked up, filtered or sorted by. The composite index on customer_id and timestamp serves both per-customer lookups (including the foreign key checks made when a customer is deleted) and per-customer listings in date order, so customer_id does not need an index of its own. The customer and manufacturer foreign keys are set to NULL by the database itself when their customer or manufacturer is deleted, and passive_deletes on the assets relationships stops SQLAlchemy from loading every asset of a customer or manufacturer being deleted in order to do the same. deletion.py chooses what actually happens to those assets before the delete. An asset marked as retired stays here until archive.py moves it to the archive, and the partial index on retired assets lets the archive find them without reading the rest of the table. On SQLite, AUTOINCREMENT stops the IDs of assets moved to the archive from being given to new assets
+
+
 class Asset(db.Model):
+    __table_args__ = (
+        db.Index('ix_asset_customer_id_timestamp', 'customer_id', 'timestamp'),
+        db.Index('ix_asset_retired', 'id', sqlite_where=db.text('retired = 1'),
+                 postgresql_where=db.text('retired')),
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    category = db.Column(db.String(100), nullable=False)
+    category = db.Column(db.String(100), nullable=False, index=True)
     comments = db.Column(db.Text, nullable=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    customer_id = db.Column(
-        db.Integer, db.ForeignKey('customer.id'), nullable=True)
-    manufacturer_id = db.Column(
-        db.Integer, db.ForeignKey('manufacturer.id'), nullable=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey(
+        'user.id'), nullable=False, index=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey(
+        'customer.id', name='fk_asset_customer', ondelete='SET NULL'), nullable=True)
+    manufacturer_id = db.Column(db.Integer, db.ForeignKey(
+        'manufacturer.id', name='fk_asset_manufacturer', ondelete='SET NULL'), nullable=True, index=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    retired = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
 
     def __repr__(self):
         return f"Asset('{self.category}', '{self.timestamp}')"
 
 
+# The ArchivedAsset class holds the assets moved out of the asset table by archive.py, either because they are older than ARCHIVE_AFTER_DAYS or because they were retired, so that the asset table and its indexes only hold the assets in use. Each archived asset keeps its ID and every value it had, along with the time it was archived, and can be moved back unchanged. The customer and manufacturer foreign keys are set to NULL on delete as they are for assets, and are indexed for the foreign key checks made when a customer or manufacturer is deleted
+
+
+class ArchivedAsset(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    category = db.Column(db.String(100), nullable=False)
+    comments = db.Column(db.Text, nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey(
+        'user.id', name='fk_archived_asset_user'), nullable=False, index=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey(
+        'customer.id', name='fk_archived_asset_customer', ondelete='SET NULL'), nullable=True, index=True)
+    manufacturer_id = db.Column(db.Integer, db.ForeignKey(
+        'manufacturer.id', name='fk_archived_asset_manufacturer', ondelete='SET NULL'), nullable=True, index=True)
+    timestamp = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)
+    retired = db.Column(db.Boolean, nullable=False, default=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"ArchivedAsset('{self.category}', '{self.timestamp}')"
+
+
 class Customer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    assets = db.relationship('Asset', backref='customer', lazy=True)
+    assets = db.relationship('Asset', backref='customer', lazy=True, passive_deletes=True)
 
     def __repr__(self):
         return f"Customer('{self.name}')"
@@ -43,12 +78,91 @@ class Customer(db.Model):
 class Manufacturer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    assets = db.relationship('Asset', backref='manufacturer', lazy=True)
+    assets = db.relationship('Asset', backref='manufacturer', lazy=True, passive_deletes=True)
 
     def __repr__(self):
         return f"Manufacturer('{self.name}')"
 
 
+# The TableVersion class holds a version number for each table whose contents are cached by the application. Whenever rows in one of those tables are created, edited or deleted, the version is incremented in the same transaction, which lets every gunicorn worker tell whether its own cached copy is still current with a single primary key lookup. The time of the last change is kept as well, for the Last-Modified headers of the pages listing those tables
+
+
+class TableVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"TableVersion('{self.name}', '{self.version}')"
+
+
+# The AssetSummary class holds the number of assets for each customer, manufacturer, category and month (the dimension), so that the dashboard can show the totals without counting the asset table. The value column holds the customer or manufacturer ID, the category or the month as 'YYYY-MM', with an empty string for assets that have no customer or manufacturer. The counts are kept up to date in the same transaction as each change to the assets by summary.py
+
+
+class AssetSummary(db.Model):
+    dimension = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"AssetSummary('{self.dimension}', '{self.value}', '{self.count}')"
+
+
+# The AssetChange class is the append-only change log of the asset register. Every asset created, edited or deleted adds a row, in the same transaction as the change itself, recording the action, the fields involved (the values of a new or deleted asset, or the old and new value of each edited field), the user who made the change and when. The ID is the change's sequence number, which only ever grows (on SQLite, AUTOINCREMENT stops the IDs of removed rows from being used again), and the rows also become visible in the order of their IDs (SQLite has one writer at a time, and on PostgreSQL audit.py holds an advisory lock from a transaction's first change until it commits), so a client can ask for every change after the last sequence number it has seen without missing one committed late. The rows are written by audit.py. Since assets can be deleted, asset_id is not a foreign key
+
+
+class AssetChange(db.Model):
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    asset_id = db.Column(db.Integer, nullable=False, index=True)
+    action = db.Column(db.String(10), nullable=False)
+    changes = db.Column(db.JSON, nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"AssetChange('{self.id}', '{self.action}', '{self.asset_id}')"
+
+
+# The Job class is the queue of background jobs run by jobs.py, such as large imports and exports. Each job has a type, the parameters its handler is called with and a status ('queued', 'running', 'succeeded', 'failed' or 'cancelled'), along with its progress, the result or error it finished with, how many times it has been tried and whether cancelling it has been asked for. A queued job is run once run_after has passed, which is how retries are delayed, and a running job records the worker running it and a regular heartbeat, so a job whose worker has stopped can be found and queued again. state holds whatever a job has saved to carry on from where it was if it is retried. The index on status and run_after serves the query each worker uses to claim the next job
+
+
+class Job(db.Model):
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    params = db.Column(db.JSON, nullable=False)
+    state = db.Column(db.JSON, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    message = db.Column(db.String(200), nullable=True)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=1)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    worker = db.Column(db.String(100), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey(
+        'user.id', name='fk_job_user', ondelete='SET NULL'), nullable=True, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"Job('{self.id}', '{self.type}', '{self.status}')"
+
+
+# The user loader is called by Flask-Login on every request from a logged in user, and reads the user from the cache in users.py, which only queries the database when the user is not cached
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    from app.users import get_cached_user
+    return get_cached_user(int(user_id))
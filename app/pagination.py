@@ -0,0 +1,66 @@
+import base64
+from collections import namedtuple
+
+from flask import current_app, request
+
+# The following code provides keyset (cursor) pagination for list pages and endpoints. Rather than using OFFSET, which forces the database to walk past every skipped row and so gets slower the deeper a user pages, each page is fetched by asking for the rows whose ID is strictly below (older) or above (newer) the ID at the edge of the current page. The ID column is the primary key, so every page is an index range scan and costs the same no matter how large the table grows. Because asset IDs are handed out in creation order, ordering by ID newest first matches ordering by the creation timestamp
+
+Page = namedtuple('Page', ['items', 'per_page', 'next_cursor', 'prev_cursor'])
+
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(str(value).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+# The get_per_page function reads the requested page size from the query string, falling back to the configured default and never allowing more than the configured maximum so that a single request cannot ask for the whole table
+
+
+def get_per_page(default_key='PER_PAGE'):
+    default = current_app.config.get(default_key, 50)
+    maximum = current_app.config.get('MAX_PER_PAGE', 200)
+    per_page = request.args.get('per_page', default, type=int)
+    return max(1, min(per_page, maximum))
+
+# The keyset_paginate function takes a query and the key column it should be ordered by and returns a Page. The 'after' cursor moves to older rows and the 'before' cursor moves back to newer rows. One extra row is fetched to find out whether a further page exists without needing a separate COUNT query
+
+
+def keyset_paginate(query, key_column, per_page, after=None, before=None):
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before)
+
+    if before_key is not None:
+        rows = query.filter(key_column > before_key).order_by(
+            key_column.asc()).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_prev, has_next = has_more, True
+    else:
+        if after_key is not None:
+            query = query.filter(key_column < after_key)
+        rows = query.order_by(key_column.desc()).limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_prev, has_next = after_key is not None, len(rows) > per_page
+
+    next_cursor = prev_cursor = None
+    if items:
+        if has_next:
+            next_cursor = encode_cursor(_key_of(items[-1], key_column))
+        if has_prev:
+            prev_cursor = encode_cursor(_key_of(items[0], key_column))
+
+    return Page(items, per_page, next_cursor, prev_cursor)
+
+
+def _key_of(item, key_column):
+    if hasattr(item, '_mapping'):
+        return item._mapping[key_column.key]
+    return getattr(item, key_column.key)
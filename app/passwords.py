@@ -0,0 +1,31 @@
+from functools import lru_cache
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# The following code hashes and checks user passwords with the method set by PASSWORD_HASH_METHOD, which is passed straight to Werkzeug, for example 'scrypt:32768:8:1' (scrypt with its n, r and p cost parameters) or 'pbkdf2:sha256:600000' (PBKDF2 with its hash function and iteration count). Werkzeug stores the method and its parameters at the start of each hash, so existing hashes keep working when the setting changes, and check_password upgrades a user's hash to the current setting the next time they log in successfully, which is the only time the plain-text password is available
+
+SALT_LENGTH = 16
+
+
+def hash_password(password):
+    return generate_password_hash(
+        password, method=current_app.config['PASSWORD_HASH_METHOD'], salt_length=SALT_LENGTH)
+
+# Werkzeug fills in the default parameters for a method given without them (so 'scrypt' is written as 'scrypt:32768:8:1'), and the simplest way to get exactly the prefix it writes is to hash an empty password once, which is cached for each method
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    return generate_password_hash('', method=method, salt_length=1).split('$', 1)[0]
+
+
+def needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != _method_prefix(current_app.config['PASSWORD_HASH_METHOD'])
+
+
+def check_password(user, password):
+    if not check_password_hash(user.password, password):
+        return False
+    if needs_rehash(user.password):
+        user.password = hash_password(password)
+    return True
@@ -0,0 +1,231 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from flask import current_app, g, request
+from flask_login import current_user
+from app.instrumentation import start_collector, stop_collector
+from app.users import is_admin
+
+logger = logging.getLogger(__name__)
+
+# The following code profiles individual requests, to find out where a slow page spends its time (in SQL, rendering templates, validating forms or hashing passwords, for example). Profiling is switched on with PROFILING_ENABLED, and while it is off no hooks are registered at all, so it costs nothing. Once it is on, an admin user can profile a single request by adding '?profile=1' to its URL or sending an 'X-Profile: 1' header ('cprofile' or 'sample' instead of 1 choose the profiler), and a random PROFILE_SAMPLE_RATE fraction of all requests is profiled with PROFILE_MODE. Every other request only pays for one header lookup and, when sampling, one random number. The profiling hooks are registered first in create_app, so the profiler is started before any other request hook and stopped after all of them (Flask runs the after_request and teardown hooks in the reverse order), and two kinds are available:
+#
+#   cprofile  Python's deterministic profiler, saved as a .pstats file that can be opened with pstats, snakeviz or 'flameprof'. It records every function call, which makes the request itself run noticeably slower
+#   sample    a background thread records the request thread's stack every PROFILE_SAMPLE_INTERVAL_MS milliseconds, saved as collapsed stacks (a .folded file of 'outer;inner;leaf count' lines) that flamegraph.pl, speedscope or inferno turn straight into a flame graph. It barely slows the request down, but misses anything shorter than the interval
+#
+# Each profile is saved in PROFILE_DIR (instance/profiles by default) together with a .json file describing the request (its path, status, total time and the time and number of its database queries), and only the newest PROFILE_KEEP profiles are kept. The admin profiles page lists them
+
+PROFILE_MODES = {'cprofile': '.pstats', 'sample': '.folded'}
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+class _StackSampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def profile_directory(app):
+    return app.config['PROFILE_DIR'] or os.path.join(app.instance_path, 'profiles')
+
+# The _requested_mode function decides whether the current request should be profiled and with which profiler. Only admin users can ask for a profile, checked against the database like the other admin-only actions, and requests for static files are never sampled
+
+
+def _requested_mode():
+    config = current_app.config
+    value = request.headers.get('X-Profile') or request.args.get('profile')
+    if value:
+        value = value.lower()
+        mode = value if value in PROFILE_MODES else config['PROFILE_MODE'] if value in TRUE_VALUES else None
+        if mode and current_user.is_authenticated and current_user.role == 'admin' and is_admin():
+            return mode, False
+    rate = config['PROFILE_SAMPLE_RATE']
+    if rate and request.endpoint != 'static' and random.random() < rate:
+        return config['PROFILE_MODE'], True
+    return None
+
+
+def _start_profile():
+    requested = _requested_mode()
+    if requested is None:
+        return
+    mode, sampled = requested
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return
+    else:
+        profiler = _StackSampler(threading.get_ident(), current_app.config['PROFILE_SAMPLE_INTERVAL_MS'] / 1000)
+        profiler.start()
+    g.profile = {'mode': mode, 'sampled': sampled, 'profiler': profiler,
+                 'queries': start_collector(), 'started': time.perf_counter()}
+
+
+def _record_status(response):
+    profile = g.get('profile')
+    if profile is not None:
+        profile['status'] = response.status_code
+    return response
+
+
+def _finish_profile(exception=None):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    profiler = profile['profiler']
+    if profile['mode'] == 'cprofile':
+        profiler.disable()
+    else:
+        profiler.stop()
+    duration = time.perf_counter() - profile['started']
+    queries = profile['queries']
+    stop_collector(queries)
+
+    try:
+        save_profile(current_app._get_current_object(), profile, duration, queries)
+    except OSError:
+        logger.exception('Could not save the profile of %s %s', request.method, request.path)
+
+# The save_profile function writes the profile and its description, named after the time it was taken so that the newest sort last, and then removes the oldest profiles beyond PROFILE_KEEP
+
+
+def save_profile(app, profile, duration, queries):
+    directory = profile_directory(app)
+    os.makedirs(directory, exist_ok=True)
+    name = f'{datetime.utcnow():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}'
+    path = os.path.join(directory, name + PROFILE_MODES[profile['mode']])
+
+    if profile['mode'] == 'cprofile':
+        profile['profiler'].dump_stats(path)
+        samples = None
+    else:
+        stacks = profile['profiler'].stacks
+        with open(path, 'w') as file:
+            for stack, count in sorted(stacks.items()):
+                file.write(f'{stack} {count}\n')
+        samples = sum(stacks.values())
+
+    info = {
+        'name': name,
+        'file': os.path.basename(path),
+        'mode': profile['mode'],
+        'sampled': profile['sampled'],
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': profile.get('status', 500),
+        'user': current_user.username if current_user.is_authenticated else None,
+        'created': datetime.utcnow().isoformat(timespec='seconds'),
+        'duration_ms': round(duration * 1000, 1),
+        'db_ms': round(queries.total_time * 1000, 1),
+        'queries': queries.count,
+        'samples': samples,
+    }
+    with open(os.path.join(directory, name + '.json'), 'w') as file:
+        json.dump(info, file)
+
+    _prune(directory, app.config['PROFILE_KEEP'])
+    return info
+
+
+def _prune(directory, keep):
+    names = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+    for name in names[:-keep] if keep else names:
+        for extension in ('.json',) + tuple(PROFILE_MODES.values()):
+            try:
+                os.remove(os.path.join(directory, name + extension))
+            except FileNotFoundError:
+                pass
+
+# The list_profiles, profile_info and read_profile functions are used by the admin profiles page. read_profile returns a profile's description along with a text summary: the functions with the most cumulative time for a cProfile profile, or the functions most often found running (at the top of the stack) and most often on the stack at all for a sampled one
+
+
+def list_profiles(app, limit=100):
+    directory = profile_directory(app)
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted((name for name in os.listdir(directory) if name.endswith('.json')), reverse=True)[:limit]:
+        try:
+            with open(os.path.join(directory, name)) as file:
+                profiles.append(json.load(file))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def profile_info(app, name):
+    if os.path.basename(name) != name:
+        return None
+    try:
+        with open(os.path.join(profile_directory(app), name + '.json')) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def read_profile(app, name, lines=30):
+    info = profile_info(app, name)
+    if info is None:
+        return None
+
+    path = os.path.join(profile_directory(app), info['file'])
+    if info['mode'] == 'cprofile':
+        output = io.StringIO()
+        pstats.Stats(path, stream=output).sort_stats('cumulative').print_stats(lines)
+        return info, output.getvalue()
+
+    running = Counter()
+    on_stack = Counter()
+    with open(path) as file:
+        for line in file:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            frames = stack.split(';')
+            running[frames[-1]] += int(count)
+            for frame in set(frames):
+                on_stack[frame] += int(count)
+    total = sum(running.values()) or 1
+    summary = [f'{total} samples', '', 'Running (self):']
+    summary += [f'{count / total:7.1%}  {frame}' for frame, count in running.most_common(lines)]
+    summary += ['', 'On the stack (total):']
+    summary += [f'{count / total:7.1%}  {frame}' for frame, count in on_stack.most_common(lines)]
+    return info, '\n'.join(summary)
+
+
+def init_profiling(app):
+    if not app.config['PROFILING_ENABLED']:
+        return
+    app.before_request(_start_profile)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_profile)
@@ -0,0 +1,144 @@
+import os
+import sqlite3
+import threading
+import time
+from flask import current_app
+from limits.storage import Storage, MovingWindowSupport
+
+# The following code provides a rate limit storage backend for Flask-Limiter that keeps its counters in a small SQLite database file, so that every gunicorn worker on the machine shares the same counters (the login limit is then really five attempts a minute rather than five per worker), the counters survive a restart, and no separate service such as Redis is needed. Importing this module registers the 'sqlite' scheme with the limits library, so the backend is chosen by setting RATELIMIT_STORAGE_URI to, for example, sqlite:////var/lib/assetsapp/ratelimits.db (four slashes for an absolute path). It supports both the fixed window strategy, with one counter row per key, and the moving window strategy, which records a row per hit and counts the hits within the window. Every check is a single statement or an immediate transaction, so two workers can never both take the last hit in a window
+
+
+class SQLiteStorage(Storage, MovingWindowSupport):
+    STORAGE_SCHEME = ['sqlite']
+
+    schema = [
+        """CREATE TABLE IF NOT EXISTS counters (
+            key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires REAL NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS events (
+            key TEXT NOT NULL, at REAL NOT NULL, expires REAL NOT NULL)""",
+        'CREATE INDEX IF NOT EXISTS ix_events_key_at ON events (key, at)',
+        'CREATE INDEX IF NOT EXISTS ix_events_expires ON events (expires)',
+    ]
+
+    purge_interval = 60
+
+    def __init__(self, uri, wrap_exceptions=False, timeout=10, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri.split('://', 1)[1][1:]
+        self.timeout = float(timeout)
+        self._local = threading.local()
+        self._next_purge = 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            for statement in self.schema:
+                connection.execute(statement)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    # Each thread of each process gets a connection of its own, opened in autocommit mode so that transactions are only started explicitly. Losing the last few hits in a power cut does not matter for rate limiting, so writes are not synced to disk
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _purge(self, connection, now):
+        if now >= self._next_purge:
+            self._next_purge = now + self.purge_interval
+            connection.execute('DELETE FROM counters WHERE expires <= ?', (now,))
+            connection.execute('DELETE FROM events WHERE expires <= ?', (now,))
+
+    def incr(self, key, expiry, amount=1, **kwargs):
+        now = time.time()
+        connection = self._connection()
+        self._purge(connection, now)
+        return connection.execute(
+            """INSERT INTO counters (key, count, expires) VALUES (:key, :amount, :expires)
+            ON CONFLICT (key) DO UPDATE SET
+                count = CASE WHEN expires <= :now THEN :amount ELSE count + :amount END,
+                expires = CASE WHEN expires <= :now THEN :expires ELSE expires END
+            RETURNING count""",
+            {'key': key, 'amount': amount, 'expires': now + expiry, 'now': now}).fetchone()[0]
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT count FROM counters WHERE key = ? AND expires > ?', (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self._connection().execute(
+            'SELECT expires FROM counters WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self):
+        try:
+            self._connection().execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        connection = self._connection()
+        with connection:
+            count = connection.execute('DELETE FROM counters').rowcount
+            count += connection.execute('DELETE FROM events').rowcount
+        return count
+
+    def clear(self, key):
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM counters WHERE key = ?', (key,))
+            connection.execute('DELETE FROM events WHERE key = ?', (key,))
+
+    # BEGIN IMMEDIATE takes the database's write lock before the hits in the window are counted, so the count cannot change between checking it and recording the new hit
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        connection = self._connection()
+        self._purge(connection, now)
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            count = connection.execute(
+                'SELECT COUNT(*) FROM events WHERE key = ? AND at > ?',
+                (key, now - expiry)).fetchone()[0]
+            if count + amount > limit:
+                connection.execute('ROLLBACK')
+                return False
+            connection.executemany(
+                'INSERT INTO events (key, at, expires) VALUES (?, ?, ?)',
+                [(key, now, now + expiry)] * amount)
+            connection.execute('COMMIT')
+            return True
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def get_moving_window(self, key, limit, expiry):
+        now = time.time()
+        oldest, count = self._connection().execute(
+            'SELECT MIN(at), COUNT(*) FROM events WHERE key = ? AND at > ?',
+            (key, now - expiry)).fetchone()
+        return (oldest if count else now), count
+
+# The storage_uri function returns the configured rate limit storage URL, falling back to a SQLite file next to the application's database in the instance folder
+
+
+def storage_uri(configured_uri, instance_path):
+    return configured_uri or 'sqlite:///' + os.path.join(instance_path, 'ratelimits.db')
+
+# Limits are given to Flask-Limiter as functions that read the app's config, so that each route's limit can be changed through the environment without editing the code
+
+
+def configured_limit(name):
+    return lambda: current_app.config[name]
@@ -1,10 +1,27 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, Flask
+import os
+import uuid
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, Flask, Response, stream_with_context, abort, send_from_directory
 from flask_login import login_user, login_required, current_user, logout_user
 from flask_wtf.csrf import CSRFProtect
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import joinedload
 from app import db, limiter
-from app.models import User, Asset, Customer, Manufacturer
-from app.forms import RegistrationForm, LoginForm, AssetForm, CustomerForm, ManufacturerForm
+from app.models import User, Asset, Customer, Manufacturer, Job
+from app.forms import RegistrationForm, LoginForm, AssetForm, CustomerForm, ManufacturerForm, AssetImportForm, BulkAssetForm, DeleteRecordForm, JobForm
+from app.pagination import keyset_paginate, get_per_page
+from app.lookups import get_choices
+from app import transfer
+from app import bulk
+from app import deletion
+from app.search import search_assets
+from app import metrics
+from app.passwords import hash_password, check_password
+from app.ratelimits import configured_limit
+from app.users import is_admin, invalidate_user
+from app.summary import get_summary
+from app.caching import conditional
+from app.fragments import asset_fragments
+from app.profiling import list_profiles, profile_info, read_profile, profile_directory
+from app import jobs
 import logging
 
 main = Blueprint('main', __name__)
@@ -13,12 +30,10 @@ main = Blueprint('main', __name__)
 app = Flask(__name__)
 csrf = CSRFProtect(app)
 
-logging.basicConfig(filename='app.log', level=logging.INFO)
-logging.getLogger().addHandler(logging.StreamHandler())
-
 
 @main.errorhandler(429)
 def ratelimit_handler(e):
+    metrics.inc('rate_limited_requests_total', endpoint=request.endpoint)
     form = LoginForm()
     flash("Too many requests, you have been locked out for one minute.", 'danger')
     return render_template('login.html', form=form), 429
@@ -36,10 +51,11 @@ def index():
     return render_template('index.html')
 
 
-# Lines 42 to 74 ensure that when the register.html page is accessed, the registration form is retrieved. When the user submits the form, validation takes place to query the User class and check the database to make sure a user cannot register with a username that has already been used, and if that username does already exist then a warning message will display to ask the user to choose a different one. It will also check to make sure that the user doesn't use the same information in the username and password fields, if they do then a warning message will display saying that the data in these fields must be different. Another check follows to ensure that the data entered into the password and confirm password fields is the same, if it doesn't then the user will be informed that the information must match. Following this, the password chosen is hashed using the Werkzeug library's scrypt method to encrypt the password within the database so that it is not stored in plain text. Then, the user is automatically set as a regular user so that they can perform CRU (Create, Read, Update) operations, but not CRUD (Create, Read, Update, Delete) operations, which are reserved for admin users. The new user's data is committed to the database, and they are redirected to the login page where a flash message informs them that registration was successful
+# Lines 42 to 74 ensure that when the register.html page is accessed, the registration form is retrieved. When the user submits the form, validation takes place to query the User class and check the database to make sure a user cannot register with a username that has already been used, and if that username does already exist then a warning message will display to ask the user to choose a different one. It will also check to make sure that the user doesn't use the same information in the username and password fields, if they do then a warning message will display saying that the data in these fields must be different. Another check follows to ensure that the data entered into the password and confirm password fields is the same, if it doesn't then the user will be informed that the information must match. Following this, the password chosen is hashed with the method set by PASSWORD_HASH_METHOD (see passwords.py) to protect the password within the database so that it is not stored in plain text. Then, the user is automatically set as a regular user so that they can perform CRU (Create, Read, Update) operations, but not CRUD (Create, Read, Update, Delete) operations, which are reserved for admin users. The new user's data is committed to the database, and they are redirected to the login page where a flash message informs them that registration was successful
 
 
 @main.route('/register', methods=['GET', 'POST'])
+@limiter.limit(configured_limit('REGISTER_RATE_LIMIT'), methods=['POST'])
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
@@ -55,8 +71,7 @@ def register():
         elif form.password.data != form.confirm_password.data:
             flash('Password and confirm password must match.', 'danger')
         else:
-            hashed_password = generate_password_hash(
-                form.password.data, method='scrypt')
+            hashed_password = hash_password(form.password.data)
             new_user = User(username=form.username.data,
                             password=hashed_password, role='regular')
             db.session.add(new_user)
@@ -74,21 +89,24 @@ def register():
     return render_template('register.html', form=form)
 
 
-# Lines 80 to 99 ensure that when the register.html page is accessed, the login form is retrieved. When the user attempts to login with their details, validation takes place to check that the username and hashed password match an entry in the user table within the database. If an incorrect username or password is entered amd submitted, they will be unable to login and will see a flash message informing them that their details are incorrect. If the username and password are correct and a match, the user is redirected to the homepage and informed of their successful login
+# Lines 80 to 99 ensure that when the register.html page is accessed, the login form is retrieved. When the user attempts to login with their details, validation takes place to check that the username and hashed password match an entry in the user table within the database. If an incorrect username or password is entered amd submitted, they will be unable to login and will see a flash message informing them that their details are incorrect. If the username and password are correct and a match, the user is redirected to the homepage and informed of their successful login, and if their password was hashed with older settings than PASSWORD_HASH_METHOD, the hash is replaced with one using the current settings
 
 
 @main.route('/login', methods=['GET', 'POST'])
-@limiter.limit("5/minute", key_func=lambda: request.remote_addr)
+@limiter.limit(configured_limit('LOGIN_RATE_LIMIT'), key_func=lambda: request.remote_addr, methods=['POST'])
 def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user and check_password_hash(user.password, form.password.data):
+        if user and check_password(user, form.password.data):
+            db.session.commit()
             login_user(user)
+            metrics.inc('login_attempts_total', result='success')
             flash('Successfully logged in', 'success')
             logging.info('User logged in successfully: %s', form.username.data)
             return redirect(url_for('main.index'))
         else:
+            metrics.inc('login_attempts_total', result='failure')
             flash('Invalid username or password', 'danger')
             logging.warning(
                 'Invalid login attempt with username: %s', form.username.data)
@@ -99,30 +117,31 @@ def login():
     return render_template('login.html', form=form)
 
 
-# Lines 105 to 112 ensure that the user is redirected to logout.html when they click on the logout button, upon which they will encounter a dialog box asking if they want to confirm or cancel the logout action. If they confirm the action, the user will be logged out of the application and redirected to the homepage, upon which they will see a flashed message informing them of their successful logout
+# Lines 105 to 112 ensure that the user is redirected to logout.html when they click on the logout button, upon which they will encounter a dialog box asking if they want to confirm or cancel the logout action. If they confirm the action, the user's cached details are removed, the user will be logged out of the application and redirected to the homepage, upon which they will see a flashed message informing them of their successful logout
 
 
 @main.route('/logout', methods=['GET', 'POST'])
 @login_required
 def logout():
     if request.method == 'POST':
+        invalidate_user(current_app._get_current_object(), current_user.id)
         logout_user()
         flash('Successfully logged out', 'success')
         return redirect(url_for('main.index'))
     return render_template('logout.html')
 
 
-# Lines 118 to 137 ensure that when the assets.html page is accessed, the assets form is retrieved. Validation takes place on submission to check that the data in each field matches the database model, and if it does, the new record is committed to the database and a flashed message appears to inform the user of the successful submission
+# Lines 118 to 137 ensure that when the assets.html page is accessed, the assets form is retrieved. Validation takes place on submission to check that the data in each field matches the database model, and if it does, the new record is committed to the database and a flashed message appears to inform the user of the successful submission. The customer and manufacturer dropdowns are filled from the cached lookup lists in lookups.py, so they normally cost no queries at all. The asset list is paginated with keyset cursors ('after' for older assets and 'before' for newer ones), and the customer and manufacturer of each asset are joined into the same query so that rendering the page does not issue a separate query per row. The conditional decorator from caching.py answers a repeat visit with 304 Not Modified, without running the query or the template, unless an asset, customer or manufacturer has changed since, and otherwise each asset's row is taken from the fragment cache in fragments.py when the asset has not changed since it was last rendered
 
 
 @main.route('/assets', methods=['GET', 'POST'])
 @login_required
+@conditional('asset', 'customer', 'manufacturer')
 def assets():
     form = AssetForm()
 
-    form.manufacturer.choices = [(m.id, m.name)
-                                 for m in Manufacturer.query.all()]
-    form.customer.choices = [(c.id, c.name) for c in Customer.query.all()]
+    form.manufacturer.choices = get_choices('manufacturer')
+    form.customer.choices = get_choices('customer')
 
     if form.validate_on_submit():
         new_asset = Asset(category=form.category.data, comments=form.comments.data, user_id=current_user.id,
@@ -133,11 +152,98 @@ def assets():
         logging.info('New asset created by user: %s', current_user.username)
         return redirect(url_for('main.assets'))
 
-    assets = Asset.query.all()
-    return render_template('assets.html', form=form, assets=assets)
+    query = Asset.query.options(joinedload(Asset.customer),
+                                joinedload(Asset.manufacturer))
+    page = keyset_paginate(query, Asset.id, get_per_page('ASSETS_PER_PAGE'),
+                           after=request.args.get('after'), before=request.args.get('before'))
+    return render_template('assets.html', form=form, fragments=asset_fragments(page.items), page=page,
+                           job_form=JobForm())
+
+
+# The asset import route directs the user to the import_assets.html page, where a CSV or JSON-lines file of assets can be uploaded. The file is streamed through the bulk importer in transfer.py, which inserts valid rows in batches, and the page then shows how many assets were created along with the line number and reason for each rejected row. Files larger than JOB_IMPORT_THRESHOLD_BYTES are saved and imported by a background job instead (see jobs.py), and the user is sent to the job's page, which shows its progress and then the same results
+
+
+def _upload_size(upload):
+    upload.stream.seek(0, os.SEEK_END)
+    size = upload.stream.tell()
+    upload.stream.seek(0)
+    return size
+
+
+def _queue_import(upload, fmt):
+    name = f'upload-{uuid.uuid4().hex}.{fmt}'
+    upload.save(os.path.join(jobs.job_files_directory(current_app), name))
+    return jobs.enqueue('import_assets', {'upload': name, 'format': fmt, 'filename': upload.filename},
+                        current_user.id)
+
+
+@main.route('/assets/import', methods=['GET', 'POST'])
+@login_required
+def import_assets():
+    form = AssetImportForm()
+    result = None
+
+    if form.validate_on_submit():
+        upload = form.file.data
+        try:
+            fmt = transfer.detect_format(upload.filename)
+            if _upload_size(upload) > current_app.config['JOB_IMPORT_THRESHOLD_BYTES']:
+                job = _queue_import(upload, fmt)
+                flash(f'{upload.filename} is being imported in the background', 'info')
+                logging.info('Asset import job %s started by user: %s', job.id, current_user.username)
+                return redirect(url_for('main.job', job_id=job.id))
+            result = transfer.import_assets(upload.stream, fmt, current_user.id)
+        except transfer.TransferFormatError as error:
+            flash(str(error), 'danger')
+        else:
+            flash(f'{result.inserted} assets imported, {result.rejected_count} rows rejected',
+                  'success' if not result.rejected_count else 'warning')
+            logging.info('%s assets imported by user: %s',
+                         result.inserted, current_user.username)
+
+    for _, errors in form.errors.items():
+        for error in errors:
+            flash(error, 'danger')
+
+    return render_template('import_assets.html', form=form, result=result)
+
+
+# The asset export route streams the whole asset register, including the customer, manufacturer and author of each asset, as a CSV or JSON-lines download chosen through the 'format' query parameter, or with 'archived=1', the archived assets. The file is generated a chunk at a time as it is sent, so the download starts straight away and large registers are never held in memory
+
+
+@main.route('/assets/export')
+@login_required
+def export_assets():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in transfer.EXPORT_FORMATS:
+        abort(400)
+    archived = request.args.get('archived') == '1'
 
+    logging.info('%s exported by user: %s', 'Archived assets' if archived else 'Assets', current_user.username)
+    filename = f"{'archived-assets' if archived else 'assets'}.{fmt}"
+    return Response(stream_with_context(transfer.generate_export(fmt, transfer.export_statement(archived))),
+                    mimetype=transfer.EXPORT_MIMETYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
-# The asset edit route (lines 143 to 175) directs the user to the edit_asset.html page and prepopulates the fields with the data that forms the selected record retrieved from the database. Validation again takes place upon submission, and the user is redirected back to the assets page and informed of the successful edited submission
+
+# The background export route starts a job that writes the same export to a file, for registers too large to download within a single request, and sends the user to the job's page, where the file can be downloaded once it is ready
+
+
+@main.route('/assets/export/job', methods=['POST'])
+@login_required
+def export_assets_job():
+    form = JobForm()
+    if not form.validate_on_submit() or form.format.data not in transfer.EXPORT_FORMATS:
+        abort(400)
+    params = {'format': form.format.data}
+    if request.form.get('archived') == '1':
+        params['archived'] = True
+    job = jobs.enqueue('export_assets', params, current_user.id)
+    logging.info('Asset export job %s started by user: %s', job.id, current_user.username)
+    return redirect(url_for('main.job', job_id=job.id))
+
+
+# The asset edit route (lines 143 to 175) directs the user to the edit_asset.html page and prepopulates the fields with the data that forms the selected record retrieved from the database. As on the assets page, the customer and manufacturer dropdowns are filled from the cached lookup lists in lookups.py. Validation again takes place upon submission, and the user is redirected back to the assets page and informed of the successful edited submission
 
 
 @main.route('/assets/<int:asset_id>/edit', methods=['GET', 'POST'])
@@ -147,10 +253,8 @@ def edit_asset(asset_id):
 
     form = AssetForm()
 
-    form.customer.choices = [(customer.id, customer.name)
-                             for customer in Customer.query.all()]
-    form.manufacturer.choices = [(manufacturer.id, manufacturer.name)
-                                 for manufacturer in Manufacturer.query.all()]
+    form.customer.choices = get_choices('customer')
+    form.manufacturer.choices = get_choices('manufacturer')
 
     if request.method == 'POST':
         if form.validate_on_submit():
@@ -158,6 +262,7 @@ def edit_asset(asset_id):
             asset.comments = form.comments.data
             asset.customer_id = form.customer.data
             asset.manufacturer_id = form.manufacturer.data
+            asset.retired = form.retired.data
             db.session.commit()
             flash('Asset updated', 'success')
             logging.info('Asset updated by user: %s', current_user.username)
@@ -171,6 +276,7 @@ def edit_asset(asset_id):
         form.comments.data = asset.comments
         form.customer.data = asset.customer_id
         form.manufacturer.data = asset.manufacturer_id
+        form.retired.data = asset.retired
 
     return render_template('edit_asset.html', form=form, asset=asset)
 
@@ -183,7 +289,7 @@ def edit_asset(asset_id):
 def delete_asset(asset_id):
     asset = Asset.query.get_or_404(asset_id)
 
-    if current_user.role == 'admin':
+    if is_admin():
         db.session.delete(asset)
         db.session.commit()
         flash('Asset deleted', 'success')
@@ -196,11 +302,86 @@ def delete_asset(asset_id):
     return redirect(url_for('main.assets'))
 
 
-# Lines 202 to 216 ensure that when the customers.html page is accessed, the customers form is retrieved. Validation takes place on submission to check that the data in each field matches the database model, and if it does, the new record is committed to the database and a flashed message appears to inform the user of the successful submission
+# The bulk asset route directs the user to the bulk_assets.html page, where many assets can be counted, edited or deleted at once. The assets are chosen by the IDs ticked on the assets page (which are passed in the 'ids' query parameter), by filters, or by both, and each change is made with a single statement in one transaction by bulk.py. As with single assets, only admin users can delete, and the page shows how many assets were affected along with how they were spread across categories, customers and manufacturers
+
+
+@main.route('/assets/bulk', methods=['GET', 'POST'])
+@login_required
+def bulk_assets():
+    form = BulkAssetForm()
+    customers = get_choices('customer')
+    manufacturers = get_choices('manufacturer')
+    form.by_customer.choices = [(0, 'Any')] + customers
+    form.by_manufacturer.choices = [(0, 'Any')] + manufacturers
+    form.customer.choices = [(0, 'Leave unchanged')] + customers
+    form.manufacturer.choices = [(0, 'Leave unchanged')] + manufacturers
+    result = None
+
+    if request.method == 'GET' and request.args.getlist('ids'):
+        form.ids.data = ', '.join(request.args.getlist('ids'))
+
+    if form.validate_on_submit():
+        try:
+            where = bulk.select_assets(form.ids.data, form.by_customer.data or None,
+                                       form.by_manufacturer.data or None, form.by_category.data)
+            if form.delete.data and not is_admin():
+                flash('You do not have permission to delete these assets.', 'warning')
+                logging.warning(
+                    'User attempted to bulk delete assets without permission: %s', current_user.username)
+            elif form.delete.data:
+                result = bulk.delete_assets(where)
+                flash(f'{result.count} assets deleted', 'success')
+                logging.info('%s assets deleted by user: %s', result.count, current_user.username)
+            elif form.update.data:
+                result = bulk.update_assets(where, {'category': form.category.data,
+                                                    'customer_id': form.customer.data or None,
+                                                    'manufacturer_id': form.manufacturer.data or None})
+                flash(f'{result.count} assets updated', 'success')
+                logging.info('%s assets updated by user: %s', result.count, current_user.username)
+            else:
+                result = bulk.preview_assets(where)
+                flash(f'{result.count} assets match', 'success')
+        except bulk.BulkError as error:
+            flash(str(error), 'danger')
+
+    for _, errors in form.errors.items():
+        for error in errors:
+            flash(error, 'danger')
+
+    names = {'customer': dict(customers), 'manufacturer': dict(manufacturers)}
+    return render_template('bulk_assets.html', form=form, result=result, names=names)
+
+
+# The dashboard route shows the number of assets for each customer, manufacturer, category and month, read from the summary counts kept up to date by summary.py rather than counted from the asset table, and is answered with 304 Not Modified when no asset, customer or manufacturer has changed since the browser last loaded it
+
+
+@main.route('/dashboard')
+@login_required
+@conditional('asset', 'customer', 'manufacturer')
+def dashboard():
+    return render_template('dashboard.html', summary=get_summary())
+
+# The search route looks up assets whose comments, category, customer name or manufacturer name contain every word of the search text, using the full-text index in search.py, and shows the best matches first one page at a time. With 'archived=1' it searches the archived assets instead
+
+
+@main.route('/search')
+@login_required
+def search():
+    query = request.args.get('q', '').strip()
+    archived = request.args.get('archived') == '1'
+    page_number = max(request.args.get('page', 1, type=int), 1)
+    results = None
+    if query:
+        results = search_assets(query, page_number, get_per_page('SEARCH_PER_PAGE'), archived=archived)
+    return render_template('search.html', query=query, results=results, archived=archived)
+
+
+# Lines 202 to 216 ensure that when the customers.html page is accessed, the customers form is retrieved. Validation takes place on submission to check that the data in each field matches the database model, and if it does, the new record is committed to the database and a flashed message appears to inform the user of the successful submission. As on the assets page, a repeat visit is answered with 304 Not Modified when no customer has changed since
 
 
 @main.route('/customers', methods=['GET', 'POST'])
 @login_required
+@conditional('customer')
 def customers():
     customer_form = CustomerForm()
 
@@ -242,32 +423,57 @@ def edit_customer(customer_id):
     return render_template('edit_customer.html', customer=customer, customer_form=customer_form)
 
 
-# If the user logged in is marked as an admin within the database, the customer delete route (lines 248 to 263) ensures that a dialog box appears that asks the user if they want to confirm deletion of the customer selected or cancel the action which, if confirmed, removes the record from the database and informs the user that deletion was successful. If the user logged in is marked as a regular user within the database, however, then a flashed message appears informing the user that they do not have permission to delete customers
+# The _delete_record function is shared by the customer and manufacturer delete routes. On a GET request it shows delete_record.html, which previews how many assets the customer or manufacturer has and asks what should happen to them: keeping them with the field left empty, moving them to another customer or manufacturer, deleting them too, or refusing the delete if there are any. If the user logged in is marked as an admin within the database, submitting the form carries out the chosen policy with deletion.py, which changes all of the assets with a single statement in the same transaction as the delete, and informs the user how many assets were affected, or for a customer or manufacturer with more than JOB_DELETE_THRESHOLD assets, starts a background job to do so and shows its page. If the user logged in is marked as a regular user within the database, however, then a flashed message appears informing the user that they do not have permission to delete customers or manufacturers
+
 
+def _delete_record(record, list_endpoint):
+    name = record.__table__.name
+    form = DeleteRecordForm()
+    form.target.choices = [(id, label) for id, label in get_choices(name) if id != record.id]
 
-@main.route('/delete_customer/<int:customer_id>', methods=['POST'])
+    if request.method == 'POST':
+        if not is_admin():
+            flash(f'You do not have permission to delete this {name}.', 'warning')
+            logging.warning(
+                'User attempted to delete %s without permission: %s', name, current_user.username)
+            return redirect(url_for(list_endpoint))
+        if form.validate_on_submit():
+            try:
+                job = jobs.queue_delete_record(record, form.policy.data, form.target.data, current_user.id)
+                if job is not None:
+                    flash(f'{name.capitalize()} {record.name} is being deleted in the background', 'info')
+                    logging.info('%s delete job %s started by user: %s',
+                                 name.capitalize(), job.id, current_user.username)
+                    return redirect(url_for('main.job', job_id=job.id))
+                result = deletion.delete_record(record, form.policy.data, form.target.data)
+            except bulk.BulkError as error:
+                flash(str(error), 'danger')
+            else:
+                flash(f'{name.capitalize()} deleted ({result.count} assets affected)', 'success')
+                logging.info('%s deleted by user: %s', name.capitalize(), current_user.username)
+                return redirect(url_for(list_endpoint))
+
+    if form.policy.data is None:
+        form.policy.data = current_app.config['DELETE_POLICY']
+    preview = deletion.preview_delete(record)
+    names = {'customer': dict(get_choices('customer')), 'manufacturer': dict(get_choices('manufacturer'))}
+    return render_template('delete_record.html', form=form, record=record, name=name,
+                           preview=preview, names=names, list_endpoint=list_endpoint)
+
+
+@main.route('/delete_customer/<int:customer_id>', methods=['GET', 'POST'])
 @login_required
 def delete_customer(customer_id):
     customer = Customer.query.get_or_404(customer_id)
+    return _delete_record(customer, 'main.customers')
 
-    if current_user.role == 'admin':
-        db.session.delete(customer)
-        db.session.commit()
-        flash('Customer deleted', 'success')
-        logging.info('Customer deleted by user: %s', current_user.username)
-    else:
-        flash('You do not have permission to delete this customer.', 'warning')
-        logging.warning(
-            'User attempted to delete customer without permission: %s', current_user.username)
-
-    return redirect(url_for('main.customers'))
 
-
-# Lines 269 to 284 ensure that when the manufacturers.html page is accessed, the manufacturers form is retrieved. Validation takes place on submission to check that the data in each field matches the database model, and if it does, the new record is committed to the database and a flashed message appears to inform the user of the successful submission
+# Lines 269 to 284 ensure that when the manufacturers.html page is accessed, the manufacturers form is retrieved. Validation takes place on submission to check that the data in each field matches the database model, and if it does, the new record is committed to the database and a flashed message appears to inform the user of the successful submission. As on the assets page, a repeat visit is answered with 304 Not Modified when no manufacturer has changed since
 
 
 @main.route('/manufacturers', methods=['GET', 'POST'])
 @login_required
+@conditional('manufacturer')
 def manufacturers():
     manufacturer_form = ManufacturerForm()
 
@@ -309,22 +515,119 @@ def edit_manufacturer(manufacturer_id):
     return render_template('edit_manufacturer.html', manufacturer=manufacturer, manufacturer_form=manufacturer_form)
 
 
-# If the user logged in is marked as an admin within the database, the manufacturer delete route (lines 315 to 330) ensures that a dialog box appears that asks the user if they want to confirm deletion of the manufacturer selected or cancel the action which, if confirmed, removes the record from the database and informs the user that deletion was successful. If the user logged in is marked as a regular user within the database, however, then a flashed message appears informing the user that they do not have permission to delete manufacturers
+# The manufacturer delete route works in the same way as the customer delete route, through _delete_record
 
 
-@main.route('/delete_manufacturer/<int:manufacturer_id>', methods=['POST'])
+@main.route('/delete_manufacturer/<int:manufacturer_id>', methods=['GET', 'POST'])
 @login_required
 def delete_manufacturer(manufacturer_id):
     manufacturer = Manufacturer.query.get_or_404(manufacturer_id)
+    return _delete_record(manufacturer, 'main.manufacturers')
 
-    if current_user.role == 'admin':
-        db.session.delete(manufacturer)
-        db.session.commit()
-        flash('Manufacturer deleted', 'success')
-        logging.info('Manufacturer deleted by user: %s', current_user.username)
-    else:
-        flash('You do not have permission to delete this manufacturer.', 'warning')
-        logging.warning(
-            'User attempted to delete manufacturer without permission: %s', current_user.username)
 
-    return redirect(url_for('main.manufacturers'))
+# The profile routes are only available when PROFILING_ENABLED is set, and only to users marked as an admin within the database. The profiles page lists the most recent request profiles saved by profiling.py, newest first, with the time each request took and how much of it was spent in database queries, and each profile can be viewed as a text summary of where the time went or downloaded to be opened in a profile viewer or turned into a flame graph
+
+
+def _profiles_allowed():
+    if not current_app.config['PROFILING_ENABLED']:
+        abort(404)
+    if is_admin():
+        return True
+    flash('You do not have permission to view profiles.', 'warning')
+    logging.warning('User attempted to view profiles without permission: %s', current_user.username)
+    return False
+
+
+@main.route('/admin/profiles')
+@login_required
+def profiles():
+    if not _profiles_allowed():
+        return redirect(url_for('main.assets'))
+    return render_template('profiles.html', profiles=list_profiles(current_app))
+
+
+@main.route('/admin/profiles/<name>')
+@login_required
+def profile(name):
+    if not _profiles_allowed():
+        return redirect(url_for('main.assets'))
+    result = read_profile(current_app, name)
+    if result is None:
+        abort(404)
+    info, summary = result
+    return render_template('profile.html', info=info, summary=summary)
+
+
+@main.route('/admin/profiles/<name>/download')
+@login_required
+def download_profile(name):
+    if not _profiles_allowed():
+        return redirect(url_for('main.assets'))
+    info = profile_info(current_app, name)
+    if info is None:
+        abort(404)
+    return send_from_directory(profile_directory(current_app), info['file'], as_attachment=True)
+
+
+# The job routes show the background jobs run by jobs.py. The jobs page lists the most recent jobs of the user logged in (or of every user, for admin users), and lets admin users rebuild the search index or the dashboard counts, or archive the assets older than ARCHIVE_AFTER_DAYS and those marked as retired, in the background. Each job's page shows its progress, reloading itself every few seconds until the job has finished, followed by its result: the rows rejected by an import, the number of assets affected by a delete or a link to download an export. A job can be cancelled from its page by the user who started it or by an admin user. Other users' jobs are not found
+
+
+def _get_job(job_id):
+    job = db.get_or_404(Job, job_id)
+    if job.user_id != current_user.id and not is_admin():
+        abort(404)
+    return job
+
+
+@main.route('/jobs', methods=['GET', 'POST'])
+@login_required
+def jobs_page():
+    form = JobForm()
+    if form.validate_on_submit():
+        job_type = jobs.JOB_TYPES.get(form.type.data)
+        if job_type is None or job_type.name not in ('rebuild_search', 'rebuild_summary', 'archive_assets'):
+            abort(400)
+        if not is_admin():
+            flash('You do not have permission to start this job.', 'warning')
+            logging.warning('User attempted to start a %s job without permission: %s',
+                            job_type.name, current_user.username)
+            return redirect(url_for('main.jobs_page'))
+        params = {'older_than_days': current_app.config['ARCHIVE_AFTER_DAYS']} if job_type.name == 'archive_assets' else {}
+        job = jobs.enqueue(job_type.name, params, current_user.id)
+        logging.info('%s job %s started by user: %s', job_type.name, job.id, current_user.username)
+        return redirect(url_for('main.job', job_id=job.id))
+
+    query = db.session.query(Job, User.username).outerjoin(User, Job.user_id == User.id).order_by(Job.id.desc())
+    if current_user.role != 'admin' or not is_admin():
+        query = query.filter(Job.user_id == current_user.id)
+    return render_template('jobs.html', jobs=query.limit(50).all(), form=form)
+
+
+@main.route('/jobs/<int:job_id>')
+@login_required
+def job(job_id):
+    return render_template('job.html', job=_get_job(job_id), form=JobForm(),
+                           finished=jobs.FINISHED_STATUSES)
+
+
+@main.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    job = _get_job(job_id)
+    if JobForm().validate_on_submit():
+        if jobs.cancel_job(job.id):
+            flash('The job has been cancelled', 'success')
+            logging.info('Job %s cancelled by user: %s', job.id, current_user.username)
+        else:
+            flash('The job has already finished', 'warning')
+    return redirect(url_for('main.job', job_id=job.id))
+
+
+@main.route('/jobs/<int:job_id>/download')
+@login_required
+def download_job(job_id):
+    job = _get_job(job_id)
+    if job.status != 'succeeded' or not (job.result or {}).get('file'):
+        abort(404)
+    return send_from_directory(jobs.job_files_directory(current_app), job.result['file'], as_attachment=True,
+                               download_name=f"assets.{job.result['format']}")
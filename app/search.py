@@ -0,0 +1,162 @@
+import re
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import event, text, func, or_, select, table, column, literal_column
+from app import db
+from app.models import Asset, ArchivedAsset, Customer, Manufacturer
+
+# The following code provides full-text search over assets. On SQLite, an FTS5 virtual table called asset_fts holds a copy of each asset's comments and category along with its customer and manufacturer names, using the asset ID as its row ID, with extra indexes on two and three character prefixes so that the prefix searches used for partial words stay fast. Triggers on the asset, customer and manufacturer tables keep it in step with every insert, edit and delete (including bulk imports and changes made by foreign key actions), so the index never has to be updated by application code. Archived assets (see archive.py) have a second FTS5 table, archived_asset_fts, kept in step with the archived_asset table in the same way. Results are ranked with FTS5's built-in bm25 ranking. Other databases fall back to a case-insensitive LIKE search across the same columns, ordered newest first
+
+FTS_TABLE = 'asset_fts'
+
+ARCHIVE_FTS_TABLE = 'archived_asset_fts'
+
+# The _search_index_ddl, _drop_search_index_ddl and _rebuild_search_index_sql functions give the statements for the FTS5 table of a table of assets, which is either asset (asset_fts) or archived_asset (archived_asset_fts), since archived assets have a search index of their own. The triggers on the asset table keep their original names
+
+
+def _search_index_ddl(fts, source):
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+        comments, category, customer, manufacturer, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_{source}_insert AFTER INSERT ON {source} BEGIN
+        INSERT INTO {fts} (rowid, comments, category, customer, manufacturer) VALUES (
+            new.id, new.comments, new.category,
+            (SELECT name FROM customer WHERE id = new.customer_id),
+            (SELECT name FROM manufacturer WHERE id = new.manufacturer_id));
+    END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_{source}_update
+        AFTER UPDATE OF comments, category, customer_id, manufacturer_id ON {source} BEGIN
+        DELETE FROM {fts} WHERE rowid = old.id;
+        INSERT INTO {fts} (rowid, comments, category, customer, manufacturer) VALUES (
+            new.id, new.comments, new.category,
+            (SELECT name FROM customer WHERE id = new.customer_id),
+            (SELECT name FROM manufacturer WHERE id = new.manufacturer_id));
+    END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_{source}_delete AFTER DELETE ON {source} BEGIN
+        DELETE FROM {fts} WHERE rowid = old.id;
+    END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_customer_update AFTER UPDATE OF name ON customer BEGIN
+        UPDATE {fts} SET customer = new.name
+        WHERE rowid IN (SELECT id FROM {source} WHERE customer_id = new.id);
+    END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_manufacturer_update AFTER UPDATE OF name ON manufacturer BEGIN
+        UPDATE {fts} SET manufacturer = new.name
+        WHERE rowid IN (SELECT id FROM {source} WHERE manufacturer_id = new.id);
+    END""",
+    ]
+
+
+def _drop_search_index_ddl(fts, source):
+    return [
+        f'DROP TRIGGER IF EXISTS {fts}_manufacturer_update',
+        f'DROP TRIGGER IF EXISTS {fts}_customer_update',
+        f'DROP TRIGGER IF EXISTS {fts}_{source}_delete',
+        f'DROP TRIGGER IF EXISTS {fts}_{source}_update',
+        f'DROP TRIGGER IF EXISTS {fts}_{source}_insert',
+        f'DROP TABLE IF EXISTS {fts}',
+    ]
+
+
+def _rebuild_search_index_sql(fts, source):
+    return [
+        f'DELETE FROM {fts}',
+        f"""INSERT INTO {fts} (rowid, comments, category, customer, manufacturer)
+        SELECT {source}.id, {source}.comments, {source}.category, customer.name, manufacturer.name
+        FROM {source}
+        LEFT OUTER JOIN customer ON customer.id = {source}.customer_id
+        LEFT OUTER JOIN manufacturer ON manufacturer.id = {source}.manufacturer_id""",
+        f"INSERT INTO {fts} ({fts}) VALUES ('optimize')",
+    ]
+
+
+SEARCH_INDEX_DDL = _search_index_ddl(FTS_TABLE, 'asset') + _search_index_ddl(ARCHIVE_FTS_TABLE, 'archived_asset')
+
+DROP_SEARCH_INDEX_DDL = (_drop_search_index_ddl(ARCHIVE_FTS_TABLE, 'archived_asset')
+                         + _drop_search_index_ddl(FTS_TABLE, 'asset'))
+
+REBUILD_SEARCH_INDEX_SQL = (_rebuild_search_index_sql(FTS_TABLE, 'asset')
+                            + _rebuild_search_index_sql(ARCHIVE_FTS_TABLE, 'archived_asset'))
+
+SearchPage = namedtuple('SearchPage', ['items', 'page', 'per_page', 'has_next'])
+
+
+def uses_fts(connection):
+    return connection.dialect.name == 'sqlite'
+
+
+def create_search_index(connection):
+    if uses_fts(connection):
+        for statement in SEARCH_INDEX_DDL:
+            connection.execute(text(statement))
+
+
+def rebuild_search_index(connection):
+    if not uses_fts(connection):
+        return 0
+    create_search_index(connection)
+    for statement in REBUILD_SEARCH_INDEX_SQL:
+        connection.execute(text(statement))
+    return connection.execute(text(
+        f'SELECT (SELECT COUNT(*) FROM {FTS_TABLE}) + (SELECT COUNT(*) FROM {ARCHIVE_FTS_TABLE})')).scalar()
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_index(target, connection, **kw):
+    create_search_index(connection)
+
+# The include_name function stops Alembic's autogenerate from treating the FTS5 tables and the shadow tables SQLite creates for them as tables that should be dropped, since they are not part of the models
+
+
+def include_name(name, type_, parent_names):
+    return not (type_ == 'table' and name.startswith((FTS_TABLE, ARCHIVE_FTS_TABLE)))
+
+# The _match_count function counts how many assets match a search, stopping as soon as it passes the given limit. Ranking results means scoring every matching row, so a search that matches more than SEARCH_RANK_LIMIT assets (a very common word, for example) is shown newest first instead, which the index can return without scoring anything
+
+
+def _match_count(fts, match, limit):
+    matches = select(fts.c.rowid).select_from(fts).where(match).limit(limit + 1).subquery()
+    return db.session.execute(select(func.count()).select_from(matches)).scalar()
+
+# The fts_query function turns what the user typed into a safe FTS5 query: each word becomes a quoted prefix term, so punctuation and FTS5 operators in the input cannot cause syntax errors, and every term has to match for an asset to be returned
+
+
+def fts_query(query):
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+# The search_assets function searches the assets in use, or with archived set, the archive, which has the same columns and a search index of its own
+
+
+def search_assets(query, page=1, per_page=20, rank_limit=None, archived=False):
+    rank_limit = rank_limit or current_app.config['SEARCH_RANK_LIMIT']
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return SearchPage([], page, per_page, False)
+
+    model, fts_table = (ArchivedAsset, ARCHIVE_FTS_TABLE) if archived else (Asset, FTS_TABLE)
+    statement = (
+        select(model.id, model.category, model.comments,
+               Customer.name.label('customer'), Manufacturer.name.label('manufacturer'))
+        .select_from(model)
+        .outerjoin(Customer, model.customer_id == Customer.id)
+        .outerjoin(Manufacturer, model.manufacturer_id == Manufacturer.id)
+    )
+
+    if uses_fts(db.session.connection()):
+        fts = table(fts_table, column('rowid'), column('rank'))
+        match = literal_column(fts_table).op('MATCH')(fts_query(query))
+        statement = statement.join(fts, fts.c.rowid == model.id).where(match)
+        if _match_count(fts, match, rank_limit) > rank_limit:
+            statement = statement.order_by(fts.c.rowid.desc())
+        else:
+            statement = statement.order_by(fts.c.rank, fts.c.rowid.desc())
+    else:
+        statement = statement.where(*[
+            or_(model.comments.ilike(f'%{term}%'), model.category.ilike(f'%{term}%'),
+                Customer.name.ilike(f'%{term}%'), Manufacturer.name.ilike(f'%{term}%'))
+            for term in terms]).order_by(model.id.desc())
+
+    rows = db.session.execute(
+        statement.limit(per_page + 1).offset((page - 1) * per_page)).all()
+    return SearchPage(rows[:per_page], page, per_page, len(rows) > per_page)
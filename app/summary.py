@@ -0,0 +1,164 @@
+from collections import Counter
+from sqlalchemy import event, select, delete, insert, update, func, cast, literal, String
+from sqlalchemy.orm import attributes
+from app import db
+from app.models import Asset, AssetSummary
+from app.lookups import get_choices
+
+# The following code keeps the AssetSummary table of asset counts per customer, manufacturer, category and month up to date. Assets created, edited and deleted through the ORM are counted by mapper events, which run during the flush on the same connection, so the counts change in the same transaction as the assets themselves and are rolled back with them. Code that writes assets with Core statements instead, such as the bulk import and the bulk edit and delete in bulk.py, adjusts the counts itself with count_assets or count_selection. Each change is applied as an upsert that adds to the stored count, so two workers changing the same count at once cannot overwrite each other, and rebuild_summary recalculates every count from the asset table for when the counts need to be checked or repaired
+
+DIMENSIONS = ('customer', 'manufacturer', 'category', 'month')
+
+SUMMARY_COLUMNS = ('customer_id', 'manufacturer_id', 'category', 'timestamp')
+
+
+def summary_keys(values):
+    timestamp = values.get('timestamp')
+    return [
+        ('customer', '' if values.get('customer_id') is None else str(values['customer_id'])),
+        ('manufacturer', '' if values.get('manufacturer_id') is None else str(values['manufacturer_id'])),
+        ('category', values.get('category') or ''),
+        ('month', timestamp.strftime('%Y-%m') if timestamp else ''),
+    ]
+
+
+def _upsert(connection):
+    table = AssetSummary.__table__
+    if connection.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    statement = dialect_insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=['dimension', 'value'],
+        set_={'count': table.c.count + statement.excluded['count']})
+
+
+def apply_deltas(connection, deltas):
+    rows = [{'dimension': dimension, 'value': value, 'count': count}
+            for (dimension, value), count in sorted(deltas.items()) if count]
+    if not rows:
+        return
+    statement = _upsert(connection)
+    if statement is not None:
+        connection.execute(statement, rows)
+        return
+
+    table = AssetSummary.__table__
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(table.c.dimension == row['dimension'], table.c.value == row['value'])
+            .values(count=table.c.count + row['count']))
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(**row))
+
+
+def count_assets(connection, assets, sign=1):
+    deltas = Counter()
+    for values in assets:
+        for key in summary_keys(values):
+            deltas[key] += sign
+    apply_deltas(connection, deltas)
+
+# The mapper events below receive the asset being written. For an edited asset, the values it had before the edit are read from the attribute history, and the asset is moved from its old counts to its new ones
+
+
+def _current_values(target):
+    return {column: getattr(target, column) for column in SUMMARY_COLUMNS}
+
+
+def _previous_values(target):
+    values = {}
+    for column in SUMMARY_COLUMNS:
+        history = attributes.get_history(target, column, passive=attributes.PASSIVE_NO_INITIALIZE)
+        values[column] = history.deleted[0] if history.deleted else getattr(target, column)
+    return values
+
+
+@event.listens_for(Asset, 'after_insert')
+def _count_inserted_asset(mapper, connection, target):
+    count_assets(connection, [_current_values(target)])
+
+
+@event.listens_for(Asset, 'after_update')
+def _count_updated_asset(mapper, connection, target):
+    deltas = Counter()
+    for key in summary_keys(_previous_values(target)):
+        deltas[key] -= 1
+    for key in summary_keys(_current_values(target)):
+        deltas[key] += 1
+    apply_deltas(connection, deltas)
+
+
+@event.listens_for(Asset, 'after_delete')
+def _count_deleted_asset(mapper, connection, target):
+    count_assets(connection, [_current_values(target)], sign=-1)
+
+
+def _dimension_expressions(connection):
+    if connection.dialect.name == 'sqlite':
+        month = func.strftime('%Y-%m', Asset.timestamp)
+    else:
+        month = func.to_char(Asset.timestamp, 'YYYY-MM')
+    return {
+        'customer': func.coalesce(cast(Asset.customer_id, String), ''),
+        'manufacturer': func.coalesce(cast(Asset.manufacturer_id, String), ''),
+        'category': func.coalesce(Asset.category, ''),
+        'month': func.coalesce(month, ''),
+    }
+
+
+def rebuild_summary(connection):
+    table = AssetSummary.__table__
+    connection.execute(delete(table))
+    for dimension, expression in _dimension_expressions(connection).items():
+        connection.execute(insert(table).from_select(
+            ['dimension', 'value', 'count'],
+            select(literal(dimension), expression, func.count()).select_from(Asset.__table__)
+            .group_by(expression)))
+    return connection.execute(
+        select(func.coalesce(func.sum(table.c.count), 0)).where(table.c.dimension == 'category')).scalar()
+
+# The count_selection function counts the assets matching a where clause by their value in each of the given dimensions, with one GROUP BY query per dimension, so that bulk updates and deletes made with Core statements can adjust the counts without loading the assets they change
+
+
+def count_selection(connection, where, dimensions=DIMENSIONS):
+    expressions = _dimension_expressions(connection)
+    counts = Counter()
+    for dimension in dimensions:
+        expression = expressions[dimension]
+        rows = connection.execute(
+            select(expression, func.count()).select_from(Asset.__table__)
+            .where(where).group_by(expression))
+        for value, count in rows:
+            counts[dimension, value] = count
+    return counts
+
+# The get_summary function reads the whole summary table, whose size depends only on the number of customers, manufacturers, categories and months, and labels the customer and manufacturer counts with names from the cached lookup lists. Counts are listed largest first, apart from months, which are listed in date order
+
+
+def get_summary():
+    table = AssetSummary.__table__
+    rows = db.session.execute(
+        select(table.c.dimension, table.c.value, table.c.count).where(table.c.count > 0)).all()
+    names = {name: dict(get_choices(name)) for name in ('customer', 'manufacturer')}
+
+    summary = {dimension: [] for dimension in DIMENSIONS}
+    for dimension, value, count in rows:
+        if dimension in names:
+            id = int(value) if value else None
+            label = names[dimension].get(id, 'None') if id is not None else 'None'
+            summary[dimension].append({'id': id, 'name': label, 'count': count})
+        elif dimension in summary:
+            summary[dimension].append({'name': value or 'None', 'count': count})
+
+    for dimension, counts in summary.items():
+        if dimension == 'month':
+            counts.sort(key=lambda entry: entry['name'])
+        else:
+            counts.sort(key=lambda entry: (-entry['count'], entry['name']))
+    summary['total'] = sum(entry['count'] for entry in summary['category'])
+    return summary
@@ -0,0 +1,214 @@
+import csv
+import io
+import json
+from collections import namedtuple
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert, select
+from app import db
+from app.models import Asset, ArchivedAsset, Customer, Manufacturer, User
+from app.forms import AssetForm
+from app.lookups import get_choices
+from app.metrics import count_model_changes
+from app.summary import count_assets
+from app.versions import bump_table_versions
+from app.audit import record_created
+
+# The following code imports assets in bulk from CSV or JSON-lines files. The input is read one row at a time, so the whole file never has to be held in memory, and each row is checked against the same rules as the asset form: the category must be one of the form's category choices, and the customer and manufacturer must both be given and must match existing records. Customer and manufacturer names are resolved to IDs through in-memory maps built once from the cached lookup lists, so validating a row costs no queries. Valid rows are collected into batches and each batch is written with a single executemany INSERT and committed as one transaction together with its additions to the dashboard's summary counts and the change log (the INSERT returns the new asset IDs for the log), while rejected rows are reported with their line number and the reason they were rejected. When the import runs as a background job (see jobs.py), the checkpoint function is called before each batch is committed with the line reached and the counts so far, which the job saves in the same transaction, and an import that is retried is given them back as resume, so it carries on after the last committed batch instead of inserting those rows again
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+ImportResult = namedtuple('ImportResult', ['inserted', 'rejected_count', 'rejected'])
+
+
+class TransferFormatError(ValueError):
+    pass
+
+
+def detect_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('jsonl', 'ndjson', 'json'):
+        return 'jsonl'
+    raise TransferFormatError(
+        'Unrecognised file type, please upload a .csv or .jsonl file.')
+
+
+def _name_map(name):
+    names = {}
+    for id, value in get_choices(name):
+        names.setdefault(value.strip().casefold(), id)
+    return names
+
+
+def read_rows(stream, fmt):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, None
+                continue
+            yield line_number, row if isinstance(row, dict) else None
+    else:
+        raise TransferFormatError(f'Unsupported import format: {fmt}')
+
+
+def validate_row(row, categories, customers, manufacturers):
+    if row is None:
+        return None, 'Row is not a valid record'
+    row = {str(key).strip().lower(): value for key, value in row.items()
+           if key is not None}
+
+    category = str(row.get('category') or '').strip()
+    customer = str(row.get('customer') or '').strip()
+    manufacturer = str(row.get('manufacturer') or '').strip()
+    comments = row.get('comments')
+
+    if not category:
+        return None, 'Category is required'
+    if category not in categories:
+        return None, f"Invalid category '{category}'"
+    if not customer:
+        return None, 'Customer is required'
+    if customer.casefold() not in customers:
+        return None, f"Unknown customer '{customer}'"
+    if not manufacturer:
+        return None, 'Manufacturer is required'
+    if manufacturer.casefold() not in manufacturers:
+        return None, f"Unknown manufacturer '{manufacturer}'"
+
+    return {
+        'category': category,
+        'comments': str(comments) if comments not in (None, '') else None,
+        'customer_id': customers[customer.casefold()],
+        'manufacturer_id': manufacturers[manufacturer.casefold()],
+    }, None
+
+
+def import_assets(stream, fmt, user_id, batch_size=None, resume=None, checkpoint=None):
+    batch_size = batch_size or current_app.config['IMPORT_BATCH_SIZE']
+    max_reported = current_app.config['IMPORT_MAX_REJECTED_REPORTED']
+
+    categories = set(AssetForm.category_choices)
+    customers = _name_map('customer')
+    manufacturers = _name_map('manufacturer')
+
+    resume = resume or {}
+    start_line = resume.get('line', 0)
+    inserted = resume.get('inserted', 0)
+    rejected_count = resume.get('rejected_count', 0)
+    rejected = [tuple(entry) for entry in resume.get('rejected', [])]
+    batch = []
+    line_number = start_line
+
+    def flush():
+        timestamp = datetime.utcnow()
+        for values in batch:
+            values['user_id'] = user_id
+            values['timestamp'] = timestamp
+        ids = db.session.execute(
+            insert(Asset.__table__).returning(Asset.id, sort_by_parameter_order=True), batch).scalars().all()
+        record_created(db.session.connection(), ids, batch, user_id)
+        count_assets(db.session.connection(), batch)
+        bump_table_versions(db.session, {'asset'})
+        count_model_changes(db.session, 'asset', 'create', len(batch))
+        if checkpoint:
+            checkpoint({'line': line_number, 'inserted': inserted, 'rejected_count': rejected_count,
+                        'rejected': rejected})
+        db.session.commit()
+        batch.clear()
+
+    for line_number, row in read_rows(stream, fmt):
+        if line_number <= start_line:
+            continue
+        values, error = validate_row(row, categories, customers, manufacturers)
+        if error:
+            rejected_count += 1
+            if len(rejected) < max_reported:
+                rejected.append((line_number, error))
+            continue
+        batch.append(values)
+        if len(batch) >= batch_size:
+            inserted += len(batch)
+            flush()
+
+    if batch:
+        inserted += len(batch)
+        flush()
+
+    return ImportResult(inserted, rejected_count, rejected)
+
+
+# The following code exports the asset register as CSV or JSON-lines. Assets are selected as plain column tuples joined with their customer, manufacturer and author names, so no ORM objects are built, and the result is read in chunks with yield_per, which uses a server-side cursor where the database supports one. The generate_export generator sends the header straight away and then yields the output a chunk of rows at a time, so the memory used stays the same however many assets there are. The optional progress function is called with the number of rows written after each chunk. export_statement(archived=True) exports the archived assets (see archive.py) in the same format instead
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_COLUMNS = ('id', 'category', 'comments', 'customer',
+                  'manufacturer', 'author', 'timestamp')
+EXPORT_MIMETYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def export_statement(archived=False):
+    model = ArchivedAsset if archived else Asset
+    return (
+        select(model.id, model.category, model.comments,
+               Customer.name.label('customer'),
+               Manufacturer.name.label('manufacturer'),
+               User.username.label('author'), model.timestamp)
+        .outerjoin(Customer, model.customer_id == Customer.id)
+        .outerjoin(Manufacturer, model.manufacturer_id == Manufacturer.id)
+        .outerjoin(User, model.user_id == User.id)
+        .order_by(model.id)
+    )
+
+
+def iter_export_rows(statement=None, chunk_size=None):
+    chunk_size = chunk_size or current_app.config['EXPORT_CHUNK_SIZE']
+    statement = statement if statement is not None else export_statement()
+    result = db.session.execute(
+        statement.execution_options(yield_per=chunk_size))
+    for partition in result.partitions():
+        yield partition
+
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def generate_export(fmt, statement=None, chunk_size=None, progress=None):
+    if fmt not in EXPORT_FORMATS:
+        raise TransferFormatError(f'Unsupported export format: {fmt}')
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if fmt == 'csv':
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+
+    written = 0
+    for rows in iter_export_rows(statement, chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        if fmt == 'csv':
+            writer.writerows(
+                [_export_value(value) for value in row] for row in rows)
+        else:
+            for row in rows:
+                buffer.write(json.dumps(
+                    {column: _export_value(value) for column, value in zip(EXPORT_COLUMNS, row)}))
+                buffer.write('\n')
+        yield buffer.getvalue()
+        written += len(rows)
+        if progress:
+            progress(written)
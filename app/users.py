@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from flask_login import UserMixin, current_user
+from sqlalchemy import select
+from app import db
+from app.models import User
+from app.versions import tables_changed, get_table_version
+
+# The following code caches the logged in users loaded by Flask-Login on every request, so that an authenticated page view does not have to start with a query for the user. Only each user's ID, username and role are kept, as a plain CachedUser object rather than an ORM instance, in a least-recently-used cache of at most USER_CACHE_SIZE users per application in this process. The cache is trusted for USER_CACHE_TTL seconds, after which the stored version of the user table is read and the whole cache is dropped if another worker has changed any user. Changes committed in this process drop it straight away through the tables_changed signal, and logging out removes that user's entry. Since a cached role can still be out of date for a few seconds, permission checks that matter (deleting records) call is_admin, which always reads the role from the database
+
+
+class CachedUser(UserMixin):
+    def __init__(self, id, username, role):
+        self.id = id
+        self.username = username
+        self.role = role
+
+    def __repr__(self):
+        return f"CachedUser('{self.username}', '{self.role}')"
+
+
+class _UserCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = OrderedDict()
+        self.version = None
+        self.checked_at = None
+
+
+def _get_cache(app):
+    return app.extensions.setdefault('user_cache', _UserCache())
+
+
+def get_cached_user(user_id):
+    app = current_app._get_current_object()
+    cache = _get_cache(app)
+    now = time.monotonic()
+
+    if cache.checked_at is None or now - cache.checked_at >= app.config['USER_CACHE_TTL']:
+        version = get_table_version(db.session, 'user')
+        with cache.lock:
+            if version != cache.version:
+                cache.users.clear()
+                cache.version = version
+            cache.checked_at = now
+
+    with cache.lock:
+        user = cache.users.get(user_id)
+        if user is not None:
+            cache.users.move_to_end(user_id)
+            return user
+
+    row = db.session.execute(
+        select(User.id, User.username, User.role).where(User.id == user_id)).first()
+    if row is None:
+        return None
+    user = CachedUser(row.id, row.username, row.role)
+    with cache.lock:
+        cache.users[user_id] = user
+        while len(cache.users) > app.config['USER_CACHE_SIZE']:
+            cache.users.popitem(last=False)
+    return user
+
+
+def invalidate_user(app, user_id):
+    cache = _get_cache(app)
+    with cache.lock:
+        cache.users.pop(user_id, None)
+
+
+def invalidate_users(app):
+    cache = _get_cache(app)
+    with cache.lock:
+        cache.users.clear()
+        cache.checked_at = None
+
+# The is_admin function checks the current user's role in the database rather than trusting the cached copy, so a user who has just been demoted from admin cannot delete anything, and drops the cached copy if it was out of date
+
+
+def is_admin():
+    role = db.session.execute(
+        select(User.role).where(User.id == current_user.id)).scalar()
+    if role != current_user.role:
+        invalidate_user(current_app._get_current_object(), current_user.id)
+    return role == 'admin'
+
+
+@tables_changed.connect
+def _invalidate_on_commit(session, names):
+    if 'user' in names and has_app_context():
+        invalidate_users(current_app._get_current_object())
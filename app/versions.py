@@ -0,0 +1,84 @@
+from datetime import datetime
+from blinker import Namespace
+from sqlalchemy import event, select, update, insert
+from sqlalchemy.orm import Session
+from app.models import TableVersion
+
+# The following code keeps the TableVersion rows up to date. Before each flush, the session is checked for new, edited or deleted rows belonging to one of the tracked tables, and the version for each affected table is incremented with a single INSERT ... ON CONFLICT DO UPDATE statement (as summary.py does for the dashboard counts), so two workers writing to a table that has no version row yet cannot both try to insert it. Because the statement runs on the session's own connection, the stamp is committed or rolled back together with the change itself. Once the transaction commits, the tables_changed signal is sent so that anything caching those tables within this process can drop its copy straight away, while other gunicorn workers pick up the change by comparing the stored version. Code that writes tracked rows with Core statements instead of the session, such as the bulk import and bulk edits, calls bump_table_versions itself
+
+TRACKED_TABLES = {'asset', 'customer', 'manufacturer', 'user'}
+
+tables_changed = Namespace().signal('tables-changed')
+
+
+def _upsert(connection):
+    table = TableVersion.__table__
+    if connection.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    statement = dialect_insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'version': table.c.version + 1, 'changed_at': statement.excluded['changed_at']})
+
+
+def bump_table_versions(session, names):
+    names = set(names)
+    if not names:
+        return
+    connection = session.connection()
+    changed_at = datetime.utcnow()
+    rows = [{'name': name, 'version': 1, 'changed_at': changed_at} for name in sorted(names)]
+    statement = _upsert(connection)
+    if statement is not None:
+        connection.execute(statement, rows)
+    else:
+        table = TableVersion.__table__
+        for row in rows:
+            result = connection.execute(
+                update(table)
+                .where(table.c.name == row['name'])
+                .values(version=table.c.version + 1, changed_at=changed_at))
+            if result.rowcount == 0:
+                connection.execute(insert(table).values(**row))
+    session.info.setdefault('changed_tables', set()).update(names)
+
+
+def get_table_version(session, name):
+    version = session.connection().execute(
+        select(TableVersion.__table__.c.version)
+        .where(TableVersion.__table__.c.name == name)).scalar()
+    return version or 0
+
+
+def get_table_versions(session, names):
+    table = TableVersion.__table__
+    rows = session.connection().execute(
+        select(table.c.name, table.c.version, table.c.changed_at).where(table.c.name.in_(names)))
+    versions = {name: (0, None) for name in names}
+    versions.update({row.name: (row.version, row.changed_at) for row in rows})
+    return versions
+
+
+@event.listens_for(Session, 'before_flush')
+def _bump_changed_tables(session, flush_context, instances):
+    changed = list(session.new) + list(session.deleted) + [
+        obj for obj in session.dirty
+        if session.is_modified(obj, include_collections=False)]
+    names = {obj.__table__.name for obj in changed}
+    bump_table_versions(session, names & TRACKED_TABLES)
+
+
+@event.listens_for(Session, 'after_commit')
+def _send_tables_changed(session):
+    names = session.info.pop('changed_tables', None)
+    if names:
+        tables_changed.send(session, names=names)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_tables_changed(session):
+    session.info.pop('changed_tables', None)
@@ -0,0 +1,70 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# The following code measures how many password checks (which is what a login costs) one CPU core can do each second for each password hashing setting, to help choose PASSWORD_HASH_METHOD. Each setting is timed in a single process, which gives the logins per second per core, and then in one process per core at once, which shows the total the machine can sustain when a burst of logins arrives and how far hashing memory use (128 * n * r bytes for scrypt) cuts into it. Run it on the same kind of machine the app is deployed on, for example:
+#
+#   python benchmarks/password_hashing.py
+#   python benchmarks/password_hashing.py --methods scrypt:16384:8:1 pbkdf2:sha256:600000 --seconds 5
+
+DEFAULT_METHODS = [
+    'scrypt:65536:8:1',
+    'scrypt:32768:8:1',
+    'scrypt:16384:8:1',
+    'scrypt:8192:8:1',
+    'pbkdf2:sha256:1000000',
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:300000',
+]
+
+PASSWORD = 'BenchmarkPassword123!'
+
+
+def checks_per_second(method, seconds):
+    password_hash = generate_password_hash(PASSWORD, method=method)
+    checks = 0
+    started = time.perf_counter()
+    while True:
+        check_password_hash(password_hash, PASSWORD)
+        checks += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            return checks / elapsed
+
+
+def memory_per_check(method):
+    parts = method.split(':')
+    if parts[0] != 'scrypt':
+        return '-'
+    n = int(parts[1]) if len(parts) > 1 else 2 ** 15
+    r = int(parts[2]) if len(parts) > 2 else 8
+    return f'{128 * n * r / 1024 / 1024:.0f} MiB'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare password hashing settings.')
+    parser.add_argument('--methods', nargs='+', default=DEFAULT_METHODS,
+                        help='Werkzeug hash methods to compare')
+    parser.add_argument('--seconds', type=float, default=2,
+                        help='time spent measuring each method in each process')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                        help='processes used for the all-cores measurement')
+    args = parser.parse_args()
+
+    print(f'{"method":<24} {"ms/login":>9} {"logins/s/core":>14} '
+          f'{"logins/s (" + str(args.processes) + " procs)":>22} {"memory":>9}')
+    for method in args.methods:
+        per_core = checks_per_second(method, args.seconds)
+        with ProcessPoolExecutor(args.processes) as pool:
+            total = sum(pool.map(checks_per_second, [method] * args.processes,
+                                 [args.seconds] * args.processes))
+        print(f'{method:<24} {1000 / per_core:>9.1f} {per_core:>14.1f} '
+              f'{total:>22.1f} {memory_per_check(method):>9}')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
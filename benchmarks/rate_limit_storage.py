@@ -0,0 +1,58 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from limits import parse  # noqa: E402
+from limits.storage import storage_from_string  # noqa: E402
+from limits.strategies import STRATEGIES  # noqa: E402
+import app.ratelimits  # noqa: E402,F401
+
+# The following code measures the time a rate limit check adds to a request with each storage backend and strategy, which is one hit on the limiter (the same call Flask-Limiter makes before a limited route runs). Each combination is timed in one process and then in several processes hitting the same storage at once, as gunicorn workers would. The keys are spread over many client addresses so the limit itself is rarely reached, which is the normal case. For example:
+#
+#   python benchmarks/rate_limit_storage.py
+#   python benchmarks/rate_limit_storage.py --hits 20000 --processes 8
+
+
+def run_hits(uri, strategy, hits, worker):
+    limiter = STRATEGIES[strategy](storage_from_string(uri))
+    limit = parse('100/minute')
+    started = time.perf_counter()
+    for hit in range(hits):
+        limiter.hit(limit, 'main.login', f'10.{worker}.{hit % 250}.{hit // 250 % 250}')
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare rate limit storage backends.')
+    parser.add_argument('--hits', type=int, default=5000, help='hits made by each process')
+    parser.add_argument('--processes', type=int, default=4,
+                        help='processes sharing the storage in the concurrent run')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    print(f'{"storage":<8} {"strategy":<15} {"us/hit":>8} '
+          f'{"us/hit (" + str(args.processes) + " procs)":>20} {"hits/s (all procs)":>19}')
+    for name in ('memory', 'sqlite'):
+        for strategy in ('fixed-window', 'moving-window'):
+            uri = 'memory://' if name == 'memory' else \
+                'sqlite:///' + os.path.join(directory, f'{strategy}.db')
+            single = run_hits(uri, strategy, args.hits, 0) / args.hits
+            with ProcessPoolExecutor(args.processes) as pool:
+                durations = list(pool.map(run_hits, [uri] * args.processes,
+                                          [strategy] * args.processes,
+                                          [args.hits] * args.processes,
+                                          range(1, args.processes + 1)))
+            concurrent = max(durations) / args.hits
+            throughput = args.hits * args.processes / max(durations)
+            print(f'{name:<8} {strategy:<15} {single * 1e6:>8.1f} '
+                  f'{concurrent * 1e6:>20.1f} {throughput:>19.0f}')
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The benchmarks run with the rate limits raised out of reach and in-memory limiter storage, so that the login scenario measures password checking rather than being turned away, and without log files
+os.environ.update({
+    'LOGIN_RATE_LIMIT': '1000000/minute', 'REGISTER_RATE_LIMIT': '1000000/minute',
+    'API_RATE_LIMIT': '1000000/minute', 'RATELIMIT_STORAGE_URI': 'memory://',
+    'LOG_FILE': '', 'LOG_CONSOLE': 'false', 'LOG_ACCESS': 'false', 'SQL_INSTRUMENTATION': 'true',
+})
+
+import seed_data  # noqa: E402
+from app.instrumentation import count_queries  # noqa: E402
+from app.models import Asset, Customer, Manufacturer  # noqa: E402
+from app import db  # noqa: E402
+
+# The following code load tests the application's main routes against a database of realistic size and reports the latency percentiles (p50, p95 and p99), the throughput and the number of queries per request for each one. The data comes from seed_data.py: the database given by --database is seeded with the requested sizes and seed the first time it is used, and the sizes are saved next to it so later runs reuse it. Each route is measured in two ways, chosen with --mode:
+#
+#   client    requests are made one at a time through the Flask test client in this process, which shows the cost of the application code itself, with queries counted by the collectors in instrumentation.py
+#   gunicorn  a local gunicorn server is started with --workers workers and --concurrency threads send requests to it over HTTP, which adds the server, the network stack and contention between workers, with queries read from the Server-Timing header
+#
+# The results can be saved as a baseline with --save-baseline and later runs compared against it with --baseline. A route is flagged as a regression when its p95 latency is more than --tolerance (a fraction) above the baseline, its throughput is more than --tolerance below it, or it issues more queries per request, and the script then exits with status 1 so it can fail a CI job. Timings are only comparable on the same machine with the same data sizes, which the baseline records and checks. For example:
+#
+#   python benchmarks/routes.py --assets 100000 --save-baseline benchmarks/baseline.json
+#   python benchmarks/routes.py --assets 100000 --baseline benchmarks/baseline.json
+#   python benchmarks/routes.py --mode gunicorn --workers 4 --concurrency 8 --requests 500
+
+# Each scenario is a name, an HTTP method and a function returning the path (and form data for POST requests) for one request. Asset, customer and manufacturer IDs are picked at random from the seeded data, and the edit scenario changes only the comments of the asset it picks. POST requests are sent without a CSRF token through the test client, which has CSRF protection turned off, and with the session's token through gunicorn
+
+SCENARIOS = [
+    ('login', 'POST', lambda data: ('/login', {'username': data.admin, 'password': seed_data.BENCHMARK_PASSWORD})),
+    ('assets', 'GET', lambda data: ('/assets', None)),
+    ('assets_200', 'GET', lambda data: ('/assets?per_page=200', None)),
+    ('edit_asset_form', 'GET', lambda data: (f'/assets/{data.asset()}/edit', None)),
+    ('edit_asset', 'POST', lambda data: data.edit()),
+    ('customers', 'GET', lambda data: ('/customers', None)),
+    ('manufacturers', 'GET', lambda data: ('/manufacturers', None)),
+    ('dashboard', 'GET', lambda data: ('/dashboard', None)),
+    ('search', 'GET', lambda data: (f'/search?q={data.word()}', None)),
+    ('api_assets', 'GET', lambda data: ('/api/v1/assets?per_page=100', None)),
+]
+
+
+class BenchmarkData:
+    def __init__(self, app, admin, seed):
+        self.admin = admin
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        with app.app_context():
+            self.asset_range = db.session.query(db.func.min(Asset.id), db.func.max(Asset.id)).one()
+            self.customer_ids = [id for id, in db.session.query(Customer.id)]
+            self.manufacturer_ids = [id for id, in db.session.query(Manufacturer.id)]
+
+    def _pick(self, choose):
+        with self._lock:
+            return choose(self._rng)
+
+    def asset(self):
+        return self._pick(lambda rng: rng.randint(*self.asset_range))
+
+    def word(self):
+        return self._pick(lambda rng: rng.choice(seed_data.WORDS + seed_data.NOTES).split()[0])
+
+    def edit(self):
+        asset_id, customer, manufacturer = self._pick(lambda rng: (
+            rng.randint(*self.asset_range), rng.choice(self.customer_ids), rng.choice(self.manufacturer_ids)))
+        return f'/assets/{asset_id}/edit', {
+            'category': 'Laptop', 'comments': f'Benchmark edit {asset_id}',
+            'customer': customer, 'manufacturer': manufacturer}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def summarise(durations, queries, elapsed, errors):
+    return {
+        'requests': len(durations),
+        'errors': errors,
+        'p50_ms': percentile(durations, 0.50) * 1000,
+        'p95_ms': percentile(durations, 0.95) * 1000,
+        'p99_ms': percentile(durations, 0.99) * 1000,
+        'throughput': len(durations) / elapsed,
+        'queries': sum(queries) / len(queries) if queries else None,
+    }
+
+# The test client benchmark logs in as the seeded admin user once and then sends each scenario's requests one after another, after a few warm-up requests that fill the caches
+
+
+def run_client(app, data, requests, warmup):
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+    client.post('/login', data={'username': data.admin, 'password': seed_data.BENCHMARK_PASSWORD})
+
+    results = {}
+    for name, method, make_request in SCENARIOS:
+        for _ in range(warmup):
+            path, form = make_request(data)
+            client.open(path, method=method, data=form)
+
+        durations, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for _ in range(requests):
+            path, form = make_request(data)
+            with count_queries() as stats:
+                request_started = time.perf_counter()
+                response = client.open(path, method=method, data=form)
+                durations.append(time.perf_counter() - request_started)
+            queries.append(stats.count)
+            errors += response.status_code >= 400
+        results[name] = summarise(durations, queries, time.perf_counter() - started, errors)
+    return results
+
+# The gunicorn benchmark runs the app from run.py in a separate server process on a free local port. Each client thread keeps its own session cookie, logs in once and reads the session's CSRF token from a page with a form, as a browser would. Redirects are not followed, so a POST is timed up to its redirect, as it is through the test client
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(database, workers, threads):
+    port = _free_port()
+    env = dict(os.environ, SQLALCHEMY_DATABASE_URI=seed_data.database_uri(database),
+               METRICS_DIR=tempfile.mkdtemp())
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'run:app', '--config', 'gunicorn.conf.py',
+         '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--threads', str(threads),
+         '--log-level', 'warning'], cwd=ROOT, env=env)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('gunicorn exited before it was ready')
+        try:
+            urllib.request.urlopen(url + '/login', timeout=1).read()
+            return server, url
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start within 30 seconds')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    csrf_pattern = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+    def __init__(self, url):
+        self.url = url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+        self.csrf_token = self._csrf_token('/login')
+
+    def _csrf_token(self, path):
+        body = self.opener.open(self.url + path).read().decode()
+        return self.csrf_pattern.search(body).group(1)
+
+    def login(self, data):
+        self.request('POST', '/login', {'username': data.admin, 'password': seed_data.BENCHMARK_PASSWORD})
+        self.csrf_token = self._csrf_token('/assets?per_page=1')
+
+    def request(self, method, path, form):
+        body = None
+        if method == 'POST':
+            body = urllib.parse.urlencode(dict(form, csrf_token=self.csrf_token)).encode()
+        request = urllib.request.Request(self.url + path, data=body, method=method)
+        try:
+            response = self.opener.open(request)
+        except urllib.error.HTTPError as error:
+            response = error
+        response.read()
+        return response
+
+
+def _queries(response):
+    for timing in response.headers.get_all('Server-Timing') or []:
+        match = re.search(r'desc="(\d+) queries"', timing)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def run_gunicorn(database, data, requests, warmup, workers, concurrency):
+    server, url = start_gunicorn(database, workers, concurrency)
+    try:
+        local = threading.local()
+
+        def session():
+            if not hasattr(local, 'session'):
+                local.session = HttpSession(url)
+                local.session.login(data)
+            return local.session
+
+        def send(method, make_request):
+            path, form = make_request(data)
+            started = time.perf_counter()
+            response = session().request(method, path, form)
+            return time.perf_counter() - started, _queries(response), response.status >= 400
+
+        results = {}
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(lambda _: session(), range(concurrency * 4)))
+            for name, method, make_request in SCENARIOS:
+                list(pool.map(lambda _: send(method, make_request), range(warmup)))
+                started = time.perf_counter()
+                samples = list(pool.map(lambda _: send(method, make_request), range(requests)))
+                elapsed = time.perf_counter() - started
+                results[name] = summarise(
+                    [duration for duration, _, _ in samples],
+                    [count for _, count, _ in samples if count is not None],
+                    elapsed, sum(error for _, _, error in samples))
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+# The compare function lists the routes that have become slower, handle fewer requests per second or issue more queries than in the baseline
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for mode, routes in results.items():
+        for name, result in routes.items():
+            before = baseline.get(mode, {}).get(name)
+            if not before:
+                continue
+            if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{mode} {name}: p95 {before['p95_ms']:.1f} ms -> {result['p95_ms']:.1f} ms")
+            if result['throughput'] < before['throughput'] * (1 - tolerance):
+                regressions.append(
+                    f"{mode} {name}: {before['throughput']:.1f} req/s -> {result['throughput']:.1f} req/s")
+            if result['queries'] is not None and before['queries'] is not None \
+                    and result['queries'] > before['queries'] + 0.5:
+                regressions.append(
+                    f"{mode} {name}: {before['queries']:.1f} queries -> {result['queries']:.1f} queries")
+    return regressions
+
+
+def print_results(mode, results):
+    print(f'\n{mode}')
+    print(f'{"route":<16} {"requests":>8} {"errors":>6} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+          f'{"req/s":>8} {"queries":>8}')
+    for name, result in results.items():
+        queries = '-' if result['queries'] is None else f"{result['queries']:.1f}"
+        print(f"{name:<16} {result['requests']:>8} {result['errors']:>6} {result['p50_ms']:>8.1f} "
+              f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['throughput']:>8.1f} {queries:>8}")
+    sys.stdout.flush()
+
+
+def prepare_database(database, sizes, seed):
+    info_path = database + '.json'
+    wanted = {'sizes': sizes, 'seed': seed}
+    if os.path.exists(info_path):
+        with open(info_path) as file:
+            info = json.load(file)
+        if {'sizes': info['sizes'], 'seed': info['seed']} != wanted:
+            raise SystemExit(f'{database} was seeded with {info}, use a different --database for {wanted}')
+        app = seed_data.create_benchmark_app(database)
+        return app, info['admin']
+
+    if os.path.exists(database):
+        raise SystemExit(f'{database} already exists but was not seeded by this script')
+    print(f'Seeding {database} with {sizes}', file=sys.stderr)
+    app = seed_data.create_benchmark_app(database)
+    admin = seed_data.seed(app, sizes, seed)
+    seed_data.save_info(database, sizes, seed, admin)
+    return app, admin
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the main routes and compare with a baseline.')
+    parser.add_argument('--database', default=None,
+                        help='SQLite file to seed and benchmark (default instance/benchmark-<assets>.db)')
+    for name, default in seed_data.DEFAULT_SIZES.items():
+        parser.add_argument(f'--{name}', type=int, default=default, help=f'number of {name} to seed')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the data and the requests')
+    parser.add_argument('--mode', choices=['client', 'gunicorn', 'both'], default='both')
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per route')
+    parser.add_argument('--warmup', type=int, default=10, help='unmeasured requests per route first')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='client threads (and threads per gunicorn worker)')
+    parser.add_argument('--baseline', help='JSON file of earlier results to compare with')
+    parser.add_argument('--save-baseline', help='write the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='fraction by which p95 or throughput may be worse than the baseline')
+    args = parser.parse_args()
+
+    sizes = {name: getattr(args, name) for name in seed_data.DEFAULT_SIZES}
+    database = args.database or os.path.join(ROOT, 'instance', f'benchmark-{args.assets}.db')
+    app, admin = prepare_database(database, sizes, args.seed)
+    data = BenchmarkData(app, admin, args.seed)
+
+    results = {}
+    if args.mode in ('client', 'both'):
+        results['client'] = run_client(app, data, args.requests, args.warmup)
+        print_results('client', results['client'])
+    if args.mode in ('gunicorn', 'both'):
+        results['gunicorn'] = run_gunicorn(database, data, args.requests, args.warmup,
+                                           args.workers, args.concurrency)
+        print_results(f'gunicorn ({args.workers} workers, {args.concurrency} threads)', results['gunicorn'])
+
+    environment = {'sizes': sizes, 'seed': args.seed, 'workers': args.workers,
+                   'concurrency': args.concurrency, 'python': sys.version.split()[0]}
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as file:
+            json.dump(dict(results, environment=environment), file, indent=2)
+        print(f'\nBaseline saved to {args.save_baseline}')
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get('environment', {}).get('sizes') != sizes:
+            print(f"\nWarning: the baseline was measured with {baseline.get('environment', {}).get('sizes')}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('\nRegressions compared with the baseline:')
+            for regression in regressions:
+                print('  ' + regression)
+            sys.exit(1)
+        print('\nNo regressions compared with the baseline')
+
+
+if __name__ == '__main__':
+    main()
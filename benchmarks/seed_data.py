@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.setdefault('LOG_FILE', '')
+os.environ.setdefault('LOG_CONSOLE', 'false')
+
+from sqlalchemy import insert  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.forms import AssetForm  # noqa: E402
+from app.models import User, Customer, Manufacturer, Asset  # noqa: E402
+from app.summary import rebuild_summary  # noqa: E402
+from app.versions import TRACKED_TABLES, bump_table_versions  # noqa: E402
+
+# The following code fills a database with synthetic users, customers, manufacturers and assets for the benchmarks in benchmarks/routes.py. Everything is drawn from a random generator started from --seed, and asset dates are spread back from a fixed date, so the same arguments always produce the same data. Like real data, a few customers and manufacturers own most of the assets and each category is used a different amount. Rows are written with executemany INSERTs in batches, which keeps the search index triggers in step, and the dashboard's summary counts are rebuilt at the end. Every user has the password BENCHMARK_PASSWORD, and the first one is an admin. The database is given by --database (a file path or an SQLAlchemy URL) and its tables are created if they do not exist, but an existing database is never emptied, so point it at a new file. The sizes, seed and admin username are saved next to a database file (in '<database>.json') so that routes.py can reuse it. For example:
+#
+#   python benchmarks/seed_data.py --database instance/benchmark.db --assets 100000
+#   python benchmarks/seed_data.py --database instance/benchmark-1m.db --assets 1000000 --customers 5000
+
+BENCHMARK_PASSWORD = 'BenchmarkPassword123!'
+
+DEFAULT_SIZES = {'users': 50, 'customers': 500, 'manufacturers': 100, 'assets': 10000}
+
+STARTED = datetime(2024, 1, 1)
+
+WORDS = ['north', 'south', 'east', 'west', 'global', 'united', 'metro', 'harbour', 'summit', 'river',
+         'crown', 'bright', 'silver', 'oak', 'cedar', 'pioneer', 'atlas', 'vertex', 'nova', 'delta']
+
+SUFFIXES = ['Ltd', 'Group', 'Holdings', 'Partners', 'Systems', 'Services', 'Trust', 'Council']
+
+NOTES = ['spare', 'loan', 'returned', 'new', 'refurbished', 'damaged screen', 'battery replaced',
+         'awaiting collection', 'reception', 'warehouse', 'floor 2', 'home worker', 'docking station']
+
+
+def database_uri(database):
+    if '://' in database:
+        return database
+    os.makedirs(os.path.dirname(os.path.abspath(database)), exist_ok=True)
+    return 'sqlite:///' + os.path.abspath(database)
+
+
+def _name(rng, index):
+    return f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {rng.choice(SUFFIXES)} {index}'
+
+
+def _weights(rng, count):
+    return [1 / (rank + 1) for rank in rng.sample(range(count), count)]
+
+
+def _insert(connection, table, rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        connection.execute(insert(table), rows[start:start + batch_size])
+
+
+def generate_assets(rng, count, user_ids, customer_ids, manufacturer_ids):
+    categories = AssetForm.category_choices
+    category_weights = _weights(rng, len(categories))
+    customer_weights = _weights(rng, len(customer_ids))
+    manufacturer_weights = _weights(rng, len(manufacturer_ids))
+    for index in range(count):
+        timestamp = STARTED - timedelta(seconds=rng.randrange(3 * 365 * 24 * 3600))
+        yield {
+            'category': rng.choices(categories, category_weights)[0],
+            'comments': f'SN {rng.randrange(16 ** 8):08X} {" ".join(rng.sample(NOTES, rng.randrange(4)))}'.strip(),
+            'user_id': rng.choice(user_ids),
+            'customer_id': rng.choices(customer_ids, customer_weights)[0],
+            'manufacturer_id': rng.choices(manufacturer_ids, manufacturer_weights)[0],
+            'timestamp': timestamp,
+            'updated_at': timestamp,
+        }
+
+
+def seed(app, sizes, seed=1, batch_size=10000, progress=None):
+    rng = random.Random(seed)
+    password = generate_password_hash(BENCHMARK_PASSWORD, method=app.config['PASSWORD_HASH_METHOD'])
+
+    with app.app_context():
+        db.create_all()
+        connection = db.session.connection()
+        first_user = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+        _insert(connection, User.__table__, [
+            {'username': f'bench{first_user + index}', 'password': password,
+             'role': 'admin' if index == 0 else 'regular'}
+            for index in range(sizes['users'])], batch_size)
+        _insert(connection, Customer.__table__, [
+            {'name': _name(rng, index)} for index in range(sizes['customers'])], batch_size)
+        _insert(connection, Manufacturer.__table__, [
+            {'name': _name(rng, index)} for index in range(sizes['manufacturers'])], batch_size)
+        db.session.commit()
+
+        user_ids = [id for id, in db.session.query(User.id).order_by(User.id)]
+        customer_ids = [id for id, in db.session.query(Customer.id).order_by(Customer.id)]
+        manufacturer_ids = [id for id, in db.session.query(Manufacturer.id).order_by(Manufacturer.id)]
+
+        batch = []
+        written = 0
+        for row in generate_assets(rng, sizes['assets'], user_ids, customer_ids, manufacturer_ids):
+            batch.append(row)
+            if len(batch) == batch_size:
+                db.session.connection().execute(insert(Asset.__table__), batch)
+                db.session.commit()
+                written += len(batch)
+                batch = []
+                if progress:
+                    progress(written)
+        if batch:
+            db.session.connection().execute(insert(Asset.__table__), batch)
+            written += len(batch)
+
+        rebuild_summary(db.session.connection())
+        bump_table_versions(db.session, TRACKED_TABLES)
+        db.session.commit()
+    return f'bench{first_user}'
+
+
+def save_info(database, sizes, seed, admin):
+    if '://' not in database:
+        with open(database + '.json', 'w') as file:
+            json.dump({'sizes': sizes, 'seed': seed, 'admin': admin}, file)
+
+
+def create_benchmark_app(database, **config):
+    os.environ['SQLALCHEMY_DATABASE_URI'] = database_uri(database)
+    app = create_app()
+    app.config.update(config)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill a database with synthetic benchmark data.')
+    parser.add_argument('--database', default='instance/benchmark.db',
+                        help='SQLite file or SQLAlchemy URL of the database to fill')
+    for name, default in DEFAULT_SIZES.items():
+        parser.add_argument(f'--{name}', type=int, default=default, help=f'number of {name} to create')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--batch-size', type=int, default=10000, help='rows written per INSERT')
+    args = parser.parse_args()
+
+    sizes = {name: getattr(args, name) for name in DEFAULT_SIZES}
+    app = create_benchmark_app(args.database)
+    started = time.perf_counter()
+    admin = seed(app, sizes, args.seed, args.batch_size,
+                 progress=lambda written: print(f'{written} assets written', file=sys.stderr))
+    save_info(args.database, sizes, args.seed, admin)
+    print(f'Seeded {args.database} with {sizes} in {time.perf_counter() - started:.1f}s. '
+          f"Log in as '{admin}' (admin) with the password '{BENCHMARK_PASSWORD}'")
+
+
+if __name__ == '__main__':
+    main()
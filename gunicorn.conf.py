@@ -0,0 +1,17 @@
+import os
+
+# The following code is read by gunicorn when it starts (for example through the Procfile's 'gunicorn run:app'). Unless LOG_FILE is set, each worker writes its log to a file named after its process ID, since several processes rotating the same log file would lose each other's records. When METRICS_DIR is set, the metrics files left behind by a previous run are removed as the server starts, and the numbers of each worker that exits are added to the retired workers' totals so that its counts are not lost when gunicorn replaces it
+
+os.environ.setdefault('LOG_FILE', 'app-{pid}.log')
+
+
+def on_starting(server):
+    if os.environ.get('METRICS_DIR'):
+        from app.metrics import reset_directory
+        reset_directory(os.environ['METRICS_DIR'])
+
+
+def child_exit(server, worker):
+    if os.environ.get('METRICS_DIR'):
+        from app.metrics import merge_process
+        merge_process(os.environ['METRICS_DIR'], worker.pid)
@@ -0,0 +1,42 @@
+"""align column types with models
+
+Revision ID: 1b38cd587da3
+Revises: dd8760066eca
+Create Date: 2026-10-18 10:02:11.640218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1b38cd587da3'
+down_revision = 'dd8760066eca'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password',
+               existing_type=sa.VARCHAR(length=60),
+               type_=sa.String(length=255),
+               existing_nullable=False)
+
+    with op.batch_alter_table('asset', schema=None) as batch_op:
+        batch_op.alter_column('category',
+               existing_type=sa.VARCHAR(length=100),
+               nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('asset', schema=None) as batch_op:
+        batch_op.alter_column('category',
+               existing_type=sa.VARCHAR(length=100),
+               nullable=True)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password',
+               existing_type=sa.String(length=255),
+               type_=sa.VARCHAR(length=60),
+               existing_nullable=False)
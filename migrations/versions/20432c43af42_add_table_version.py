@@ -0,0 +1,28 @@
+"""add table_version
+
+Revision ID: 20432c43af42
+Revises: b7071ee27b4b
+Create Date: 2026-10-18 09:14:02.771530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20432c43af42'
+down_revision = 'b7071ee27b4b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('table_version',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('table_version')
@@ -0,0 +1,83 @@
+"""set asset foreign keys to null on delete
+
+Revision ID: 2ca571354a1a
+Revises: b32de5c844b9
+Create Date: 2026-10-18 08:07:25.260091
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2ca571354a1a'
+down_revision = 'b32de5c844b9'
+branch_labels = None
+depends_on = None
+
+
+# SQLite cannot change a foreign key in place, so the batch operations below rebuild the asset table. Rebuilding it drops the triggers on the asset table that keep the asset_fts search index in step with it, and the triggers on the customer and manufacturer tables, which refer to the asset table, would stop the rebuilt table being renamed into place. All of the search index triggers are therefore dropped before the rebuild and created again afterwards
+
+TRIGGER_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_asset_insert AFTER INSERT ON asset BEGIN
+        INSERT INTO asset_fts (rowid, comments, category, customer, manufacturer) VALUES (
+            new.id, new.comments, new.category,
+            (SELECT name FROM customer WHERE id = new.customer_id),
+            (SELECT name FROM manufacturer WHERE id = new.manufacturer_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_asset_update
+        AFTER UPDATE OF comments, category, customer_id, manufacturer_id ON asset BEGIN
+        DELETE FROM asset_fts WHERE rowid = old.id;
+        INSERT INTO asset_fts (rowid, comments, category, customer, manufacturer) VALUES (
+            new.id, new.comments, new.category,
+            (SELECT name FROM customer WHERE id = new.customer_id),
+            (SELECT name FROM manufacturer WHERE id = new.manufacturer_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_asset_delete AFTER DELETE ON asset BEGIN
+        DELETE FROM asset_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_customer_update AFTER UPDATE OF name ON customer BEGIN
+        UPDATE asset_fts SET customer = new.name
+        WHERE rowid IN (SELECT id FROM asset WHERE customer_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_manufacturer_update AFTER UPDATE OF name ON manufacturer BEGIN
+        UPDATE asset_fts SET manufacturer = new.name
+        WHERE rowid IN (SELECT id FROM asset WHERE manufacturer_id = new.id);
+    END""",
+]
+
+DROP_TRIGGER_DDL = [
+    """DROP TRIGGER IF EXISTS asset_fts_manufacturer_update""",
+    """DROP TRIGGER IF EXISTS asset_fts_customer_update""",
+    """DROP TRIGGER IF EXISTS asset_fts_asset_delete""",
+    """DROP TRIGGER IF EXISTS asset_fts_asset_update""",
+    """DROP TRIGGER IF EXISTS asset_fts_asset_insert""",
+]
+
+
+def execute_on_sqlite(statements):
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in statements:
+            op.execute(statement)
+
+
+def upgrade():
+    execute_on_sqlite(DROP_TRIGGER_DDL)
+    with op.batch_alter_table('asset', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_asset_customer', type_='foreignkey')
+        batch_op.drop_constraint('fk_asset_manufacturer', type_='foreignkey')
+        batch_op.create_foreign_key('fk_asset_manufacturer', 'manufacturer', ['manufacturer_id'], ['id'], ondelete='SET NULL')
+        batch_op.create_foreign_key('fk_asset_customer', 'customer', ['customer_id'], ['id'], ondelete='SET NULL')
+
+    execute_on_sqlite(TRIGGER_DDL)
+
+
+def downgrade():
+    execute_on_sqlite(DROP_TRIGGER_DDL)
+    with op.batch_alter_table('asset', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_asset_customer', type_='foreignkey')
+        batch_op.drop_constraint('fk_asset_manufacturer', type_='foreignkey')
+        batch_op.create_foreign_key('fk_asset_manufacturer', 'manufacturer', ['manufacturer_id'], ['id'])
+        batch_op.create_foreign_key('fk_asset_customer', 'customer', ['customer_id'], ['id'])
+
+    execute_on_sqlite(TRIGGER_DDL)
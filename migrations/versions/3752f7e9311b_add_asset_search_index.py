@@ -0,0 +1,77 @@
+"""add asset search index
+
+Revision ID: 3752f7e9311b
+Revises: 1b38cd587da3
+Create Date: 2026-10-18 11:05:48.302517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3752f7e9311b'
+down_revision = '1b38cd587da3'
+branch_labels = None
+depends_on = None
+
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS asset_fts USING fts5(
+        comments, category, customer, manufacturer, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_asset_insert AFTER INSERT ON asset BEGIN
+        INSERT INTO asset_fts (rowid, comments, category, customer, manufacturer) VALUES (
+            new.id, new.comments, new.category,
+            (SELECT name FROM customer WHERE id = new.customer_id),
+            (SELECT name FROM manufacturer WHERE id = new.manufacturer_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_asset_update
+        AFTER UPDATE OF comments, category, customer_id, manufacturer_id ON asset BEGIN
+        DELETE FROM asset_fts WHERE rowid = old.id;
+        INSERT INTO asset_fts (rowid, comments, category, customer, manufacturer) VALUES (
+            new.id, new.comments, new.category,
+            (SELECT name FROM customer WHERE id = new.customer_id),
+            (SELECT name FROM manufacturer WHERE id = new.manufacturer_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_asset_delete AFTER DELETE ON asset BEGIN
+        DELETE FROM asset_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_customer_update AFTER UPDATE OF name ON customer BEGIN
+        UPDATE asset_fts SET customer = new.name
+        WHERE rowid IN (SELECT id FROM asset WHERE customer_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_manufacturer_update AFTER UPDATE OF name ON manufacturer BEGIN
+        UPDATE asset_fts SET manufacturer = new.name
+        WHERE rowid IN (SELECT id FROM asset WHERE manufacturer_id = new.id);
+    END""",
+]
+
+REBUILD_SEARCH_INDEX_SQL = [
+    """DELETE FROM asset_fts""",
+    """INSERT INTO asset_fts (rowid, comments, category, customer, manufacturer)
+        SELECT asset.id, asset.comments, asset.category, customer.name, manufacturer.name
+        FROM asset
+        LEFT OUTER JOIN customer ON customer.id = asset.customer_id
+        LEFT OUTER JOIN manufacturer ON manufacturer.id = asset.manufacturer_id""",
+    """INSERT INTO asset_fts (asset_fts) VALUES ('optimize')""",
+]
+
+DROP_SEARCH_INDEX_DDL = [
+    """DROP TRIGGER IF EXISTS asset_fts_manufacturer_update""",
+    """DROP TRIGGER IF EXISTS asset_fts_customer_update""",
+    """DROP TRIGGER IF EXISTS asset_fts_asset_delete""",
+    """DROP TRIGGER IF EXISTS asset_fts_asset_update""",
+    """DROP TRIGGER IF EXISTS asset_fts_asset_insert""",
+    """DROP TABLE IF EXISTS asset_fts""",
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SEARCH_INDEX_DDL + REBUILD_SEARCH_INDEX_SQL:
+            op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in DROP_SEARCH_INDEX_DDL:
+            op.execute(statement)
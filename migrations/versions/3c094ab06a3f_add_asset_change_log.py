@@ -0,0 +1,49 @@
+"""add asset change log
+
+Revision ID: 3c094ab06a3f
+Revises: 46bcb26ae4b3
+Create Date: 2026-10-18 08:24:57.485373
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c094ab06a3f'
+down_revision = '46bcb26ae4b3'
+branch_labels = None
+depends_on = None
+
+
+# Every existing asset is entered in the new log as a 'create' change, oldest first, so that a client following the log from the start sees the whole register
+
+BACKFILL_SQL = """INSERT INTO asset_change (asset_id, action, changes, user_id, timestamp)
+    SELECT id, 'create', {json_object}('category', category, 'comments', comments, 'customer_id', customer_id,
+        'manufacturer_id', manufacturer_id, 'user_id', user_id), user_id, COALESCE(timestamp, CURRENT_TIMESTAMP)
+    FROM asset ORDER BY id"""
+
+
+def upgrade():
+    op.create_table('asset_change',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('asset_id', sa.Integer(), nullable=False),
+    sa.Column('action', sa.String(length=10), nullable=False),
+    sa.Column('changes', sa.JSON(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    with op.batch_alter_table('asset_change', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_asset_change_asset_id'), ['asset_id'], unique=False)
+
+    json_object = 'json_object' if op.get_bind().dialect.name == 'sqlite' else 'json_build_object'
+    op.execute(BACKFILL_SQL.format(json_object=json_object))
+
+
+def downgrade():
+    with op.batch_alter_table('asset_change', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_asset_change_asset_id'))
+
+    op.drop_table('asset_change')
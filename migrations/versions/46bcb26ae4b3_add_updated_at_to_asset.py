@@ -0,0 +1,76 @@
+"""add updated_at to asset
+
+Revision ID: 46bcb26ae4b3
+Revises: 4b81deee9947
+Create Date: 2026-10-18 08:14:06.821241
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '46bcb26ae4b3'
+down_revision = '4b81deee9947'
+branch_labels = None
+depends_on = None
+
+
+# Existing assets are given their creation time as their last update. Adding the column does not rebuild the asset table, but on SQLite dropping it again does, so the downgrade drops the asset_fts search index triggers first and creates them again afterwards, as in 2ca571354a1a
+
+TRIGGER_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_asset_insert AFTER INSERT ON asset BEGIN
+        INSERT INTO asset_fts (rowid, comments, category, customer, manufacturer) VALUES (
+            new.id, new.comments, new.category,
+            (SELECT name FROM customer WHERE id = new.customer_id),
+            (SELECT name FROM manufacturer WHERE id = new.manufacturer_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_asset_update
+        AFTER UPDATE OF comments, category, customer_id, manufacturer_id ON asset BEGIN
+        DELETE FROM asset_fts WHERE rowid = old.id;
+        INSERT INTO asset_fts (rowid, comments, category, customer, manufacturer) VALUES (
+            new.id, new.comments, new.category,
+            (SELECT name FROM customer WHERE id = new.customer_id),
+            (SELECT name FROM manufacturer WHERE id = new.manufacturer_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_asset_delete AFTER DELETE ON asset BEGIN
+        DELETE FROM asset_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_customer_update AFTER UPDATE OF name ON customer BEGIN
+        UPDATE asset_fts SET customer = new.name
+        WHERE rowid IN (SELECT id FROM asset WHERE customer_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_manufacturer_update AFTER UPDATE OF name ON manufacturer BEGIN
+        UPDATE asset_fts SET manufacturer = new.name
+        WHERE rowid IN (SELECT id FROM asset WHERE manufacturer_id = new.id);
+    END""",
+]
+
+DROP_TRIGGER_DDL = [
+    """DROP TRIGGER IF EXISTS asset_fts_manufacturer_update""",
+    """DROP TRIGGER IF EXISTS asset_fts_customer_update""",
+    """DROP TRIGGER IF EXISTS asset_fts_asset_delete""",
+    """DROP TRIGGER IF EXISTS asset_fts_asset_update""",
+    """DROP TRIGGER IF EXISTS asset_fts_asset_insert""",
+]
+
+
+def execute_on_sqlite(statements):
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in statements:
+            op.execute(statement)
+
+
+def upgrade():
+    with op.batch_alter_table('asset', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    op.execute('UPDATE asset SET updated_at = timestamp')
+
+
+def downgrade():
+    execute_on_sqlite(DROP_TRIGGER_DDL)
+    with op.batch_alter_table('asset', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
+
+    execute_on_sqlite(TRIGGER_DDL)
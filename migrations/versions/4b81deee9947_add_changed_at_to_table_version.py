@@ -0,0 +1,26 @@
+"""add changed_at to table version
+
+Revision ID: 4b81deee9947
+Revises: 2ca571354a1a
+Create Date: 2026-10-18 08:09:48.120041
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b81deee9947'
+down_revision = '2ca571354a1a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('table_version', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('changed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('table_version', schema=None) as batch_op:
+        batch_op.drop_column('changed_at')
@@ -0,0 +1,169 @@
+"""add asset archive
+
+Revision ID: 78cb92d05146
+Revises: 8d7bf8e854ec
+Create Date: 2026-10-18 08:36:47.100230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '78cb92d05146'
+down_revision = '8d7bf8e854ec'
+branch_labels = None
+depends_on = None
+
+# On SQLite the asset table is rebuilt with AUTOINCREMENT, so that the IDs of archived assets are never given to new assets, which means dropping the asset_fts search index triggers first and creating them again afterwards, as in 2ca571354a1a. Archived assets get a search index of their own, archived_asset_fts. The downgrade moves every archived asset back into the asset table before the archive is dropped, so that nothing is lost, and counts the dashboard summary again to include them
+
+TRIGGER_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_asset_insert AFTER INSERT ON asset BEGIN
+        INSERT INTO asset_fts (rowid, comments, category, customer, manufacturer) VALUES (
+            new.id, new.comments, new.category,
+            (SELECT name FROM customer WHERE id = new.customer_id),
+            (SELECT name FROM manufacturer WHERE id = new.manufacturer_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_asset_update
+        AFTER UPDATE OF comments, category, customer_id, manufacturer_id ON asset BEGIN
+        DELETE FROM asset_fts WHERE rowid = old.id;
+        INSERT INTO asset_fts (rowid, comments, category, customer, manufacturer) VALUES (
+            new.id, new.comments, new.category,
+            (SELECT name FROM customer WHERE id = new.customer_id),
+            (SELECT name FROM manufacturer WHERE id = new.manufacturer_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_asset_delete AFTER DELETE ON asset BEGIN
+        DELETE FROM asset_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_customer_update AFTER UPDATE OF name ON customer BEGIN
+        UPDATE asset_fts SET customer = new.name
+        WHERE rowid IN (SELECT id FROM asset WHERE customer_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS asset_fts_manufacturer_update AFTER UPDATE OF name ON manufacturer BEGIN
+        UPDATE asset_fts SET manufacturer = new.name
+        WHERE rowid IN (SELECT id FROM asset WHERE manufacturer_id = new.id);
+    END""",
+]
+
+DROP_TRIGGER_DDL = [
+    """DROP TRIGGER IF EXISTS asset_fts_manufacturer_update""",
+    """DROP TRIGGER IF EXISTS asset_fts_customer_update""",
+    """DROP TRIGGER IF EXISTS asset_fts_asset_delete""",
+    """DROP TRIGGER IF EXISTS asset_fts_asset_update""",
+    """DROP TRIGGER IF EXISTS asset_fts_asset_insert""",
+]
+
+ARCHIVE_SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS archived_asset_fts USING fts5(
+        comments, category, customer, manufacturer, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS archived_asset_fts_archived_asset_insert AFTER INSERT ON archived_asset BEGIN
+        INSERT INTO archived_asset_fts (rowid, comments, category, customer, manufacturer) VALUES (
+            new.id, new.comments, new.category,
+            (SELECT name FROM customer WHERE id = new.customer_id),
+            (SELECT name FROM manufacturer WHERE id = new.manufacturer_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS archived_asset_fts_archived_asset_update
+        AFTER UPDATE OF comments, category, customer_id, manufacturer_id ON archived_asset BEGIN
+        DELETE FROM archived_asset_fts WHERE rowid = old.id;
+        INSERT INTO archived_asset_fts (rowid, comments, category, customer, manufacturer) VALUES (
+            new.id, new.comments, new.category,
+            (SELECT name FROM customer WHERE id = new.customer_id),
+            (SELECT name FROM manufacturer WHERE id = new.manufacturer_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS archived_asset_fts_archived_asset_delete AFTER DELETE ON archived_asset BEGIN
+        DELETE FROM archived_asset_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS archived_asset_fts_customer_update AFTER UPDATE OF name ON customer BEGIN
+        UPDATE archived_asset_fts SET customer = new.name
+        WHERE rowid IN (SELECT id FROM archived_asset WHERE customer_id = new.id);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS archived_asset_fts_manufacturer_update AFTER UPDATE OF name ON manufacturer BEGIN
+        UPDATE archived_asset_fts SET manufacturer = new.name
+        WHERE rowid IN (SELECT id FROM archived_asset WHERE manufacturer_id = new.id);
+    END""",
+]
+
+DROP_ARCHIVE_SEARCH_INDEX_DDL = [
+    """DROP TRIGGER IF EXISTS archived_asset_fts_manufacturer_update""",
+    """DROP TRIGGER IF EXISTS archived_asset_fts_customer_update""",
+    """DROP TRIGGER IF EXISTS archived_asset_fts_archived_asset_delete""",
+    """DROP TRIGGER IF EXISTS archived_asset_fts_archived_asset_update""",
+    """DROP TRIGGER IF EXISTS archived_asset_fts_archived_asset_insert""",
+    """DROP TABLE IF EXISTS archived_asset_fts""",
+]
+
+
+RESTORE_ARCHIVE_SQL = """INSERT INTO asset (id, category, comments, user_id, customer_id, manufacturer_id, timestamp, updated_at, retired)
+    SELECT id, category, comments, user_id, customer_id, manufacturer_id, timestamp, updated_at, retired
+    FROM archived_asset ORDER BY id"""
+
+
+def summary_sql(dialect):
+    month = "strftime('%Y-%m', timestamp)" if dialect == 'sqlite' else "to_char(timestamp, 'YYYY-MM')"
+    statements = ['DELETE FROM asset_summary']
+    for dimension, expression in (
+            ('customer', "COALESCE(CAST(customer_id AS VARCHAR), '')"),
+            ('manufacturer', "COALESCE(CAST(manufacturer_id AS VARCHAR), '')"),
+            ('category', "COALESCE(category, '')"),
+            ('month', f"COALESCE({month}, '')")):
+        statements.append(
+            f"INSERT INTO asset_summary (dimension, value, count) "
+            f"SELECT '{dimension}', {expression}, COUNT(*) FROM asset GROUP BY {expression}")
+    return statements
+
+
+def execute_on_sqlite(statements):
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in statements:
+            op.execute(statement)
+
+
+def upgrade():
+    op.create_table('archived_asset',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('category', sa.String(length=100), nullable=False),
+    sa.Column('comments', sa.Text(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=True),
+    sa.Column('manufacturer_id', sa.Integer(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('retired', sa.Boolean(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['customer_id'], ['customer.id'], name='fk_archived_asset_customer', ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['manufacturer_id'], ['manufacturer.id'], name='fk_archived_asset_manufacturer', ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name='fk_archived_asset_user'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('archived_asset', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_archived_asset_customer_id'), ['customer_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_archived_asset_manufacturer_id'), ['manufacturer_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_archived_asset_user_id'), ['user_id'], unique=False)
+
+    recreate = 'always' if op.get_bind().dialect.name == 'sqlite' else 'auto'
+    execute_on_sqlite(DROP_TRIGGER_DDL)
+    with op.batch_alter_table('asset', schema=None, recreate=recreate,
+                              table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        batch_op.add_column(sa.Column('retired', sa.Boolean(), server_default=sa.false(), nullable=False))
+        batch_op.create_index('ix_asset_retired', ['id'], unique=False, sqlite_where=sa.text('retired = 1'), postgresql_where=sa.text('retired'))
+
+    execute_on_sqlite(TRIGGER_DDL + ARCHIVE_SEARCH_INDEX_DDL)
+
+
+def downgrade():
+    op.execute(RESTORE_ARCHIVE_SQL)
+    for statement in summary_sql(op.get_bind().dialect.name):
+        op.execute(statement)
+
+    execute_on_sqlite(DROP_ARCHIVE_SEARCH_INDEX_DDL + DROP_TRIGGER_DDL)
+    with op.batch_alter_table('asset', schema=None) as batch_op:
+        batch_op.drop_index('ix_asset_retired', sqlite_where=sa.text('retired = 1'), postgresql_where=sa.text('retired'))
+        batch_op.drop_column('retired')
+
+    execute_on_sqlite(TRIGGER_DDL)
+    with op.batch_alter_table('archived_asset', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_archived_asset_user_id'))
+        batch_op.drop_index(batch_op.f('ix_archived_asset_manufacturer_id'))
+        batch_op.drop_index(batch_op.f('ix_archived_asset_customer_id'))
+
+    op.drop_table('archived_asset')
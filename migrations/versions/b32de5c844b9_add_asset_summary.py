@@ -0,0 +1,42 @@
+"""add asset summary
+
+Revision ID: b32de5c844b9
+Revises: 3752f7e9311b
+Create Date: 2026-10-18 07:58:47.330004
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b32de5c844b9'
+down_revision = '3752f7e9311b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('asset_summary',
+    sa.Column('dimension', sa.String(length=20), nullable=False),
+    sa.Column('value', sa.String(length=100), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('dimension', 'value')
+    )
+
+    if op.get_bind().dialect.name == 'sqlite':
+        month = "strftime('%Y-%m', timestamp)"
+    else:
+        month = "to_char(timestamp, 'YYYY-MM')"
+    for dimension, expression in (
+            ('customer', "COALESCE(CAST(customer_id AS VARCHAR), '')"),
+            ('manufacturer', "COALESCE(CAST(manufacturer_id AS VARCHAR), '')"),
+            ('category', "COALESCE(category, '')"),
+            ('month', f"COALESCE({month}, '')")):
+        op.execute(
+            f"INSERT INTO asset_summary (dimension, value, count) "
+            f"SELECT '{dimension}', {expression}, COUNT(*) FROM asset GROUP BY {expression}")
+
+
+def downgrade():
+    op.drop_table('asset_summary')
@@ -0,0 +1,34 @@
+"""index asset query columns
+
+Revision ID: dd8760066eca
+Revises: 20432c43af42
+Create Date: 2026-10-18 09:20:37.415902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dd8760066eca'
+down_revision = '20432c43af42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('asset', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_asset_category'), ['category'], unique=False)
+        batch_op.create_index('ix_asset_customer_id_timestamp', ['customer_id', 'timestamp'], unique=False)
+        batch_op.create_index(batch_op.f('ix_asset_manufacturer_id'), ['manufacturer_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_asset_timestamp'), ['timestamp'], unique=False)
+        batch_op.create_index(batch_op.f('ix_asset_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('asset', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_asset_user_id'))
+        batch_op.drop_index(batch_op.f('ix_asset_timestamp'))
+        batch_op.drop_index(batch_op.f('ix_asset_manufacturer_id'))
+        batch_op.drop_index('ix_asset_customer_id_timestamp')
+        batch_op.drop_index(batch_op.f('ix_asset_category'))
@@ -0,0 +1,42 @@
+import os
+import pytest
+from flask_migrate import stamp, upgrade
+from sqlalchemy import inspect
+from werkzeug.security import generate_password_hash
+
+# The following code lets the test suite run against any supported database. If TEST_DATABASE_URI is set (for example to a local or CI PostgreSQL server), it replaces SQLALCHEMY_DATABASE_URI before the application config is loaded, otherwise the tests use the configured database as before. Rate limits are counted in memory, so that each test module starts with fresh counters instead of sharing the counters of the running application. Metrics are switched on, since the application leaves them off unless asked. Background jobs are not run by worker threads, so that the tests can run them one at a time with run_pending and check the results. The seed_database fixture then brings an existing database, such as the bundled instance/site.db, up to the latest schema by running the migrations (stamping it at the initial revision first if it predates them, as that database does), creates the tables of a new one and, if the database has no assets yet, adds a user, customer and manufacturer with two assets so that the edit and paginated list pages used by the route tests have data on a freshly created database
+
+if os.environ.get('TEST_DATABASE_URI'):
+    os.environ['SQLALCHEMY_DATABASE_URI'] = os.environ['TEST_DATABASE_URI']
+os.environ.setdefault('RATELIMIT_STORAGE_URI', 'memory://')
+os.environ.setdefault('JOBS_RUN_IN_PROCESS', 'false')
+os.environ.setdefault('METRICS_ENABLED', 'true')
+
+from app import create_app, db  # noqa: E402
+from app.models import User, Asset, Customer, Manufacturer  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def seed_database():
+    app = create_app()
+    with app.app_context():
+        tables = inspect(db.engine).get_table_names()
+        if 'asset' in tables:
+            if 'alembic_version' not in tables:
+                stamp(revision='b7071ee27b4b')
+            upgrade()
+        db.create_all()
+        if db.session.query(Asset.id).first() is None:
+            user = User(username='Seed User', role='admin',
+                        password=generate_password_hash('SeedPassword123!', method='scrypt'))
+            customer = Customer(name='Seed Customer')
+            manufacturer = Manufacturer(name='Seed Manufacturer')
+            db.session.add_all([user, customer, manufacturer])
+            db.session.flush()
+            db.session.add_all([
+                Asset(category=category, comments='Seed asset', user_id=user.id,
+                      customer_id=customer.id, manufacturer_id=manufacturer.id)
+                for category in ('Laptop', 'Monitor')])
+            db.session.commit()
+        db.session.remove()
+    yield
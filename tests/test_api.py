@@ -0,0 +1,536 @@
+from datetime import datetime
+import threading
+import pytest
+from app import create_app, db
+from app.models import User, Asset, Customer, Manufacturer
+from app.users import invalidate_users
+from app.models import AssetSummary, AssetChange, Job, ArchivedAsset
+from app.jobs import JOB_TYPES, job_type, enqueue, cancel_job, claim_job, run_pending, requeue_stale_jobs
+from app.summary import rebuild_summary
+from app.archive import archive_assets
+from app.audit import record_changes
+
+# The following code disables CSRF protection to enable the Pytest unit tests that follow to run, which check the JSON API endpoints for assets, customers and manufacturers. A regular user is registered for the tests and removed along with any records they created (including those moved to the archive), and the change log entries and jobs for them, once the tests have finished
+
+
+@pytest.fixture(scope="module")
+def client(request):
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+
+    with app.app_context():
+        db.create_all()
+        first_change = db.session.query(db.func.max(AssetChange.id)).scalar() or 0
+        first_job = db.session.query(db.func.max(Job.id)).scalar() or 0
+
+    def remove_test_data():
+        with app.app_context():
+            AssetChange.query.filter(AssetChange.id > first_change).delete()
+            Job.query.filter(Job.id > first_job).delete()
+            Asset.query.filter(Asset.comments.like('Test API Asset%')).delete(synchronize_session=False)
+            ArchivedAsset.query.filter(ArchivedAsset.comments.like('Test API Asset%')).delete(
+                synchronize_session=False)
+            Customer.query.filter(Customer.name.like('Test API%')).delete(
+                synchronize_session=False)
+            Manufacturer.query.filter(Manufacturer.name.like('Test API%')).delete(
+                synchronize_session=False)
+            User.query.filter_by(username='apiuser').delete()
+            db.session.commit()
+
+    request.addfinalizer(remove_test_data)
+
+    client.post('/register', data=dict(
+        username='apiuser',
+        password='ApiPassword123!',
+        confirm_password='ApiPassword123!'
+    ))
+    client.post('/login', data=dict(
+        username='apiuser',
+        password='ApiPassword123!'
+    ))
+
+    yield client
+
+
+def set_role(client, role):
+    with client.application.app_context():
+        User.query.filter_by(username='apiuser').update({'role': role})
+        db.session.commit()
+
+
+def test_requires_login(client):
+    anonymous = client.application.test_client()
+    response = anonymous.get('/api/v1/assets')
+    assert response.status_code == 401
+    assert 'error' in response.get_json()
+
+
+def test_customer_crud(client):
+    response = client.post('/api/v1/customers', json={'name': 'Test API Customer'})
+    assert response.status_code == 201
+    customer = response.get_json()
+    assert customer['name'] == 'Test API Customer'
+
+    response = client.patch(f"/api/v1/customers/{customer['id']}",
+                            json={'name': 'Test API Customer Renamed'})
+    assert response.get_json()['name'] == 'Test API Customer Renamed'
+
+    response = client.get('/api/v1/customers?name=Test API Customer Renamed')
+    assert [c['id'] for c in response.get_json()['data']] == [customer['id']]
+
+    response = client.post('/api/v1/customers', json={'name': ''})
+    assert response.status_code == 422
+
+    response = client.delete(f"/api/v1/customers/{customer['id']}")
+    assert response.status_code == 403
+
+    set_role(client, 'admin')
+    response = client.delete(f"/api/v1/customers/{customer['id']}")
+    set_role(client, 'regular')
+    assert response.status_code == 204
+    assert client.get(f"/api/v1/customers/{customer['id']}").status_code == 404
+
+
+def test_asset_crud_and_filters(client):
+    customer = client.post('/api/v1/customers',
+                           json={'name': 'Test API Asset Customer'}).get_json()
+    manufacturer = client.post('/api/v1/manufacturers',
+                               json={'name': 'Test API Manufacturer'}).get_json()
+
+    created = []
+    for category in ('Laptop', 'Laptop', 'Monitor'):
+        response = client.post('/api/v1/assets', json={
+            'category': category, 'comments': 'Test API Asset',
+            'customer_id': customer['id'], 'manufacturer_id': manufacturer['id']})
+        assert response.status_code == 201
+        created.append(response.get_json())
+    assert created[0]['customer'] == 'Test API Asset Customer'
+    assert created[0]['author'] == 'apiuser'
+
+    response = client.post('/api/v1/assets', json={
+        'category': 'Toaster', 'customer_id': -1, 'manufacturer_id': manufacturer['id']})
+    assert response.status_code == 422
+    assert set(response.get_json()['errors']) == {'category', 'customer_id'}
+
+    response = client.get(
+        f"/api/v1/assets?customer_id={customer['id']}&category=Laptop&fields=category,customer&per_page=1")
+    body = response.get_json()
+    assert body['data'] == [{'id': created[1]['id'], 'category': 'Laptop',
+                             'customer': 'Test API Asset Customer'}]
+    response = client.get(
+        f"/api/v1/assets?customer_id={customer['id']}&category=Laptop&per_page=1&after={body['next_cursor']}")
+    assert [a['id'] for a in response.get_json()['data']] == [created[0]['id']]
+
+    response = client.get(
+        f"/api/v1/assets?customer_id={customer['id']}&since=2000-01-01&until=2000-01-02")
+    assert response.get_json()['data'] == []
+
+    response = client.get('/api/v1/assets?fields=password')
+    assert response.status_code == 400
+
+    response = client.get('/api/v1/assets/search?q=test api asset customer laptop')
+    assert {a['id'] for a in response.get_json()['data']} == {
+        created[0]['id'], created[1]['id']}
+    assert client.get('/api/v1/assets/search').status_code == 400
+
+    response = client.patch(f"/api/v1/assets/{created[2]['id']}", json={'category': 'Mouse'})
+    assert response.get_json()['category'] == 'Mouse'
+    assert response.get_json()['manufacturer_id'] == manufacturer['id']
+
+    response = client.delete(f"/api/v1/assets/{created[2]['id']}")
+    assert response.status_code == 403
+    set_role(client, 'admin')
+    response = client.delete(f"/api/v1/assets/{created[2]['id']}")
+    set_role(client, 'regular')
+    assert response.status_code == 204
+
+
+# The following test checks the bulk endpoints: a bulk update and a dry run change and count the chosen assets, a regular user cannot bulk delete, and the dashboard's summary counts kept up to date by the bulk statements match counts rebuilt from the asset table
+
+
+def summary_counts():
+    return {(row.dimension, row.value): row.count
+            for row in AssetSummary.query.filter(AssetSummary.count > 0)}
+
+
+def test_bulk_update_and_delete(client):
+    with client.application.app_context():
+        with db.engine.begin() as connection:
+            rebuild_summary(connection)
+    customer = client.post('/api/v1/customers', json={'name': 'Test API Bulk Customer'}).get_json()
+    manufacturer = client.post('/api/v1/manufacturers',
+                               json={'name': 'Test API Bulk Manufacturer'}).get_json()
+    ids = [client.post('/api/v1/assets', json={
+        'category': 'Laptop', 'comments': 'Test API Asset', 'customer_id': customer['id'],
+        'manufacturer_id': manufacturer['id']}).get_json()['id'] for _ in range(3)]
+
+    response = client.post('/api/v1/assets/bulk-update', json={
+        'ids': ids[:2], 'filter': {'customer_id': customer['id']}, 'set': {'category': 'Server'}})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['count'] == 2
+    assert body['breakdown']['category'] == [{'value': 'Laptop', 'count': 2}]
+    response = client.get(f"/api/v1/assets?customer_id={customer['id']}&category=Server&fields=id")
+    assert sorted(asset['id'] for asset in response.get_json()['data']) == ids[:2]
+
+    response = client.post('/api/v1/assets/bulk-update', json={'set': {'category': 'Server'}})
+    assert response.status_code == 422
+    response = client.post('/api/v1/assets/bulk-update', json={'ids': ids, 'set': {'category': 'Toaster'}})
+    assert response.status_code == 422
+
+    response = client.post('/api/v1/assets/bulk-delete', json={'ids': ids[2:]})
+    assert response.status_code == 403
+    set_role(client, 'admin')
+    response = client.post('/api/v1/assets/bulk-delete', json={
+        'filter': {'customer_id': customer['id']}, 'dry_run': True})
+    assert response.get_json()['count'] == 3
+    response = client.post('/api/v1/assets/bulk-delete', json={'ids': ids[2:]})
+    set_role(client, 'regular')
+    assert response.get_json()['count'] == 1
+    response = client.get(f"/api/v1/assets?customer_id={customer['id']}&fields=id")
+    assert sorted(asset['id'] for asset in response.get_json()['data']) == ids[:2]
+
+    with client.application.app_context():
+        incremental = summary_counts()
+        with db.engine.begin() as connection:
+            rebuild_summary(connection)
+        assert incremental == summary_counts()
+    assert incremental[('customer', str(customer['id']))] == 2
+
+
+# The following test checks the delete policies for customers and manufacturers: the preview counts a customer's assets, 'block' refuses to delete a customer that has assets, 'reassign' moves them to another customer, 'cascade' deletes them and 'nullify' keeps them without a manufacturer, with the summary counts matching counts rebuilt from the asset table afterwards
+
+
+def test_delete_policies(client):
+    with client.application.app_context():
+        with db.engine.begin() as connection:
+            rebuild_summary(connection)
+    first = client.post('/api/v1/customers', json={'name': 'Test API Policy Customer'}).get_json()
+    second = client.post('/api/v1/customers', json={'name': 'Test API Policy Target'}).get_json()
+    manufacturer = client.post('/api/v1/manufacturers',
+                               json={'name': 'Test API Policy Manufacturer'}).get_json()
+    ids = [client.post('/api/v1/assets', json={
+        'category': category, 'comments': 'Test API Asset', 'customer_id': first['id'],
+        'manufacturer_id': manufacturer['id']}).get_json()['id'] for category in ('Laptop', 'Laptop', 'Mouse')]
+
+    preview = client.get(f"/api/v1/customers/{first['id']}/delete-preview").get_json()
+    assert preview['count'] == 3
+    assert preview['breakdown']['category'] == [{'value': 'Laptop', 'count': 2}, {'value': 'Mouse', 'count': 1}]
+
+    set_role(client, 'admin')
+    response = client.delete(f"/api/v1/customers/{first['id']}?policy=block")
+    assert response.status_code == 409
+    response = client.delete(f"/api/v1/customers/{first['id']}?policy=reassign")
+    assert response.status_code == 422
+    response = client.delete(f"/api/v1/customers/{first['id']}?policy=reassign&target_id={second['id']}")
+    assert response.status_code == 204
+    response = client.get(f"/api/v1/assets?customer_id={second['id']}&fields=id")
+    assert sorted(asset['id'] for asset in response.get_json()['data']) == ids
+
+    response = client.delete(f"/api/v1/manufacturers/{manufacturer['id']}?policy=nullify")
+    assert response.status_code == 204
+    assert client.get(f"/api/v1/assets/{ids[0]}").get_json()['manufacturer_id'] is None
+
+    response = client.delete(f"/api/v1/customers/{second['id']}?policy=cascade")
+    set_role(client, 'regular')
+    assert response.status_code == 204
+    assert all(client.get(f'/api/v1/assets/{id}').status_code == 404 for id in ids)
+
+    with client.application.app_context():
+        incremental = summary_counts()
+        with db.engine.begin() as connection:
+            rebuild_summary(connection)
+        assert incremental == summary_counts()
+
+
+# The following test checks the asset change log: creating, editing and deleting an asset through the API and editing and deleting assets in bulk each add entries with the fields involved and the user who made the change, edits that change nothing add none, and the changes endpoint pages through the log by sequence number
+
+
+def test_asset_changes(client):
+    since = client.get('/api/v1/assets/changes?per_page=1').get_json()['latest']
+    with client.application.app_context():
+        user_id = User.query.filter_by(username='apiuser').one().id
+    customer = client.post('/api/v1/customers', json={'name': 'Test API Changes Customer'}).get_json()
+    manufacturer = client.post('/api/v1/manufacturers',
+                               json={'name': 'Test API Changes Manufacturer'}).get_json()
+    ids = [client.post('/api/v1/assets', json={
+        'category': 'Laptop', 'comments': 'Test API Asset', 'customer_id': customer['id'],
+        'manufacturer_id': manufacturer['id']}).get_json()['id'] for _ in range(3)]
+    client.patch(f'/api/v1/assets/{ids[0]}', json={'category': 'Mouse'})
+    client.patch(f'/api/v1/assets/{ids[0]}', json={'category': 'Mouse'})
+    client.post('/api/v1/assets/bulk-update', json={'ids': ids, 'set': {'category': 'Server'}})
+    set_role(client, 'admin')
+    client.delete(f'/api/v1/assets/{ids[1]}')
+    client.post('/api/v1/assets/bulk-delete', json={'ids': ids})
+    set_role(client, 'regular')
+
+    changes = []
+    sequence = since
+    while True:
+        body = client.get(f'/api/v1/assets/changes?since={sequence}&per_page=3').get_json()
+        changes += body['data']
+        sequence = body['sequence']
+        if not body['has_more']:
+            break
+    assert sequence == body['latest']
+    assert [change['sequence'] for change in changes] == sorted(change['sequence'] for change in changes)
+    assert all(change['user_id'] == user_id for change in changes)
+    assert [(change['action'], change['asset_id']) for change in changes] == [
+        ('create', ids[0]), ('create', ids[1]), ('create', ids[2]), ('update', ids[0]), ('update', ids[0]),
+        ('update', ids[1]), ('update', ids[2]), ('delete', ids[1]), ('delete', ids[0]), ('delete', ids[2])]
+    assert changes[0]['changes'] == {
+        'category': 'Laptop', 'comments': 'Test API Asset', 'customer_id': customer['id'],
+        'manufacturer_id': manufacturer['id'], 'user_id': user_id}
+    assert changes[3]['changes'] == {'category': ['Laptop', 'Mouse']}
+    assert changes[4]['changes'] == {'category': ['Mouse', 'Server']}
+    assert changes[5]['changes'] == {'category': ['Laptop', 'Server']}
+    assert changes[-1]['changes']['category'] == 'Server'
+
+    assert client.get('/api/v1/assets/changes?since=soon').status_code == 400
+
+
+# The following test checks that change log entries become visible in the order of their sequence numbers: while one transaction has written to the log and not yet committed, another cannot commit an entry of its own, which would otherwise get a higher sequence number and could be read by a client before the first one is
+
+
+def test_asset_changes_follow_commit_order(client):
+    app = client.application
+    finished = threading.Event()
+
+    def write_second():
+        with app.app_context(), db.engine.connect() as second:
+            record_changes(second, [{'asset_id': 0, 'action': 'second', 'changes': {}}])
+            second.commit()
+        finished.set()
+
+    with app.app_context():
+        try:
+            with db.engine.connect() as first:
+                record_changes(first, [{'asset_id': 0, 'action': 'first', 'changes': {}}])
+                thread = threading.Thread(target=write_second)
+                thread.start()
+                assert not finished.wait(0.5)
+                first.commit()
+            thread.join(15)
+            assert finished.is_set()
+            sequence = dict(db.session.query(AssetChange.action, AssetChange.id)
+                            .filter(AssetChange.action.in_(['first', 'second'])))
+            assert sequence['first'] < sequence['second']
+        finally:
+            AssetChange.query.filter(AssetChange.action.in_(['first', 'second'])).delete()
+            db.session.commit()
+
+
+# The following test checks the background jobs: an export started through the API is queued and answered straight away, runs when a worker takes it and can then be downloaded, a job that fails unexpectedly is retried until it has used up its attempts, queued and running jobs can be cancelled, a job whose worker has stopped is queued again, and deleting a customer with more assets than JOB_DELETE_THRESHOLD returns 202 with a job that deletes it
+
+
+def test_jobs(client, tmp_path):
+    app = client.application
+    app.config.update(JOB_FILES_DIR=str(tmp_path), JOB_RETRY_DELAY=0)
+    with app.app_context():
+        user_id = User.query.filter_by(username='apiuser').one().id
+        total = Asset.query.count()
+
+    response = client.post('/api/v1/jobs', json={'type': 'export_assets', 'params': {'format': 'jsonl'}})
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job['status'] == 'queued'
+    assert response.headers['Location'].endswith(f"/api/v1/jobs/{job['id']}")
+    assert client.post('/api/v1/jobs', json={'type': 'rebuild_search'}).status_code == 403
+    assert client.post('/api/v1/jobs', json={'type': 'delete_record'}).status_code == 400
+    assert client.get(f"/api/v1/jobs/{job['id']}/download").status_code == 404
+
+    assert run_pending(app) == 1
+    job = client.get(f"/api/v1/jobs/{job['id']}").get_json()
+    assert job['status'] == 'succeeded'
+    assert job['result']['rows'] == job['progress'] == job['total'] == total
+    response = client.get(f"/api/v1/jobs/{job['id']}/download")
+    assert response.mimetype == 'application/x-ndjson'
+    assert len(response.get_data(as_text=True).splitlines()) == total
+    response.close()
+    assert [listed['id'] for listed in client.get('/api/v1/jobs?status=succeeded').get_json()['data']] == [job['id']]
+
+    attempts = []
+
+    @job_type('test_flaky', max_attempts=2)
+    def flaky_job(context):
+        attempts.append(context.attempt)
+        raise RuntimeError('Flaky job')
+
+    @job_type('test_cancelled')
+    def cancelled_job(context):
+        cancel_job(context.job_id)
+        context.progress(1, 2)
+        attempts.append('not cancelled')
+
+    try:
+        with app.app_context():
+            flaky = enqueue('test_flaky', user_id=user_id).id
+            cancelled = enqueue('test_cancelled', user_id=user_id).id
+            queued = enqueue('test_cancelled', user_id=user_id).id
+        response = client.post(f'/api/v1/jobs/{queued}/cancel')
+        assert response.get_json()['status'] == 'cancelled'
+        assert client.post(f'/api/v1/jobs/{queued}/cancel').status_code == 409
+
+        assert run_pending(app) == 3
+        assert attempts == [1, 2]
+        job = client.get(f'/api/v1/jobs/{flaky}').get_json()
+        assert (job['status'], job['attempts']) == ('failed', 2)
+        assert 'Flaky job' in job['error']
+        assert client.get(f'/api/v1/jobs/{cancelled}').get_json()['status'] == 'cancelled'
+    finally:
+        del JOB_TYPES['test_flaky'], JOB_TYPES['test_cancelled']
+
+    with app.app_context():
+        stale = enqueue('rebuild_summary', user_id=user_id).id
+        assert claim_job('stopped-worker') == stale
+        Job.query.filter_by(id=stale).update({'heartbeat_at': datetime(2000, 1, 1)})
+        db.session.commit()
+        assert requeue_stale_jobs(app) == (1, 0)
+    assert run_pending(app) == 1
+    job = client.get(f'/api/v1/jobs/{stale}').get_json()
+    assert (job['status'], job['attempts']) == ('succeeded', 2)
+
+    customer = client.post('/api/v1/customers', json={'name': 'Test API Job Customer'}).get_json()
+    manufacturer = client.post('/api/v1/manufacturers', json={'name': 'Test API Job Manufacturer'}).get_json()
+    for _ in range(2):
+        client.post('/api/v1/assets', json={'category': 'Laptop', 'comments': 'Test API Asset',
+                                            'customer_id': customer['id'], 'manufacturer_id': manufacturer['id']})
+    app.config['JOB_DELETE_THRESHOLD'] = 1
+    set_role(client, 'admin')
+    try:
+        response = client.delete(f"/api/v1/customers/{customer['id']}?policy=cascade")
+        assert response.status_code == 202
+        assert client.get(f"/api/v1/customers/{customer['id']}").status_code == 200
+        assert run_pending(app) == 1
+        job = client.get(response.headers['Location']).get_json()
+        assert job['result'] == {'policy': 'cascade', 'count': 2, 'target_id': None}
+        assert client.get(f"/api/v1/customers/{customer['id']}").status_code == 404
+    finally:
+        set_role(client, 'regular')
+        app.config.update(JOB_DELETE_THRESHOLD=10000, JOB_FILES_DIR=None, JOB_RETRY_DELAY=10)
+
+
+# The following test checks archiving: an archive job (admin only) moves an old asset and a retired asset out of the asset register in batches, taking them off the dashboard counts and recording them in the change log, after which they are only found through the archived asset endpoints and an archived search, and restoring an asset brings it back no longer retired
+
+
+def test_archive_assets(client):
+    app = client.application
+    customer = client.post('/api/v1/customers', json={'name': 'Test API Archive Customer'}).get_json()
+    manufacturer = client.post('/api/v1/manufacturers', json={'name': 'Test API Archive Manufacturer'}).get_json()
+    old, retired, current = [client.post('/api/v1/assets', json={
+        'category': 'Laptop', 'comments': 'Test API Asset zephyrarchive', 'customer_id': customer['id'],
+        'manufacturer_id': manufacturer['id']}).get_json()['id'] for _ in range(3)]
+    with app.app_context():
+        Asset.query.filter_by(id=old).update({'timestamp': datetime(2000, 1, 1)})
+        db.session.commit()
+    assert client.patch(f'/api/v1/assets/{retired}', json={'retired': 'yes'}).status_code == 422
+    assert client.patch(f'/api/v1/assets/{retired}', json={'retired': True}).get_json()['retired'] is True
+    total = client.get('/api/v1/dashboard').get_json()['total']
+
+    params = {'older_than_days': 9000, 'retired': True}
+    assert client.post('/api/v1/jobs', json={'type': 'archive_assets', 'params': params}).status_code == 403
+    set_role(client, 'admin')
+    app.config['ARCHIVE_BATCH_SIZE'] = 1
+    try:
+        assert client.post('/api/v1/jobs', json={
+            'type': 'archive_assets', 'params': {'older_than_days': None, 'retired': False}}).status_code == 422
+        response = client.post('/api/v1/jobs', json={'type': 'archive_assets', 'params': params})
+        assert response.status_code == 202
+        assert run_pending(app) == 1
+        job = client.get(response.headers['Location']).get_json()
+        assert job['status'] == 'succeeded'
+        assert job['result'] == {'count': 2, 'batches': 2}
+    finally:
+        app.config['ARCHIVE_BATCH_SIZE'] = 5000
+        set_role(client, 'regular')
+
+    assert client.get(f'/api/v1/assets/{old}').status_code == 404
+    assert client.get(f'/api/v1/assets/{current}').status_code == 200
+    archived = client.get(f'/api/v1/assets/archived/{retired}').get_json()
+    assert archived['retired'] is True and archived['archived_at']
+    response = client.get(f"/api/v1/assets/archived?customer_id={customer['id']}&fields=customer")
+    assert response.get_json()['data'] == [
+        {'id': retired, 'customer': 'Test API Archive Customer'},
+        {'id': old, 'customer': 'Test API Archive Customer'}]
+    assert [row['id'] for row in client.get('/api/v1/assets/search?q=zephyrarchive').get_json()['data']] == [current]
+    found = client.get('/api/v1/assets/search?q=zephyrarchive&archived=1').get_json()['data']
+    assert sorted(row['id'] for row in found) == [old, retired]
+    assert client.get('/api/v1/dashboard').get_json()['total'] == total - 2
+    changes = client.get('/api/v1/assets/changes?since=0&per_page=1000').get_json()['data']
+    assert [(change['action'], change['asset_id']) for change in changes if change['action'] == 'archive'][-2:] == [
+        ('archive', old), ('archive', retired)]
+
+    assert client.post('/api/v1/assets/archived/restore', json={'ids': [retired]}).status_code == 403
+    set_role(client, 'admin')
+    try:
+        response = client.post('/api/v1/assets/archived/restore', json={'ids': [retired]})
+        assert response.get_json()['count'] == 1
+    finally:
+        set_role(client, 'regular')
+    assert client.get(f'/api/v1/assets/{retired}').get_json()['retired'] is False
+    assert client.get(f'/api/v1/assets/archived/{retired}').status_code == 404
+    assert client.get('/api/v1/dashboard').get_json()['total'] == total - 1
+
+
+# The following test checks that the delete policies cover archived assets as well: a customer whose only asset is archived counts it in the delete preview, cannot be deleted under 'block', and takes the archived asset with it to the new customer, to no customer or into the delete under 'reassign', 'nullify' and 'cascade'
+
+
+def test_delete_policies_cover_archived_assets(client):
+    app = client.application
+    target = client.post('/api/v1/customers', json={'name': 'Test API Archived Target'}).get_json()
+    manufacturer = client.post('/api/v1/manufacturers',
+                               json={'name': 'Test API Archived Manufacturer'}).get_json()
+
+    def archived_customer(policy):
+        customer = client.post('/api/v1/customers', json={'name': f'Test API Archived {policy}'}).get_json()
+        asset_id = client.post('/api/v1/assets', json={
+            'category': 'Laptop', 'comments': 'Test API Asset', 'customer_id': customer['id'],
+            'manufacturer_id': manufacturer['id']}).get_json()['id']
+        with app.app_context():
+            assert archive_assets([Asset.id == asset_id]).count == 1
+        return customer['id'], asset_id
+
+    def archived_asset(asset_id):
+        return client.get(f'/api/v1/assets/archived/{asset_id}')
+
+    set_role(client, 'admin')
+    try:
+        customer_id, asset_id = archived_customer('block')
+        preview = client.get(f'/api/v1/customers/{customer_id}/delete-preview').get_json()
+        assert (preview['count'], preview['archived']) == (1, 1)
+        assert client.delete(f'/api/v1/customers/{customer_id}?policy=block').status_code == 409
+        assert archived_asset(asset_id).get_json()['customer_id'] == customer_id
+
+        customer_id, asset_id = archived_customer('reassign')
+        response = client.delete(f"/api/v1/customers/{customer_id}?policy=reassign&target_id={target['id']}")
+        assert response.status_code == 204
+        assert archived_asset(asset_id).get_json()['customer_id'] == target['id']
+
+        customer_id, asset_id = archived_customer('nullify')
+        assert client.delete(f'/api/v1/customers/{customer_id}?policy=nullify').status_code == 204
+        assert archived_asset(asset_id).get_json()['customer_id'] is None
+
+        customer_id, asset_id = archived_customer('cascade')
+        assert client.delete(f'/api/v1/customers/{customer_id}?policy=cascade').status_code == 204
+        assert archived_asset(asset_id).status_code == 404
+    finally:
+        set_role(client, 'regular')
+
+
+# The following test checks that a user demoted from admin cannot delete anything while their cached details still say they are an admin, since the role is changed here with a bulk UPDATE that does not pass through the cache's change tracking
+
+
+def test_demoted_admin_cannot_delete(client):
+    customer = client.post('/api/v1/customers', json={'name': 'Test API Demoted'}).get_json()
+    set_role(client, 'admin')
+    invalidate_users(client.application)
+    assert client.get('/api/v1/customers').status_code == 200
+
+    set_role(client, 'regular')
+    response = client.delete(f"/api/v1/customers/{customer['id']}")
+    assert response.status_code == 403
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -1,6 +1,18 @@
 import pytest
+import threading
+import time
 from app import create_app, db
+from sqlalchemy import text, create_engine
+from app.database import sqlite_pragmas, register_sqlite_pragmas
 from app.models import User, Asset, Customer, Manufacturer
+from app.lookups import get_choices
+from app.versions import bump_table_versions, get_table_version
+from app.ratelimits import SQLiteStorage
+from concurrent.futures import ProcessPoolExecutor
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import MovingWindowRateLimiter, FixedWindowRateLimiter
+import multiprocessing
 
 # The following code disables CSRF protection to enable the Pytest unit tests that follow to run, which check the database models to ensure that data can be added to each of the tables (User, Asset, Customer and Manufacturer). The remove_test_data function is then run at the end to delete all of the test data created during the tests, whilst leaving the pre-existing data within the database intact
 
@@ -24,10 +36,10 @@ def client(app):
 
 def remove_test_data(app):
     with app.app_context():
+        db.session.query(Asset).filter_by(category='Test Category').delete()
         db.session.query(User).filter_by(username='Test User').delete()
         db.session.query(User).filter_by(
             username='Test Asset Form User').delete()
-        db.session.query(Asset).filter_by(category='Test Category').delete()
         db.session.query(Customer).filter_by(
             name='Test Asset Form Customer').delete()
         db.session.query(Manufacturer).filter_by(
@@ -35,6 +47,8 @@ def remove_test_data(app):
         db.session.query(Customer).filter_by(name='Test Customer').delete()
         db.session.query(Manufacturer).filter_by(
             name='Test Manufacturer').delete()
+        db.session.query(Customer).filter_by(
+            name='Test Lookup Customer').delete()
         db.session.commit()
 
 
@@ -93,6 +107,139 @@ def test_create_manufacturer(client):
         assert manufacturer.name == 'Test Manufacturer'
 
 
+def test_lookup_choices_cache(client):
+    with client.application.app_context():
+        choices = get_choices('customer')
+        assert get_choices('customer') is choices
+
+        customer = Customer(name='Test Lookup Customer')
+        db.session.add(customer)
+        db.session.commit()
+        assert (customer.id, 'Test Lookup Customer') in get_choices('customer')
+
+        customer.name = 'Test Lookup Customer'
+        db.session.commit()
+        choices = get_choices('customer')
+        assert get_choices('customer') is choices
+
+        client.application.config['LOOKUP_CACHE_TTL'] = 0
+        db.session.execute(text(
+            "UPDATE table_version SET version = version + 1 WHERE name = 'customer'"))
+        db.session.commit()
+        assert get_choices('customer') is not choices
+        client.application.config['LOOKUP_CACHE_TTL'] = 5
+
+
+# The following test checks that bump_table_versions creates the version row of a table the first time it is changed and increments it afterwards, with the same statement each time
+
+
+def test_bump_table_versions(client):
+    with client.application.app_context():
+        db.session.execute(text("DELETE FROM table_version WHERE name = 'test_table'"))
+        bump_table_versions(db.session, {'test_table'})
+        bump_table_versions(db.session, {'test_table', 'customer'})
+        assert get_table_version(db.session, 'test_table') == 2
+        db.session.rollback()
+        assert get_table_version(db.session, 'test_table') == 0
+
+
+# The following test fails if any foreign key column in the models is not the leading column of an index (or the primary key), since relationship loads and the checks made when a parent row is deleted would otherwise have to scan the whole child table
+
+
+def test_foreign_keys_are_indexed():
+    for table in db.metadata.sorted_tables:
+        leading_columns = {index.columns.values()[0].name for index in table.indexes}
+        if table.primary_key.columns:
+            leading_columns.add(table.primary_key.columns.values()[0].name)
+        for foreign_key in table.foreign_keys:
+            assert foreign_key.parent.name in leading_columns, \
+                f'{table.name}.{foreign_key.parent.name} has no index'
+
+
+def test_sqlite_pragmas(client):
+    with client.application.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            pytest.skip('SQLite connection pragmas only apply to SQLite')
+        with db.engine.connect() as connection:
+            assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert connection.execute(text('PRAGMA synchronous')).scalar() == 1
+            assert connection.execute(text('PRAGMA busy_timeout')).scalar() == \
+                client.application.config['SQLITE_BUSY_TIMEOUT']
+
+
+# The following test runs several writer threads, each with its own connection, against a temporary SQLite file using the same connection pragmas as the application, to check that concurrent writes wait for each other instead of failing with 'database is locked'
+
+
+def test_sqlite_concurrent_writes(client, tmp_path):
+    if client.application.config['SQLALCHEMY_DATABASE_URI'].split(':')[0] != 'sqlite':
+        pytest.skip('SQLite connection pragmas only apply to SQLite')
+    engine = create_engine(
+        'sqlite:///' + str(tmp_path / 'concurrency.db'), pool_size=8)
+    register_sqlite_pragmas(engine, sqlite_pragmas(client.application.config))
+    with engine.begin() as connection:
+        connection.execute(
+            text('CREATE TABLE item (id INTEGER PRIMARY KEY, worker INTEGER)'))
+
+    errors = []
+
+    def write(worker):
+        try:
+            for _ in range(50):
+                with engine.begin() as connection:
+                    connection.execute(
+                        text('INSERT INTO item (worker) VALUES (:worker)'), {'worker': worker})
+                    connection.execute(text('SELECT COUNT(*) FROM item')).scalar()
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with engine.connect() as connection:
+        assert connection.execute(text('SELECT COUNT(*) FROM item')).scalar() == 300
+    engine.dispose()
+    assert errors == []
+
+
+# The following tests check the SQLite rate limit storage. Separate processes, each with its own storage object, stand in for gunicorn workers sharing one file, and between them they must never be allowed more hits than the limit
+
+
+def take_hits(uri, strategy, hits):
+    limiter = strategy(storage_from_string(uri))
+    limit = parse('15/minute')
+    return sum(limiter.hit(limit, 'login', '10.0.0.1') for _ in range(hits))
+
+
+@pytest.mark.parametrize('strategy', [MovingWindowRateLimiter, FixedWindowRateLimiter])
+def test_sqlite_rate_limit_storage_is_shared(tmp_path, strategy):
+    uri = 'sqlite:///' + str(tmp_path / 'ratelimits.db')
+    assert isinstance(storage_from_string(uri), SQLiteStorage)
+
+    with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context('fork')) as pool:
+        allowed = list(pool.map(take_hits, [uri] * 4, [strategy] * 4, [10] * 4))
+    assert sum(allowed) == 15
+
+    limiter = strategy(storage_from_string(uri))
+    limit = parse('15/minute')
+    assert not limiter.hit(limit, 'login', '10.0.0.1')
+    assert limiter.get_window_stats(limit, 'login', '10.0.0.1').remaining == 0
+    assert limiter.hit(limit, 'login', '10.0.0.2')
+    limiter.clear(limit, 'login', '10.0.0.1')
+    assert limiter.hit(limit, 'login', '10.0.0.1')
+
+
+def test_sqlite_rate_limit_moving_window_expires(tmp_path):
+    limiter = MovingWindowRateLimiter(SQLiteStorage('sqlite:///' + str(tmp_path / 'ratelimits.db')))
+    limit = parse('2/second')
+    assert limiter.hit(limit, 'key') and limiter.hit(limit, 'key')
+    assert not limiter.hit(limit, 'key')
+    time.sleep(1.05)
+    assert limiter.hit(limit, 'key')
+
+
 def reset_db(app):
     remove_test_data(app)
 
@@ -111,6 +258,8 @@ def reset_db(app):
             name='Test Customer').count() == 0
         assert db.session.query(Manufacturer).filter_by(
             name='Test Manufacturer').count() == 0
+        assert db.session.query(Customer).filter_by(
+            name='Test Lookup Customer').count() == 0
 
 
 if __name__ == '__main__':
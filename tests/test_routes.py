@@ -1,6 +1,24 @@
+import gzip
+import io
+import json
 import pytest
 from app import create_app, db
-from app.models import User
+from config import Config
+from app.models import User, Asset, ArchivedAsset, Customer, Manufacturer, Job
+from app.pagination import encode_cursor
+from app.instrumentation import assert_max_queries
+from app import metrics
+from app.log import start_logging
+from app.summary import rebuild_summary
+from app.models import AssetSummary
+from app.fragments import asset_fragments
+from app.users import CachedUser, invalidate_users
+from app.profiling import list_profiles, _start_profile
+from app.jobs import run_pending
+from app.archive import archive_assets, select_archivable
+from werkzeug.security import generate_password_hash
+from flask import url_for
+from flask_login import login_user
 
 # The following code disables CSRF protection to enable the Pytest unit tests that follow to run, which check the routes for the various pages that comprise the application
 
@@ -13,9 +31,26 @@ def client(request):
 
     with app.app_context():
         db.create_all()
+        first_job = db.session.query(db.func.max(Job.id)).scalar() or 0
 
     def remove_test_data():
         with app.app_context():
+            Job.query.filter(Job.id > first_job).delete()
+            Asset.query.filter_by(comments='Test Import Asset').delete()
+            Asset.query.filter_by(comments='Zebracorn SN 4411').delete()
+            Asset.query.filter_by(comments='Test Dashboard Asset').delete()
+            Asset.query.filter_by(comments='Test Delete Asset').delete()
+            ArchivedAsset.query.filter_by(comments='Quokkatron SN 7702').delete()
+            Asset.query.filter(Asset.comments.in_(['Test Fragment Asset', 'Test Fragment Asset Edited'])).delete()
+            Customer.query.filter(Customer.name.in_(
+                ['Test Import Customer', 'Test Search Customer', 'Test Renamed Customer', 'Test Delete Customer',
+                 'Test Cache Customer', 'Test Cache Customer Renamed', 'Test Fragment Customer',
+                 'Test Fragment Customer Renamed', 'Test Archive Customer'])).delete()
+            Manufacturer.query.filter(Manufacturer.name.in_(
+                ['Test Import Manufacturer', 'Test Archive Manufacturer'])).delete()
+            db.session.commit()
+            User.query.filter_by(username='rehashuser').delete()
+            db.session.commit()
             user = User.query.filter_by(username='testuser').first()
             if user:
                 db.session.delete(user)
@@ -48,6 +83,27 @@ def test_login(client):
     assert b'Successfully logged in' in response.data
 
 
+def test_login_upgrades_outdated_password_hash(client):
+    with client.application.app_context():
+        db.session.add(User(username='rehashuser', role='regular', password=generate_password_hash(
+            'RehashPassword123!', method='pbkdf2:sha256:1000')))
+        db.session.commit()
+
+    other_client = client.application.test_client()
+    login = dict(username='rehashuser', password='WrongPassword123!')
+    other_client.post('/login', data=login, environ_base={'REMOTE_ADDR': '10.0.0.13'})
+    with client.application.app_context():
+        assert User.query.filter_by(username='rehashuser').first().password.startswith('pbkdf2:')
+
+    login['password'] = 'RehashPassword123!'
+    response = other_client.post('/login', data=login, environ_base={'REMOTE_ADDR': '10.0.0.13'},
+                                 follow_redirects=True)
+    assert b'Successfully logged in' in response.data
+    with client.application.app_context():
+        password_hash = User.query.filter_by(username='rehashuser').first().password
+    assert password_hash.startswith(client.application.config['PASSWORD_HASH_METHOD'] + '$')
+
+
 def test_assets(client):
     response = client.post('/login', data=dict(
         username='testuser',
@@ -59,6 +115,542 @@ def test_assets(client):
     assert b'Asset Management' in response.data
 
 
+def test_assets_pagination(client):
+    response = client.post('/login', data=dict(
+        username='testuser',
+        password='TestPassword123!'
+    ), follow_redirects=True)
+
+    response = client.get('/assets?per_page=1')
+    assert response.status_code == 200
+    assert response.data.count(b'<strong>Category:</strong>') == 1
+    assert b'Older' in response.data
+    assert b'Newer' not in response.data
+
+    with client.application.app_context():
+        newest_id = db.session.query(db.func.max(Asset.id)).scalar()
+        cursor = encode_cursor(newest_id)
+
+    response = client.get('/assets?per_page=1&after=' + cursor)
+    assert response.status_code == 200
+    assert response.data.count(b'<strong>Category:</strong>') == 1
+    assert b'Newer' in response.data
+
+
+def test_import_assets(client):
+    response = client.post('/login', data=dict(
+        username='testuser',
+        password='TestPassword123!'
+    ), follow_redirects=True)
+
+    with client.application.app_context():
+        db.session.add_all([Customer(name='Test Import Customer'),
+                            Manufacturer(name='Test Import Manufacturer')])
+        db.session.commit()
+
+    response = client.get('/assets/import')
+    assert response.status_code == 200
+    assert b'Import Assets' in response.data
+
+    csv_data = (
+        'category,customer,manufacturer,comments\n'
+        'Laptop,Test Import Customer,Test Import Manufacturer,Test Import Asset\n'
+        'Monitor,test import customer,Test Import Manufacturer,Test Import Asset\n'
+        'Toaster,Test Import Customer,Test Import Manufacturer,Test Import Asset\n'
+        'Mouse,Unknown Customer,Test Import Manufacturer,Test Import Asset\n'
+    )
+    response = client.post('/assets/import', data=dict(
+        file=(io.BytesIO(csv_data.encode()), 'assets.csv')
+    ), content_type='multipart/form-data', follow_redirects=True)
+
+    assert b'2 assets imported, 2 rows rejected' in response.data
+    assert b"Line 4: Invalid category &#39;Toaster&#39;" in response.data
+    assert b"Line 5: Unknown customer &#39;Unknown Customer&#39;" in response.data
+
+    with client.application.app_context():
+        assert Asset.query.filter_by(
+            comments='Test Import Asset').count() == 2
+
+
+def test_export_assets(client):
+    response = client.post('/login', data=dict(
+        username='testuser',
+        password='TestPassword123!'
+    ), follow_redirects=True)
+
+    with client.application.app_context():
+        asset_count = Asset.query.count()
+
+    response = client.get('/assets/export?format=csv')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.is_streamed
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0] == 'id,category,comments,customer,manufacturer,author,timestamp'
+    assert len(lines) == asset_count + 1
+
+    response = client.get('/assets/export?format=jsonl')
+    assert response.status_code == 200
+    records = [json.loads(line)
+               for line in response.get_data(as_text=True).splitlines()]
+    assert len(records) == asset_count
+    assert set(records[0]) == {'id', 'category', 'comments', 'customer',
+                               'manufacturer', 'author', 'timestamp'}
+
+    response = client.get('/assets/export?format=xml')
+    assert response.status_code == 400
+
+
+# The following test checks that a file larger than JOB_IMPORT_THRESHOLD_BYTES is imported by a background job: the upload returns the job's page straight away, and once the job has run the page shows the same results as an import within the request and the uploaded file is removed. The job is given the state saved by an earlier attempt that committed the first row, to check that a retried import carries on after it rather than importing it again
+
+
+def test_background_import(client, tmp_path):
+    app = client.application
+    app.config.update(JOB_FILES_DIR=str(tmp_path), JOB_IMPORT_THRESHOLD_BYTES=0)
+    client.post('/login', data=dict(username='testuser', password='TestPassword123!'))
+    with app.app_context():
+        imported = Asset.query.filter_by(comments='Test Import Asset').count()
+
+    csv_data = (
+        'category,customer,manufacturer,comments\n'
+        'Laptop,Test Import Customer,Test Import Manufacturer,Test Import Asset\n'
+        'Monitor,test import customer,Test Import Manufacturer,Test Import Asset\n'
+        'Toaster,Test Import Customer,Test Import Manufacturer,Test Import Asset\n'
+        'Mouse,Unknown Customer,Test Import Manufacturer,Test Import Asset\n'
+    )
+    try:
+        response = client.post('/assets/import', data=dict(
+            file=(io.BytesIO(csv_data.encode()), 'assets.csv')
+        ), content_type='multipart/form-data')
+        assert response.status_code == 302
+        job_id = int(response.location.rsplit('/', 1)[-1])
+        response = client.get(response.location)
+        assert b'Status: queued' in response.data
+        assert b'http-equiv="refresh"' in response.data
+        assert len(list(tmp_path.iterdir())) == 1
+
+        with app.app_context():
+            Job.query.filter_by(id=job_id).update({'state': {
+                'line': 2, 'inserted': 1, 'rejected_count': 0, 'rejected': []}})
+            db.session.commit()
+        assert run_pending(app) == 1
+
+        response = client.get(f'/jobs/{job_id}')
+        assert b'Status: succeeded' in response.data
+        assert b'http-equiv="refresh"' not in response.data
+        assert b'2 assets imported, 2 rows rejected' in response.data
+        assert b"Line 4: Invalid category &#39;Toaster&#39;" in response.data
+        assert list(tmp_path.iterdir()) == []
+        with app.app_context():
+            assert Asset.query.filter_by(comments='Test Import Asset').count() == imported + 1
+
+        response = client.get('/jobs')
+        assert f'<a href="/jobs/{job_id}">{job_id}</a>'.encode() in response.data
+        assert b'Rebuild the search index' not in response.data
+    finally:
+        app.config.update(JOB_FILES_DIR=None, JOB_IMPORT_THRESHOLD_BYTES=1024 * 1024)
+
+
+def test_search(client):
+    response = client.post('/login', data=dict(
+        username='testuser',
+        password='TestPassword123!'
+    ), follow_redirects=True)
+
+    with client.application.app_context():
+        user = User.query.filter_by(username='testuser').first()
+        customer = Customer(name='Test Search Customer')
+        db.session.add(customer)
+        db.session.flush()
+        asset = Asset(category='Tablet', comments='Zebracorn SN 4411',
+                      user_id=user.id, customer_id=customer.id)
+        db.session.add(asset)
+        db.session.commit()
+        asset_id, customer_id = asset.id, customer.id
+
+    response = client.get('/search?q=zebra')
+    assert response.status_code == 200
+    assert b'Zebracorn SN 4411' in response.data
+
+    response = client.get('/search?q=zebracorn "tablet')
+    assert b'Zebracorn SN 4411' in response.data
+
+    with client.application.app_context():
+        db.session.get(Customer, customer_id).name = 'Test Renamed Customer'
+        db.session.commit()
+
+    response = client.get('/search?q=renamed customer')
+    assert b'Zebracorn SN 4411' in response.data
+
+    with client.application.app_context():
+        db.session.delete(db.session.get(Asset, asset_id))
+        db.session.commit()
+
+    response = client.get('/search?q=zebracorn')
+    assert b'No assets match your search.' in response.data
+
+
+# The following test checks that an asset marked as retired on its edit page is moved to the archive, after which it is no longer listed, found by a normal search or editable, but is found by a search of the archive and included in the archive export
+
+
+def test_archived_assets(client):
+    response = client.post('/login', data=dict(
+        username='testuser',
+        password='TestPassword123!'
+    ), follow_redirects=True)
+
+    with client.application.app_context():
+        user = User.query.filter_by(username='testuser').first()
+        customer = Customer(name='Test Archive Customer')
+        manufacturer = Manufacturer(name='Test Archive Manufacturer')
+        db.session.add_all([customer, manufacturer])
+        db.session.flush()
+        asset = Asset(category='Tablet', comments='Quokkatron SN 7702', user_id=user.id,
+                      customer_id=customer.id, manufacturer_id=manufacturer.id)
+        db.session.add(asset)
+        db.session.commit()
+        asset_id, customer_id, manufacturer_id = asset.id, customer.id, manufacturer.id
+
+    response = client.post(f'/assets/{asset_id}/edit', data=dict(
+        category='Tablet', comments='Quokkatron SN 7702', customer=customer_id,
+        manufacturer=manufacturer_id, retired='y'), follow_redirects=True)
+    assert b'Asset updated' in response.data
+    with client.application.app_context():
+        assert db.session.get(Asset, asset_id).retired
+        assert archive_assets(select_archivable(retired=True)).count == 1
+
+    assert client.get(f'/assets/{asset_id}/edit').status_code == 404
+    assert b'Quokkatron SN 7702' not in client.get('/assets').data
+    assert b'No assets match your search.' in client.get('/search?q=quokkatron').data
+    response = client.get('/search?q=quokkatron&archived=1')
+    assert b'Quokkatron SN 7702' in response.data
+    assert b'Archived' in response.data
+
+    lines = client.get('/assets/export?format=csv&archived=1').get_data(as_text=True).splitlines()
+    assert lines[0] == 'id,category,comments,customer,manufacturer,author,timestamp'
+    assert any(line.startswith(f'{asset_id},Tablet,Quokkatron SN 7702,Test Archive Customer,') for line in lines)
+    lines = client.get('/assets/export?format=csv').get_data(as_text=True).splitlines()
+    assert not any('Quokkatron' in line for line in lines)
+
+
+# The following test checks the number of queries issued by each page for a logged in user, so that a change that reintroduces a query per row (or any other extra queries) fails here instead of only showing up as a slow page. Each page is requested once first so that the cached customer and manufacturer lists are warm. The list pages include the table version lookup used for their ETags
+
+
+@pytest.mark.parametrize('url, max_queries', [
+    ('/', 0),
+    ('/assets', 2),
+    ('/assets?per_page=5', 2),
+    ('/assets/1/edit', 1),
+    ('/customers', 2),
+    ('/edit_customer/1', 1),
+    ('/manufacturers', 2),
+    ('/edit_manufacturer/1', 1),
+    ('/search?q=laptop', 2),
+    ('/api/v1/assets', 1),
+])
+def test_route_query_counts(client, url, max_queries):
+    client.post('/login', data=dict(
+        username='testuser',
+        password='TestPassword123!'
+    ))
+    assert client.get(url).status_code == 200
+
+    with assert_max_queries(max_queries):
+        response = client.get(url)
+    assert response.status_code == 200
+
+
+# The following test checks conditional GET on the list pages: a request carrying the page's ETag or Last-Modified time gets 304 Not Modified after just the table version lookup, a change to a table the page shows makes it render in full again, and large pages are gzip compressed for clients that accept it
+
+
+def test_conditional_get(client):
+    client.post('/login', data=dict(
+        username='testuser',
+        password='TestPassword123!'
+    ))
+    client.get('/customers')
+    response = client.get('/customers')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+    assert etag.startswith('W/')
+    assert 'no-cache' in response.headers['Cache-Control']
+
+    with assert_max_queries(1):
+        response = client.get('/customers', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    response = client.get('/customers', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+    assert client.get('/customers?page=2', headers={'If-None-Match': etag}).status_code == 200
+    assert client.get('/manufacturers', headers={'If-None-Match': etag}).status_code == 200
+
+    client.post('/customers', data=dict(name='Test Cache Customer'))
+    client.get('/customers')
+    response = client.get('/customers', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+    etag = client.get('/assets').headers['ETag']
+    with client.application.app_context():
+        Customer.query.filter_by(name='Test Cache Customer').first().name = 'Test Cache Customer Renamed'
+        db.session.commit()
+    assert client.get('/assets', headers={'If-None-Match': etag}).status_code == 200
+
+    response = client.get('/assets', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert b'Asset List' in gzip.decompress(response.data)
+
+
+def test_asset_fragments(client):
+    client.post('/login', data=dict(
+        username='testuser',
+        password='TestPassword123!'
+    ))
+    with client.application.app_context():
+        customer = Customer(name='Test Fragment Customer')
+        db.session.add(customer)
+        db.session.commit()
+        asset = Asset(category='Mouse', comments='Test Fragment Asset', user_id=1, customer_id=customer.id)
+        db.session.add(asset)
+        db.session.commit()
+        asset_id, customer_id = asset.id, customer.id
+
+    cache = client.application.extensions['fragment_cache']
+    response = client.get('/assets')
+    assert b'Test Fragment Asset' in response.data
+    assert b'deleteAssetModal' not in response.data
+    assert (asset_id, 'row', 'regular') in cache.entries
+    hits = ('fragment_cache_lookups_total', (('result', 'hit'),))
+    before = metrics.collect().get(hits, 0)
+    client.get('/assets')
+    assert metrics.collect()[hits] > before
+
+    client.post(f'/assets/{asset_id}/edit', data=dict(
+        category='Mouse', comments='Test Fragment Asset Edited', customer=customer_id,
+        manufacturer=1))
+    assert (asset_id, 'row', 'regular') not in cache.entries
+    response = client.get('/assets')
+    assert b'Test Fragment Asset Edited' in response.data
+
+    with client.application.app_context():
+        Customer.query.filter_by(name='Test Fragment Customer').first().name = 'Test Fragment Customer Renamed'
+        db.session.commit()
+    assert b'Test Fragment Customer Renamed' in client.get('/assets').data
+
+    with client.application.test_request_context():
+        login_user(CachedUser(1, 'Seed User', 'admin'))
+        asset = db.session.get(Asset, asset_id)
+        fragment = asset_fragments([asset])[0]
+        assert f'deleteAssetModal{asset_id}' in fragment.row
+        assert f'/assets/{asset_id}/delete' in fragment.modal
+        assert asset_fragments([asset]) == [fragment]
+    assert (asset_id, 'modal', 'admin') in cache.entries
+
+    client.application.config['FRAGMENT_CACHE_MAX_BYTES'] = 1
+    try:
+        cache.clear()
+        assert b'Test Fragment Asset Edited' in client.get('/assets').data
+        assert not cache.entries and cache.size == 0
+    finally:
+        client.application.config['FRAGMENT_CACHE_MAX_BYTES'] = 16 * 1024 * 1024
+
+
+def test_static_fingerprints(client):
+    with client.application.test_request_context():
+        url = url_for('static', filename='nofusslogo_sml.png')
+    assert '?v=' in url
+    response = client.get(url)
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'max-age=31536000' in response.headers['Cache-Control']
+    response = client.get('/static/nofusslogo_sml.png')
+    assert 'immutable' not in response.headers.get('Cache-Control', '')
+
+
+def test_server_timing_header(client):
+    client.post('/login', data=dict(
+        username='testuser',
+        password='TestPassword123!'
+    ))
+    client.application.config['SQL_INSTRUMENTATION'] = True
+    try:
+        response = client.get('/assets')
+    finally:
+        client.application.config['SQL_INSTRUMENTATION'] = False
+
+    timings = response.headers.getlist('Server-Timing')
+    assert timings[0].startswith('db;dur=')
+    assert 'queries' in timings[0]
+    assert timings[1].startswith('total;dur=')
+
+
+# The following test checks the metrics after six failed logins from one address, five of which are counted as failures before the sixth is rate limited. The failed login in test_login_upgrades_outdated_password_hash, which runs earlier in this module, makes six failures in all
+
+
+def test_metrics(client):
+    for _ in range(6):
+        response = client.post('/login', data=dict(
+            username='nobody', password='WrongPassword123!'
+        ), environ_base={'REMOTE_ADDR': '10.0.0.9'})
+    assert response.status_code == 429
+
+    body = client.get('/metrics').get_data(as_text=True)
+    assert 'login_attempts_total{result="success"}' in body
+    assert 'login_attempts_total{result="failure"} 6.0' in body
+    assert 'rate_limited_requests_total{endpoint="main.login"}' in body
+    assert 'http_requests_total{endpoint="main.assets",method="GET",status="200"}' in body
+    assert 'http_request_duration_seconds_bucket{endpoint="main.assets",le="+Inf"}' in body
+    assert 'model_changes_total{action="create",model="asset"}' in body
+
+    client.application.config['METRICS_TOKEN'] = 'secret'
+    try:
+        assert client.get('/metrics').status_code == 401
+        response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        assert response.status_code == 200
+    finally:
+        client.application.config['METRICS_TOKEN'] = None
+
+
+def test_metrics_disabled(monkeypatch):
+    monkeypatch.setattr(Config, 'METRICS_ENABLED', False)
+    app = create_app()
+    assert 'metrics' not in app.blueprints
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+# The following test checks that metrics recorded by several worker processes are added together, using a second file in the metrics directory to stand in for another worker, and that the numbers of a worker that has exited are kept
+
+
+def test_metrics_aggregate_across_processes(client, tmp_path):
+    metrics.configure(str(tmp_path))
+    try:
+        other_worker = metrics.MmapValues(str(tmp_path / 'metrics-999999.db'))
+        other_worker.add(metrics._key('login_attempts_total', (('result', 'success'),)), 3)
+        metrics.inc('login_attempts_total', result='success')
+        metrics.observe('http_request_duration_seconds', 0.2, endpoint='main.assets')
+        samples = metrics.collect()
+        assert samples['login_attempts_total', (('result', 'success'),)] == 4
+
+        other_worker.close()
+        metrics.merge_process(str(tmp_path), 999999)
+        assert not (tmp_path / 'metrics-999999.db').exists()
+        body = metrics.render_metrics(metrics.collect())
+        assert 'login_attempts_total{result="success"} 4.0' in body
+        assert 'http_request_duration_seconds_bucket{endpoint="main.assets",le="0.1"} 0.0' in body
+        assert 'http_request_duration_seconds_bucket{endpoint="main.assets",le="0.25"} 1.0' in body
+    finally:
+        metrics.configure(client.application.config['METRICS_DIR'])
+
+
+def test_structured_logging(client, tmp_path):
+    config = {key: client.application.config[key] for key in (
+        'LOG_LEVEL', 'LOG_FILE', 'LOG_MAX_BYTES', 'LOG_ROTATE_WHEN', 'LOG_BACKUP_COUNT', 'LOG_CONSOLE')}
+    start_logging(dict(config, LOG_FILE=str(tmp_path / 'app-{pid}.log'), LOG_CONSOLE=False))
+    try:
+        response = client.get('/assets', headers={'X-Request-ID': 'test-request-1'})
+        response = client.post('/assets/999999/delete')
+    finally:
+        start_logging(config)
+
+    assert response.status_code == 404
+    [log_file] = tmp_path.glob('app-*.log')
+    records = [json.loads(line) for line in log_file.read_text().splitlines()]
+    access = [record for record in records if record['logger'] == 'app.access']
+    assert access[0]['request_id'] == 'test-request-1'
+    assert access[0]['route'] == 'main.assets'
+    assert access[0]['user'] == 'testuser'
+    assert access[0]['status'] == 200
+    assert access[0]['duration_ms'] >= 0
+    assert access[1]['status'] == 404
+    assert access[1]['request_id'] != 'test-request-1'
+
+
+# The following test checks that the dashboard counts follow assets as they are created, edited and deleted, by comparing the counts kept up to date by those changes with counts rebuilt from the asset table
+
+
+def summary_counts(app):
+    with app.app_context():
+        return {(row.dimension, row.value): row.count
+                for row in AssetSummary.query.filter(AssetSummary.count > 0)}
+
+
+def test_dashboard(client):
+    app = client.application
+    with app.app_context():
+        with db.engine.begin() as connection:
+            rebuild_summary(connection)
+    before = client.get('/api/v1/dashboard').get_json()
+
+    customer_id, manufacturer_id = before['customer'][0]['id'], before['manufacturer'][0]['id']
+    client.post('/assets', data=dict(category='Printer', comments='Test Dashboard Asset',
+                                     customer=customer_id, manufacturer=manufacturer_id))
+    with app.app_context():
+        asset = Asset.query.filter_by(comments='Test Dashboard Asset').one()
+        asset.category = 'Server'
+        db.session.add(Asset(category='Server', comments='Test Dashboard Asset', user_id=asset.user_id))
+        db.session.commit()
+        db.session.delete(asset)
+        db.session.commit()
+
+    after = client.get('/api/v1/dashboard').get_json()
+    assert after['total'] == before['total'] + 1
+    counts = {entry['name']: entry['count'] for entry in after['category']}
+    previous = {entry['name']: entry['count'] for entry in before['category']}
+    assert counts['Server'] == previous.get('Server', 0) + 1
+    assert counts.get('Printer', 0) == previous.get('Printer', 0)
+    assert {'id': None, 'name': 'None', 'count': 1} in after['customer']
+
+    incremental = summary_counts(app)
+    with app.app_context():
+        with db.engine.begin() as connection:
+            rebuild_summary(connection)
+    assert incremental == summary_counts(app)
+
+    response = client.get('/dashboard')
+    assert response.status_code == 200
+    assert f"{after['total']} assets in total".encode() in response.data
+
+
+# The following test checks the bulk edit page: ticked asset IDs are filled in from the query string, a selection can be counted and updated, and a regular user cannot delete the selection
+
+
+def test_bulk_assets(client):
+    with client.application.app_context():
+        ids = [id for id, in db.session.query(Asset.id).order_by(Asset.id).limit(2)]
+    response = client.get('/assets/bulk?' + '&'.join(f'ids={id}' for id in ids))
+    assert response.status_code == 200
+    assert ', '.join(map(str, ids)).encode() in response.data
+
+    selection = dict(ids=' '.join(map(str, ids)), by_category='', by_customer=0,
+                     by_manufacturer=0, category='', customer=0, manufacturer=0)
+    response = client.post('/assets/bulk', data=dict(selection, preview='Count Assets'))
+    assert f'{len(ids)} assets match'.encode() in response.data
+
+    with client.application.app_context():
+        categories = {id: category for id, category in
+                      db.session.query(Asset.id, Asset.category).filter(Asset.id.in_(ids))}
+    response = client.post('/assets/bulk', data=dict(selection, category='Tablet', update='Update Assets'))
+    assert f'{len(ids)} assets updated'.encode() in response.data
+    with client.application.app_context():
+        assert {category for _, category in db.session.query(
+            Asset.id, Asset.category).filter(Asset.id.in_(ids))} == {'Tablet'}
+        for id, category in categories.items():
+            db.session.get(Asset, id).category = category
+        db.session.commit()
+
+    response = client.post('/assets/bulk', data=dict(selection, update='Update Assets'))
+    assert b'Choose at least one field to change' in response.data
+    response = client.post('/assets/bulk', data=dict(selection, ids='', preview='Count Assets'))
+    assert b'Choose the assets by ID or by at least one filter' in response.data
+
+    response = client.post('/assets/bulk', data=dict(selection, delete='Delete Assets'))
+    assert b'You do not have permission to delete these assets.' in response.data
+    with client.application.app_context():
+        assert db.session.query(Asset.id).filter(Asset.id.in_(ids)).count() == len(ids)
+
+
 def test_edit_asset(client):
     response = client.post('/login', data=dict(
         username='testuser',
@@ -92,6 +684,31 @@ def test_edit_customer(client):
     assert b'Edit Customer' in response.data
 
 
+# The following test checks that the customer delete page previews the customer's assets, and that a regular user cannot delete the customer
+
+
+def test_delete_customer_preview(client):
+    with client.application.app_context():
+        customer = Customer(name='Test Delete Customer')
+        db.session.add(customer)
+        db.session.flush()
+        user_id = db.session.query(User.id).filter_by(username='testuser').scalar()
+        db.session.add(Asset(category='Mouse', comments='Test Delete Asset',
+                             customer_id=customer.id, user_id=user_id))
+        db.session.commit()
+        customer_id = customer.id
+
+    response = client.get(f'/delete_customer/{customer_id}')
+    assert response.status_code == 200
+    assert b'Test Delete Customer has 1 assets.' in response.data
+
+    response = client.post(f'/delete_customer/{customer_id}', data=dict(policy='cascade'),
+                           follow_redirects=True)
+    assert b'You do not have permission to delete this customer.' in response.data
+    with client.application.app_context():
+        assert db.session.get(Customer, customer_id) is not None
+
+
 def test_manufacturers(client):
     response = client.post('/login', data=dict(
         username='testuser',
@@ -114,5 +731,59 @@ def test_edit_manufacturer(client):
     assert b'Edit Manufacturer' in response.data
 
 
+# The following test creates a second application with profiling enabled, since profiling hooks are only registered when the application is created, and checks that create_app registers them ahead of every other request hook. The second application is created with metrics switched off, so that it leaves the metrics recorded by this process as they are
+
+
+def test_profiling(client, tmp_path, monkeypatch):
+    assert _start_profile not in client.application.before_request_funcs.get(None, [])
+    assert client.get('/admin/profiles').status_code == 404
+
+    for name, value in dict(PROFILING_ENABLED=True, PROFILE_DIR=str(tmp_path), PROFILE_KEEP=3,
+                            PROFILE_SAMPLE_INTERVAL_MS=0.1, METRICS_ENABLED=False).items():
+        monkeypatch.setattr(Config, name, value)
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    assert app.before_request_funcs[None][0] is _start_profile
+    profiler = app.test_client()
+    profiler.post('/login', data=dict(
+        username='testuser',
+        password='TestPassword123!'
+    ))
+    assert profiler.get('/assets?profile=1').status_code == 200
+    assert list_profiles(app) == []
+    assert profiler.get('/admin/profiles').status_code == 302
+
+    with app.app_context():
+        User.query.filter_by(username='testuser').update({'role': 'admin'})
+        db.session.commit()
+    invalidate_users(app)
+    try:
+        assert profiler.get('/assets?profile=1').status_code == 200
+        assert profiler.get('/customers', headers={'X-Profile': 'cprofile'}).status_code == 200
+        profiles = list_profiles(app)
+        assert [profile['mode'] for profile in profiles] == ['cprofile', 'sample']
+        assert profiles[0]['path'] == '/customers' and profiles[0]['queries'] >= 1
+        assert profiles[1]['path'] == '/assets?profile=1' and profiles[1]['status'] == 200
+
+        response = profiler.get('/admin/profiles')
+        assert b'/assets?profile=1' in response.data
+        assert b'cumulative' in profiler.get(f"/admin/profiles/{profiles[0]['name']}").data
+        assert b'samples' in profiler.get(f"/admin/profiles/{profiles[1]['name']}").data
+        response = profiler.get(f"/admin/profiles/{profiles[0]['name']}/download")
+        assert response.status_code == 200
+        assert profiler.get('/admin/profiles/missing').status_code == 404
+
+        app.config['PROFILE_SAMPLE_RATE'] = 1.0
+        profiler.get('/dashboard')
+        profiles = list_profiles(app)
+        assert profiles[0]['path'] == '/dashboard' and profiles[0]['sampled']
+        assert len(profiles) == 3
+        assert len(list(tmp_path.iterdir())) == 6
+    finally:
+        with app.app_context():
+            User.query.filter_by(username='testuser').update({'role': 'regular'})
+            db.session.commit()
+
+
 if __name__ == '__main__':
     pytest.main()
\ No newline at end of file